@@ -0,0 +1,96 @@
+""" Benchmark the effect of the repository performance tuning
+
+Creates two datalad datasets with a BIDS like layout, one with the stock git
+settings and one with the settings applied by SetupDatalad when
+`performance_tuning` is enabled. Then `git status` and `datalad save` (after
+modifying a file) are timed in both of them.
+
+Usage:
+    python benchmarks/repo_tuning.py [--subjects N] [--files N]
+"""
+
+import argparse
+from pathlib import Path
+import subprocess
+import tempfile
+import time
+
+import datalad.api as datalad
+
+from data_pipeline.setup_datalad import PERFORMANCE_CONFIG
+
+
+def _git(repo, *args):
+    subprocess.run(["git", "-C", str(repo)] + list(args), check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _create_repo(repo: Path, n_subjects: int, n_files: int, tuned: bool):
+    datalad.create(str(repo), result_renderer="disabled")
+
+    if tuned:
+        for option, value in PERFORMANCE_CONFIG.items():
+            _git(repo, "config", option, value)
+
+    for sub in range(n_subjects):
+        for modality in ["anat", "func", "fmap"]:
+            path = Path(repo, "sub-{:03d}".format(sub), modality)
+            path.mkdir(parents=True)
+            for i in range(n_files):
+                name = "sub-{:03d}_run-{}_{}.json".format(sub, i, modality)
+                Path(path, name).write_text('{"run": %s}' % i)
+
+    datalad.save(dataset=str(repo), message="Initial commit",
+                 result_renderer="disabled")
+
+    if tuned:
+        _git(repo, "commit-graph", "write", "--reachable")
+
+
+def _time(func, repetitions: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        func()
+    return (time.perf_counter() - start) / repetitions
+
+
+def _save(repo: Path, counter: list):
+    counter[0] += 1
+    Path(repo, "sub-000", "anat", "changed.json").write_text(
+        '{"counter": %s}' % counter[0]
+    )
+    datalad.save(dataset=str(repo), message="Save {}".format(counter[0]),
+                 result_renderer="disabled")
+
+
+def main():
+    """ Run the benchmark """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--subjects", type=int, default=100)
+    parser.add_argument("--files", type=int, default=100,
+                        help="files per subject and modality")
+    parser.add_argument("--repetitions", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print("{:10} {:>12} {:>12}".format("", "status [ms]", "save [ms]"))
+        for tuned in [False, True]:
+            repo = Path(tmp_dir, "tuned" if tuned else "stock")
+            _create_repo(repo, args.subjects, args.files, tuned)
+
+            # warm up caches, e.g. the untracked cache
+            _git(repo, "status")
+
+            status = _time(lambda repo=repo: _git(repo, "status"),
+                           args.repetitions)
+            counter = [0]
+            save = _time(lambda repo=repo: _save(repo, counter),
+                         args.repetitions)
+
+            print("{:10} {:12.1f} {:12.1f}".format(
+                repo.name, status * 1000, save * 1000
+            ))
+
+
+if __name__ == "__main__":
+    main()
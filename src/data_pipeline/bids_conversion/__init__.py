@@ -1,9 +1,11 @@
 """ Set up module namespace """
 
 from .configure_m import configure
+from .maintain_m import maintain
 from .run_m import run
 
 __all__ = [
     "configure",
+    "maintain",
     "run"
 ]
@@ -1,14 +1,17 @@
 """ Converts tar ball into bids compatible dataset using datalad and hirni"""
 
+import json
+import os
 from pathlib import Path
 import shutil
-from typing import Union
+from typing import Optional, Tuple, Union
 
 import datalad.api as datalad
 
 import data_pipeline.utils as utils
 from data_pipeline.config_handler import ConfigHandler
 from .bids_conversion import BidsConversion
+from . import spec_diff
 
 
 class BidsConfiguration():
@@ -31,7 +34,8 @@ class BidsConfiguration():
         """ Generade bids conversion and view the result
 
         Generate bids and display a side by side comparison of the result to
-        the original data.
+        the original data. If only some dicom series changed since the last
+        preview, only these are converted again.
 
         Args:
             source_dataset: The path to the dataset to install from which bids
@@ -42,7 +46,8 @@ class BidsConfiguration():
                 {<proc_name>: {"parameters": <parameters>}, ...}
         """
 
-        self.conversion.install_source_dataset(source_dataset)
+        self.conversion.install_source_dataset(source_dataset,
+                                               acqids=[self.acqid])
 
         # check if data was imported
         if not (self.conversion.install_dataset_path/self.acqid).exists():
@@ -56,19 +61,288 @@ class BidsConfiguration():
             self.conversion.install_dataset_name/self.acqid/"studyspec.json"
         ]
 
-        # Clean up old bids conversion
+        state = {
+            "anon_subject": self.anon_subject,
+            "active_procedures": active_procedures,
+            "inputs": self._get_input_hashes(),
+            "studyspec": utils.read_spec(self.dataset_path/spec[1]),
+        }
+
         bids_dir = self._get_bids_dir()
-        if bids_dir.exists():
-            self.log.info("Target directory %s for bids conversion already "
-                          "exists. Remove and reuse it.", bids_dir)
-            shutil.rmtree(bids_dir)
+        plan = self._plan_incremental_preview(state)
+        # an interrupted conversion must not be taken as base next time
+        self._remove_preview_state()
+
+        if plan is None:
+            # Clean up old bids conversion
+            if bids_dir.exists():
+                self.log.info("Target directory %s for bids conversion "
+                              "already exists. Remove and reuse it.", bids_dir)
+                shutil.rmtree(bids_dir)
 
-        self.log.info("Convert to BIDS based on study specification")
-        self.conversion.convert(spec)
-        self.conversion.run_procedures(active_procedures)
+            self.log.info("Convert to BIDS based on study specification")
+            self.conversion.convert(spec)
+            self.conversion.run_procedures(active_procedures)
+        else:
+            changed, outdated_files = plan
+            if changed:
+                self._convert_changed_series(changed, outdated_files, state,
+                                             spec)
+            else:
+                self.log.info("Study specification did not change, reuse "
+                              "previous preview")
+
+        self.conversion.run_precheck()
+        self._write_preview_state(state)
 
         self._print_preview(bids_dir)
 
+    def _get_input_hashes(self) -> dict:
+        """ Identify the content of everything else the preview depends on
+
+        The study specification of the whole study, the rule, the hirni
+        toolbox (heuristic and heudiconv container) and the procedures are
+        taken from the installed source dataset. Paths which do not exist are
+        reported with an empty hash.
+        """
+
+        source_path = self.conversion.install_dataset_path
+        source_config = datalad.Dataset(str(source_path)).config
+
+        paths = {
+            "studyspec": "studyspec.json",
+            "rule": source_config.get("datalad.hirni.dicom2spec.rules"),
+            # a subdataset resolves to the commit it is registered with
+            "toolbox": "code/hirni-toolbox",
+            "procedures": source_config.get(
+                "datalad.locations.dataset-procedures"
+            ),
+        }
+
+        hashes = {}
+        for name, path in paths.items():
+            if not path:
+                hashes[name] = ""
+                continue
+            hashes[name] = utils.run_cmd(
+                ["git", "-C", str(source_path), "rev-parse", "--verify",
+                 "--quiet", "HEAD:{}".format(Path(path).as_posix())],
+                self.log, raise_exception=False, suppress_output=True
+            ).strip()
+
+        return hashes
+
+    def _get_preview_state_file(self) -> Path:
+        return utils.get_git_path(self.dataset_path,
+                                  "data_pipeline/preview_state.json", self.log)
+
+    def _write_preview_state(self, state: dict):
+        """ Remember what the current preview was generated from """
+        state_file = self._get_preview_state_file()
+        state_file.parent.mkdir(parents=True, exist_ok=True)
+        state_file.write_text(json.dumps(state))
+
+    def _remove_preview_state(self):
+        state_file = self._get_preview_state_file()
+        if state_file.exists():
+            state_file.unlink()
+
+    def _read_preview_state(self) -> Optional[dict]:
+        state_file = self._get_preview_state_file()
+        if not state_file.exists():
+            return None
+
+        return json.loads(state_file.read_text())
+
+    def _plan_incremental_preview(self, state: dict
+                                  ) -> Optional[Tuple[set, list]]:
+        """ Determine which series of the previous preview have to be redone
+
+        Args:
+            state: What the new preview is generated from.
+        Returns:
+            The uids of the series to convert and the files of the previous
+            preview to remove. None if everything has to be converted again.
+        """
+
+        previous = self._read_preview_state()
+        if previous is None or not self._get_bids_dir().exists():
+            return None
+
+        if any(previous.get(key) != state[key]
+               for key in ["anon_subject", "active_procedures", "inputs"]):
+            self.log.debug("Not only the acquisition studyspec changed")
+            return None
+
+        if state["active_procedures"]:
+            # the procedures work on the whole output of the subject and
+            # cannot be rerun on top of already processed series
+            self.log.debug("Procedures are active")
+            return None
+
+        changed = spec_diff.diff_studyspec(previous["studyspec"],
+                                           state["studyspec"])
+        if changed is None:
+            self.log.debug("Not only dicom series changed")
+            return None
+
+        old_stems = self._get_stems(previous["studyspec"])
+        new_stems = self._get_stems(state["studyspec"])
+        unchanged_stems = {stem for uid, stem in new_stems.items()
+                           if uid not in changed}
+
+        outdated_files = []
+        for uid in changed:
+            old_stem = old_stems.get(uid)
+            new_stem = new_stems.get(uid)
+            if {old_stem, new_stem} & unchanged_stems:
+                # the series shares its output with another one
+                self.log.debug("Output of series %s is ambiguous", uid)
+                return None
+
+            if old_stem is None:
+                # was not converted before
+                continue
+
+            stem = Path(self.dataset_path, old_stem)
+            files = list(stem.parent.glob(stem.name + ".*"))
+            if not files:
+                # heudiconv named the output differently than expected
+                self.log.debug("No output found for series %s", uid)
+                return None
+            outdated_files.extend(files)
+
+        return changed, outdated_files
+
+    def _get_stems(self, spec: list) -> dict:
+        stems = {}
+        for uid, entry in spec_diff.get_series(spec).items():
+            stem = spec_diff.get_bids_stem(entry, self.anon_subject)
+            if stem is not None:
+                stems[uid] = stem
+
+        return stems
+
+    def _convert_changed_series(self, changed: set, outdated_files: list,
+                                state: dict, spec: list):
+        """ Convert only the changed series and keep the rest as it is
+
+        If the conversion fails the removed output is restored.
+
+        Args:
+            changed: The uids of the series to convert.
+            outdated_files: The output of the previous preview to remove.
+            state: What the new preview is generated from.
+            spec: The studyspec files to convert.
+        """
+
+        self.log.info("Reconvert %s changed series", len(changed))
+
+        # unchanged series are tagged to be ignored in a copy of the
+        # acquisition studyspec, which has to be located next to the original
+        # one since all locations are relative to it
+        preview_spec = spec[1].with_name("studyspec_preview.json")
+        # keep the installed source dataset clean for datalad run
+        self._exclude_from_source(preview_spec)
+
+        backup_dir = utils.get_git_path(
+            self.dataset_path, "data_pipeline/preview_backup", self.log
+        )
+        self._remove_backup(backup_dir)
+        try:
+            self._remove_outdated_files(outdated_files, backup_dir)
+
+            Path(self.dataset_path, preview_spec).write_text("".join(
+                json.dumps(entry) + "\n"
+                for entry in spec_diff.mark_unchanged(state["studyspec"],
+                                                      changed)
+            ))
+            self.conversion.convert([spec[0], preview_spec], force=True)
+        except Exception:
+            self.log.error("Reconverting the changed series failed, restore "
+                           "the previous preview")
+            self._restore_backup(backup_dir)
+            raise
+        finally:
+            preview_spec_path = Path(self.dataset_path, preview_spec)
+            if preview_spec_path.exists():
+                preview_spec_path.unlink()
+
+        self._remove_backup(backup_dir)
+
+    def _exclude_from_source(self, path: Path):
+        """ Let git ignore a file in the installed source dataset
+
+        Args:
+            path: The path of the file relative to the bids dataset.
+        """
+
+        exclude_file = utils.get_git_path(
+            self.conversion.install_dataset_path, "info/exclude", self.log
+        )
+        pattern = "/" + path.relative_to(
+            self.conversion.install_dataset_name
+        ).as_posix()
+
+        patterns = (exclude_file.read_text().splitlines()
+                    if exclude_file.exists() else [])
+        if pattern not in patterns:
+            exclude_file.parent.mkdir(parents=True, exist_ok=True)
+            with exclude_file.open("a") as file_handle:
+                file_handle.write(pattern + "\n")
+
+    def _remove_outdated_files(self, outdated_files: list, backup_dir: Path):
+        """ Move the outdated files and the scans.tsv files to a backup """
+
+        for path in outdated_files:
+            relative_path = path.relative_to(self.dataset_path)
+            for scans_file in path.parent.parent.glob("*_scans.tsv"):
+                scans_backup = Path(backup_dir,
+                                    scans_file.relative_to(self.dataset_path))
+                if not scans_backup.exists():
+                    scans_backup.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copy2(scans_file, scans_backup,
+                                 follow_symlinks=False)
+
+            self.log.debug("Remove %s", path)
+            # renames keep annex symlinks intact
+            os.renames(path, Path(backup_dir, relative_path))
+            self._remove_from_scans(path)
+
+    def _restore_backup(self, backup_dir: Path):
+        """ Move the files of a backup back into the bids dataset """
+
+        if not backup_dir.exists():
+            return
+
+        for path in sorted(backup_dir.rglob("*")):
+            if path.is_dir() and not path.is_symlink():
+                continue
+            target = Path(self.dataset_path, path.relative_to(backup_dir))
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, target)
+
+        self._remove_backup(backup_dir)
+
+    @staticmethod
+    def _remove_backup(backup_dir: Path):
+        if backup_dir.exists():
+            utils.remove_tree(backup_dir)
+
+    @staticmethod
+    def _remove_from_scans(path: Path):
+        """ Remove a file from the scans.tsv of its subject or session """
+
+        # <sub or ses dir>/<data type>/<file>
+        base_dir = path.parent.parent
+        entry = "{}/{}".format(path.parent.name, path.name)
+        for scans_file in base_dir.glob("*_scans.tsv"):
+            lines = scans_file.read_text().splitlines(keepends=True)
+            kept = [line for line in lines
+                    if line.split("\t", 1)[0] != entry]
+            if len(kept) != len(lines):
+                scans_file.write_text("".join(kept))
+
     def _get_bids_dir(self):
         return self.dataset_path/"sub-{}".format(self.anon_subject)
 
@@ -78,25 +352,25 @@ class BidsConfiguration():
         src_data_dir = Path(self.dataset_path,
                             self.conversion.install_dataset_name,
                             self.acqid, "dicoms")
-        src_tree = utils.run_cmd(
-            ["tree", "-d", src_data_dir], self.log
-        ).split("\n")
+        src_tree = utils.render_tree(src_data_dir, dirs_only=True)
 
         # converted data
-        bids_tree = utils.run_cmd_piped(
-           [["tree", bids_dir], ["sed", "s/-> .*//"]], self.log
-        ).split("\n")
+        bids_tree = utils.render_tree(bids_dir)
 
-        # Generate nice output
-        src_tree[0] = "source:"
-        bids_tree[0] = "result:"
+        # Generate nice output, keep the annotation of the root directories
+        src_tree[0] = src_tree[0].replace(str(src_data_dir), "source:", 1)
+        bids_tree[0] = bids_tree[0].replace(str(bids_dir), "result:", 1)
 
         self.log.info("Preview:\n %s",
                       utils.show_side_by_side(src_tree, bids_tree))
 
-    def run_bids_validator(self):
+    def run_bids_validator(self, instance=None):
         """ Wrapper around BidsConversion """
-        self.conversion.run_bids_validator()
+        self.conversion.run_bids_validator(instance)
+
+    def get_validator_instance(self):
+        """ Wrapper around BidsConversion """
+        return self.conversion.get_validator_instance()
 
     def cleanup(self):
         """ cleanup generated bids data """
@@ -117,3 +391,5 @@ class BidsConfiguration():
         if bids_dir.exists():
             self.log.info("Remove %s", bids_dir)
             shutil.rmtree(bids_dir)
+
+        self._remove_preview_state()
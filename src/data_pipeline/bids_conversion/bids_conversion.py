@@ -1,65 +1,501 @@
 """ Converts tar ball into bids compatible dataset using datalad and hirni"""
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextlib
 import copy
+import json
+import logging
 import os
 from pathlib import Path
-from typing import Union
+import time
+from typing import Iterator, Optional, Union
 
 import datalad.api as datalad
 
 import data_pipeline.utils as utils
 from data_pipeline.config_handler import ConfigHandler
+from data_pipeline.singularity import SingularityInstance
+from .bids_precheck import BidsPrecheck
+from .dicom_metadata import DicomMetadataCache
+from .import_registry import ImportRegistry, get_file_hash
+from .tarball import stage_tarball
+from . import tar_index
+
+# seconds between the progress reports when getting content
+PROGRESS_INTERVAL = 10
+
+
+def _drop_content(path: Path, log: logging.Logger,
+                  all_keys: bool = True) -> bool:
+    """ Drop the annexed content of a dataset
+
+    git-annex only drops content it can retrieve again, e.g. from the dataset
+    this one was cloned from.
+
+    Args:
+        path: The path of the dataset.
+        log: a logging logger
+        all_keys: Optional; Besides the files of the working tree also drop
+            the content which is only referenced by other branches, e.g. the
+            imported tarball on the incoming branch of a dicoms dataset,
+            which is retrieved to extract the files from.
+    Returns:
+        True if everything was dropped.
+    """
+
+    if not path.exists():
+        return True
+
+    log.info("Drop content of %s", path)
+    cmd = ["git", "-C", str(path), "annex", "drop", "--json"]
+    if all_keys:
+        cmd.insert(-1, "--all")
+    output = utils.run_cmd(cmd, log, raise_exception=False,
+                           suppress_output=True)
+
+    failed = [result for result in map(json.loads, output.splitlines())
+              if not result.get("success", False)]
+    if failed:
+        log.warning("Could not drop %s keys of %s", len(failed), path)
+        return False
+
+    return True
 
 
 class SourceHandler():
     """ A basic source dataset """
     # pylint: disable=too-few-public-methods
 
-    def __init__(self, dataset_path: Union[str, Path]):
+    def __init__(self, dataset_path: Union[str, Path],
+                 staging_dir: Union[str, Path] = None,
+                 selective_import: bool = False,
+                 cache_metadata: bool = False):
+        """
+        Args:
+            dataset_path: The path of the source dataset
+            staging_dir: Optional; Where to write converted or filtered
+                tarballs to before importing them. Defaults to the system
+                temporary directory.
+            selective_import: Optional; Only import the series the rule
+                of the dataset does not ignore.
+            cache_metadata: Optional; Cache the DICOM metadata of imported
+                acquisitions, which is only read when evaluating rules during
+                the configuration.
+        """
         self.log = utils.get_logger(__class__)  # type: ignore
 
         self.dataset_path = Path(dataset_path)
+        self.staging_dir = staging_dir
+        self.selective_import = selective_import
+        self.cache_metadata = cache_metadata
         self.dataset = utils.get_dataset(self.dataset_path, self.log)
 
-    def import_data(self, tarball: str, anon_subject: str, acqid: str):
+    def import_data(self, tarball: str, anon_subject: str,
+                    acqid: str) -> bool:
         """ Import tarball as subdataset
 
         Args:
             tarball: path to tarball to import
             anon_subject: The anonymous subject id
             acqid: The acquisition identifier for this data
+        Returns:
+            True if the acquisition was (re)imported, False if it was
+            already imported.
         """
 
         path = Path(tarball).expanduser().resolve()
 
-        # TODO proper detection if already imported
-        if Path(self.dataset_path, acqid, "dicoms").exists():
-            self.log.info("Acquisition dataset already imported.")
-            return
+        if not self._prepare_import(acqid, path):
+            return False
 
-        # check if tarball exists
-        if not path.exists():
-            self.log.error("Tarball %s does not exists", path)
-            raise ValueError("Tarball {} does not exists".format(path))
+        if self._reuse_duplicate(acqid, path, anon_subject):
+            return True
 
         self.log.info("Import %s: anon-subject=%s, aquisition=%s",
                       path, anon_subject, acqid)
 
+        registry = ImportRegistry(self.dataset_path)
+        registry.start(acqid, path)
+        sha256 = registry.entries[acqid]["sha256"]
+
         # creates a subdataset <acqid> under sourcedata/dicoms
         # without the ChangeWorkingDir the command does not operate inside of
         # dataset_path and thus does not find the rules file
-        with utils.ChangeWorkingDir(self.dataset_path):
+        with self._prepare_tarball(path, sha256) as staged, \
+                utils.ChangeWorkingDir(self.dataset_path):
             # datalad hirni-import-dcm --anon-subject "$ANON" \
             #   ../../original/sourcedata.tar.gz sourcedata
             datalad.hirni_import_dcm(
                 dataset=self.dataset,
                 anon_subject=anon_subject,
                 # subject=
-                path=path,
+                path=staged,
                 acqid=acqid,
                 # properties=
             )
 
+        registry.complete(acqid)
+
+        # the metadata was just aggregated, thus this is cheap now
+        self._populate_metadata_cache([acqid])
+
+        return True
+
+    @contextlib.contextmanager
+    def _prepare_tarball(self, tarball: Path, sha256: str) -> Iterator[Path]:
+        """ Convert the tarball if needed and select the series to import
+
+        Yields:
+            The path of the tarball to hand to hirni.
+        """
+
+        with stage_tarball(tarball, self.log, self.staging_dir) as staged:
+            rule_file = None
+            if self.selective_import:
+                rule_file = self._get_rule_file()
+
+            if rule_file is None:
+                yield staged
+                return
+
+            with tar_index.select_series(staged, sha256, rule_file,
+                                         self.dataset_path, self.log,
+                                         self.staging_dir) as selected:
+                yield selected
+
+    def _get_rule_file(self) -> Optional[Path]:
+        rule_file = self.dataset.config.get("datalad.hirni.dicom2spec.rules")
+        if not rule_file:
+            self.log.warning("No rule is registered, import all series.")
+            return None
+
+        return Path(self.dataset_path, rule_file)
+
+    def needs_import(self, acqid: str, tarball: str) -> bool:
+        """ Check if import_data would import a tarball, without changes
+
+        Args:
+            tarball: path to tarball to import
+            acqid: The acquisition identifier for this data
+        """
+
+        path = Path(tarball).expanduser().resolve()
+        if not path.exists():
+            return False
+
+        status = ImportRegistry(self.dataset_path).get_status(acqid, path)
+        return status != ImportRegistry.IMPORTED
+
+    def _prepare_import(self, acqid: str, tarball: Path) -> bool:
+        """ Check if a tarball has to be imported
+
+        Outdated or incomplete imports of the acquisition are removed.
+
+        Returns:
+            True if the tarball has to be imported.
+        Raises:
+            ValueError: If the tarball does not exist.
+        """
+
+        acq_path = Path(self.dataset_path, acqid)
+
+        if not tarball.exists():
+            if Path(acq_path, "dicoms").exists():
+                # the tarball might have been archived after the import
+                self.log.info("Acquisition dataset already imported.")
+                return False
+
+            self.log.error("Tarball %s does not exists", tarball)
+            raise ValueError("Tarball {} does not exists".format(tarball))
+
+        registry = ImportRegistry(self.dataset_path)
+        status = registry.get_status(acqid, tarball)
+        if status == ImportRegistry.IMPORTED:
+            self.log.info("Acquisition dataset already imported.")
+            return False
+
+        if status == ImportRegistry.CHANGED:
+            # recorded before the removal to not get lost on interruption
+            registry.request_reconversion(acqid)
+
+        if status in [ImportRegistry.CHANGED, ImportRegistry.INCOMPLETE]:
+            self.log.info("Import of acquisition %s is %s, reimport it.",
+                          acqid, status)
+            self._remove_acquisition(acqid)
+
+        return True
+
+    def _remove_acquisition(self, acqid: str):
+        acq_path = Path(self.dataset_path, acqid)
+        if not acq_path.exists():
+            return
+
+        self.log.info("Remove %s", acq_path)
+        with utils.ChangeWorkingDir(self.dataset_path):
+            # the content is replaced by the new import, thus there is no
+            # need to check for other copies
+            datalad.remove(dataset=self.dataset_path, path=acqid,
+                           recursive=True, check=False,
+                           if_dirty="ignore", on_failure="ignore")
+
+        # not registered parts of an interrupted import
+        if acq_path.exists():
+            utils.remove_tree(acq_path)
+
+    def _reuse_duplicate(self, acqid: str, tarball: Path,
+                         anon_subject: str) -> bool:
+        """ Reuse the DICOM dataset of an identical tarball
+
+        Instead of importing the tarball again, the dicoms dataset of the
+        acquisition it was already imported as is cloned. Its tarball is
+        hardlinked from the original, thus the copy does not depend on it.
+        Only the studyspec is created anew. Afterwards the extracted files are
+        dropped again like hirni does after an import.
+
+        Returns:
+            True if the acquisition was created from a duplicate.
+        Raises:
+            Exception: If creating the acquisition failed, it is removed
+                again.
+        """
+
+        registry = ImportRegistry(self.dataset_path)
+        original = registry.find_duplicate(acqid, tarball)
+        if original is None:
+            return False
+
+        self.log.info("%s was already imported as %s, reuse it for %s",
+                      tarball, original, acqid)
+        registry.start(acqid, tarball, registry.entries[original]["sha256"])
+
+        dicom_path = Path(self.dataset_path, acqid, "dicoms")
+        try:
+            # cloned without registering it, which would record the location
+            # of the original as its url
+            datalad.clone(
+                source=str(Path(self.dataset_path, original, "dicoms")),
+                path=str(dicom_path),
+                result_renderer="disabled"
+            )
+            # the tarball is hardlinked from the original on the same file
+            # system, the metadata is extracted from the files
+            utils.run_cmd(["git", "-c", "annex.hardlink=true", "annex",
+                           "get", "--all"], self.log, cwd=dicom_path)
+            # registered under its location like hirni does
+            datalad.save(
+                path=str(dicom_path),
+                dataset=str(self.dataset_path),
+                message="[HIRNI] Add acquisition {} as a copy of {}".format(
+                    acqid, original
+                )
+            )
+
+            datalad.meta_aggregate(path=str(dicom_path) + os.sep,
+                                   dataset=str(self.dataset_path),
+                                   into="top")
+            self._dicom2spec(acqid, anon_subject)
+        except Exception:
+            self.log.error("Reusing %s for %s failed", original, acqid)
+            self._remove_acquisition(acqid)
+            raise
+
+        registry.complete(acqid)
+
+        # only needed for the metadata, they can be extracted from the
+        # tarball again
+        _drop_content(dicom_path, self.log, all_keys=False)
+
+        # shares the cache entry with the original since the content is equal
+        self._populate_metadata_cache([acqid])
+
+        return True
+
+    def _dicom2spec(self, acqid: str, anon_subject: str):
+        """ Create the studyspec like hirni-import-dcm does after the import """
+
+        error = None
+        # without the ChangeWorkingDir the rules file is not found
+        with utils.ChangeWorkingDir(self.dataset_path):
+            try:
+                datalad.hirni_dicom2spec(
+                    path=str(Path(self.dataset_path, acqid, "dicoms")),
+                    spec=str(Path(self.dataset_path, acqid,
+                                  "studyspec.json")),
+                    anon_subject=anon_subject,
+                    acquisition=acqid,
+                    dataset=str(self.dataset_path)
+                )
+            except Exception as excp:  # pylint: disable=broad-except
+                error = excp
+
+        # ChangeWorkingDir swallows exceptions, thus raise outside of it
+        if error is not None:
+            raise error
+
+    def import_data_bulk(self, acquisitions: list, jobs: int = 1) -> list:
+        """ Import many tarballs concurrently
+
+        Every acquisition is imported into its own scratch clone of the
+        dataset so that the imports do not conflict with each other. The
+        resulting acquisition directories are moved into the dataset and
+        registered with a single save afterwards.
+
+        Args:
+            acquisitions: The acquisitions to import, each a dict with the
+                keys tarball, anon_subject and acqid.
+            jobs: Optional; How many imports to run in parallel.
+        Returns:
+            The acquisition identifiers of the (re)imported acquisitions.
+        """
+
+        imported_acqids = []
+        to_import = []
+        for acq in acquisitions:
+            tarball = Path(acq["tarball"]).expanduser().resolve()
+            try:
+                if not self._prepare_import(acq["acqid"], tarball):
+                    continue
+            except ValueError:
+                # error was already logged, import the others anyway
+                continue
+
+            # identical tarballs within this bulk are imported separately,
+            # their DICOM files still share storage after a full maintenance
+            try:
+                if self._reuse_duplicate(acq["acqid"], tarball,
+                                         acq["anon_subject"]):
+                    imported_acqids.append(acq["acqid"])
+                    continue
+            except Exception:  # pylint: disable=broad-except
+                # error was already logged, import the others anyway
+                continue
+
+            to_import.append(dict(acq, tarball=tarball))
+
+        if not to_import:
+            return imported_acqids
+
+        # has to be on the same file system to be able to move the results
+        scratch_dir = Path(self.dataset_path.parent,
+                           ".{}_import".format(self.dataset_path.name))
+        try:
+            imported = []
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = {
+                    executor.submit(self._import_into_clone, acq, scratch_dir):
+                    acq
+                    for acq in to_import
+                }
+                for future in as_completed(futures):
+                    acq = futures[future]
+                    try:
+                        imported.append((acq, future.result()))
+                    except Exception:  # pylint: disable=broad-except
+                        self.log.error("Import of %s failed", acq["acqid"],
+                                       exc_info=True)
+
+            if imported:
+                registry = ImportRegistry(self.dataset_path)
+                for acq, sha256 in imported:
+                    registry.start(acq["acqid"], acq["tarball"], sha256)
+
+                acqids = sorted(acq["acqid"] for acq, _ in imported)
+                self._register_acquisitions(acqids, scratch_dir)
+
+                for acqid in acqids:
+                    registry.complete(acqid)
+                imported_acqids.extend(acqids)
+        finally:
+            utils.remove_tree(scratch_dir)
+
+        return imported_acqids
+
+    def _import_into_clone(self, acq: dict, scratch_dir: Path) -> str:
+        """ Import a tarball into a scratch clone of the dataset
+
+        Afterwards the acquisition directory in the clone is ready to be moved
+        into the dataset.
+
+        Returns:
+            The checksum of the tarball.
+        """
+
+        acqid = acq["acqid"]
+        clone_path = Path(scratch_dir, acqid)
+        if clone_path.exists():
+            # left over from an interrupted import
+            utils.remove_tree(clone_path)
+
+        self.log.info("Import %s: anon-subject=%s, aquisition=%s",
+                      acq["tarball"], acq["anon_subject"], acqid)
+
+        # the command line interface is used since the datalad api calls are
+        # not thread-safe and would change the working directory of the
+        # whole process
+        utils.run_cmd(
+            ["datalad", "clone", str(self.dataset_path), str(clone_path)],
+            self.log, error_message="Cloning for {} failed".format(acqid)
+        )
+        # computed here to do it in parallel as well
+        sha256 = get_file_hash(acq["tarball"])
+
+        # run inside of the clone, otherwise the rules file is not found
+        with self._prepare_tarball(acq["tarball"], sha256) as staged:
+            utils.run_cmd(
+                ["datalad", "hirni-import-dcm",
+                 "--anon-subject", acq["anon_subject"],
+                 str(staged), acqid],
+                self.log, error_message="Import of {} failed".format(acqid),
+                cwd=clone_path
+            )
+
+        return sha256
+
+    def _register_acquisitions(self, acqids: list, scratch_dir: Path):
+        """ Move imported acquisitions into the dataset and save them
+
+        If saving or aggregating the metadata fails, the acquisitions are
+        removed from the dataset again.
+        """
+
+        moved = []
+        try:
+            for acqid in acqids:
+                os.rename(Path(scratch_dir, acqid, acqid),
+                          Path(self.dataset_path, acqid))
+                moved.append(acqid)
+
+            datalad.save(
+                path=[str(Path(self.dataset_path, acqid)) for acqid in acqids],
+                dataset=str(self.dataset_path),
+                message="[HIRNI] Add aquisitions {}".format(", ".join(acqids))
+            )
+
+            # the metadata was aggregated into the clones, hirni-dicom2spec
+            # expects it in the dataset itself
+            datalad.meta_aggregate(
+                path=[str(Path(self.dataset_path, acqid, "dicoms")) + os.sep
+                      for acqid in acqids],
+                dataset=str(self.dataset_path),
+                into="top"
+            )
+        except Exception:
+            self.log.error("Registering %s failed, remove them again",
+                           ", ".join(acqids))
+            for acqid in moved:
+                self._remove_acquisition(acqid)
+            raise
+
+        self._populate_metadata_cache(acqids)
+
+    def _populate_metadata_cache(self, acqids: list):
+        if not self.cache_metadata:
+            return
+
+        cache = DicomMetadataCache(self.dataset_path)
+        for acqid in acqids:
+            cache.populate(acqid)
+
     def get_heudiconv_container(self):
         """ load the heudiconv container into the source dataset """
 
@@ -91,19 +527,41 @@ class BidsConversion():
         self.install_dataset_path = Path(self.dataset_path,
                                          self.install_dataset_name)
 
-    def install_source_dataset(self, source_dataset: str):
-        """ Install the source dataset to be able to process it """
+        # default: the content is copied from the source dataset
+        # ephemeral: the annex of the source dataset is shared
+        self.install_mode = self.config.get("source_install_mode", "default")
+
+    def install_source_dataset(self, source_dataset: str,
+                               acqids: list = None, update: bool = True):
+        """ Install the source dataset to be able to process it
+
+        Args:
+            source_dataset: The path of the source dataset to install from
+            acqids: Optional; The acquisitions to process. Their subdatasets
+                are installed or updated individually instead of updating
+                all acquisition subdatasets recursively.
+            update: Optional; If False an already installed source dataset is
+                not updated, e.g. because it is known to be up to date.
+        """
 
         if self.install_dataset_path.exists():
             is_not_empty = any(self.install_dataset_path.iterdir())
             if is_not_empty:
-                self.log.info("Source dataset already installed, update it.")
-                datalad.update(
-                    self.install_dataset_name,
-                    merge=True,
-                    dataset=self.dataset_path,
-                    recursive=True
-                )
+                self._check_install_mode()
+                if update:
+                    self.log.info("Source dataset already installed, "
+                                  "update it.")
+                    # updating all acquisition subdatasets recursively for
+                    # every subject does not scale with the number of
+                    # subjects, only the ones needed are updated
+                    datalad.update(
+                        self.install_dataset_name,
+                        merge=True,
+                        dataset=self.dataset_path,
+                        recursive=False
+                    )
+                for acqid in acqids or []:
+                    self._install_acquisition(acqid, update)
                 return
 
         self.log.info("Install source dataset.")
@@ -116,6 +574,10 @@ class BidsConversion():
                    "--source", source_dataset,
                    self.install_dataset_name,
                    "--recursive"]
+            if self.install_mode == "ephemeral":
+                # the mode is recorded in the clone and thus also used for
+                # subdatasets installed later on
+                cmd += ["--reckless", "ephemeral"]
             utils.run_cmd(cmd, self.log)
 
         # without the ChangeWorkingDir the command does not operate inside of
@@ -130,11 +592,112 @@ class BidsConversion():
 #                recursive=True
 #            )
 
-    def convert(self, spec: list):
+    def _install_acquisition(self, acqid: str, update: bool = True):
+        """ Install or update the subdataset of an acquisition """
+
+        dicom_path = Path(self.install_dataset_path, acqid, "dicoms")
+        if not dicom_path.exists():
+            # not imported, reported by the caller
+            return
+
+        if not any(dicom_path.iterdir()):
+            self.log.info("Install acquisition %s", acqid)
+            datalad.get(
+                path=str(dicom_path),
+                dataset=str(self.install_dataset_path),
+                get_data=False
+            )
+        elif update:
+            datalad.update(
+                str(dicom_path),
+                merge=True,
+                dataset=str(self.install_dataset_path),
+                recursive=False
+            )
+
+    def prefetch(self, acqid: str, jobs: Union[int, str] = 1):
+        """ Get the DICOM content of an acquisition with parallel jobs
+
+        Otherwise hirni-spec2bids gets it file by file.
+
+        Args:
+            acqid: The acquisition identifier
+            jobs: Optional; The number of parallel git-annex jobs or "auto".
+        """
+
+        dicom_path = Path(self.install_dataset_path, acqid, "dicoms")
+        if not dicom_path.exists():
+            return
+
+        self.log.info("Get content of %s (%s jobs)", acqid, jobs)
+        start = time.monotonic()
+        last_report = start
+        n_files = 0
+        n_failed = 0
+        size = 0
+        for result in datalad.get(
+                path=str(dicom_path),
+                dataset=str(self.install_dataset_path),
+                jobs=jobs,
+                on_failure="ignore",
+                return_type="generator",
+                result_renderer="disabled"):
+            if result.get("type") != "file":
+                continue
+
+            if result.get("status") not in ["ok", "notneeded"]:
+                n_failed += 1
+                continue
+
+            n_files += 1
+            if result.get("status") == "ok":
+                match = utils.ANNEX_KEY_SIZE.search(
+                    result.get("annexkey") or ""
+                )
+                if match:
+                    size += int(match.group(1))
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                self._log_progress(acqid, n_files, size, now - start)
+
+        self._log_progress(acqid, n_files, size, time.monotonic() - start)
+        if n_failed:
+            self.log.warning("Could not get %s files of %s", n_failed, acqid)
+
+    def _log_progress(self, acqid: str, n_files: int, size: int,
+                      duration: float):
+        self.log.info("%s: %s files, retrieved %s in %.1fs (%s/s)", acqid,
+                      n_files, utils.format_size(size), duration,
+                      utils.format_size(int(size / max(duration, 1e-6))))
+
+    def _check_install_mode(self):
+        """ Warn if the source dataset was installed in another mode
+
+        The mode is only applied when the source dataset is installed.
+        """
+
+        reckless = utils.run_cmd(
+            ["git", "-C", str(self.install_dataset_path), "config",
+             "--get", "datalad.clone.reckless"],
+            self.log, raise_exception=False, suppress_output=True
+        ).strip()
+        installed_mode = "ephemeral" if reckless == "ephemeral" else "default"
+
+        if installed_mode != self.install_mode:
+            self.log.warning("The source dataset is installed in %s mode "
+                             "instead of the configured %s mode. Uninstall "
+                             "it to apply the configured mode.",
+                             installed_mode, self.install_mode)
+
+    def convert(self, spec: list, force: bool = False):
         """ Converts to bids using datalad hirni
 
         Args:
             spec: A list of hirni studyspec files to use
+            force: Optional; Convert even if data for the anon_subject exists
+                already.
         """
         heudiconv_container = Path(self.install_dataset_path, "code",
                                    "hirni-toolbox", "converters", "heudiconv",
@@ -144,18 +707,13 @@ class BidsConversion():
             # dataset but get not yet executed to get it from there
             self.log.info("Get heudiconv container")
 
-        if self._check_already_converted():
+        if not force and self.is_converted():
             self.log.warning("Conversion for anon_subject %s already done. "
                              "Skip.", self.anon_subject)
             return
 
         self.log.info("Convert anon_subject=%s", self.anon_subject)
-        # since logging can not be controlled when using the datalad api, the
-        # console output will be flooded -> circument it by using the command
-        # line interface
-        with utils.ChangeWorkingDir(self.dataset_path):
-            cmd = ["datalad", "hirni-spec2bids", "--anonymize"] + spec
-            utils.run_cmd(cmd, self.log)
+        self._spec2bids(spec)
 
         # datalad hirni-spec2bids --anonymize sourcedata/studyspec.json
 #        datalad.hirni_spec2bids(
@@ -165,23 +723,153 @@ class BidsConversion():
 #            # only_type=
 #        )
 
-    def _check_already_converted(self):
-        """ Check if data for this anon_subject was already converted """
+    def convert_batch(self, subjects: list) -> list:
+        """ Converts the acquisitions of several subjects in one call
+
+        The startup of datalad, hirni and the container as well as the commit
+        are only paid once for all subjects. If the batch fails, the
+        uncommitted outputs of its subjects are discarded and the subjects
+        still missing are converted one by one.
+
+        Args:
+            subjects: The subjects to convert, each a dict with the keys
+                anon_subject and acqid.
+        Returns:
+            The anon_subjects for which converted data exists.
+        """
+
+        to_convert = [subject for subject in subjects
+                      if not self.is_converted(subject["anon_subject"])]
+        if len(to_convert) > 1:
+            self.log.info("Convert anon_subjects %s", ", ".join(
+                subject["anon_subject"] for subject in to_convert
+            ))
+            spec = [self.install_dataset_name/"studyspec.json"] + [
+                self.install_dataset_name/subject["acqid"]/"studyspec.json"
+                for subject in to_convert
+            ]
+            try:
+                self._spec2bids(spec)
+            except Exception:  # pylint: disable=broad-except
+                self.log.warning("Batch conversion failed", exc_info=True)
+                for subject in to_convert:
+                    self._discard_uncommitted(subject["anon_subject"])
+
+            to_convert = [subject for subject in to_convert
+                          if not self.is_converted(subject["anon_subject"])]
+            if to_convert:
+                self.log.warning("Batch conversion missed anon_subjects %s, "
+                                 "convert them one by one", ", ".join(
+                                     subject["anon_subject"]
+                                     for subject in to_convert
+                                 ))
+
+        for subject in to_convert:
+            self.log.info("Convert anon_subject=%s", subject["anon_subject"])
+            try:
+                self._spec2bids([
+                    self.install_dataset_name/"studyspec.json",
+                    self.install_dataset_name/subject["acqid"]/"studyspec.json"
+                ])
+            except Exception:  # pylint: disable=broad-except
+                self.log.error("Conversion of anon_subject %s failed",
+                               subject["anon_subject"], exc_info=True)
+                self._discard_uncommitted(subject["anon_subject"])
+
+        return [subject["anon_subject"] for subject in subjects
+                if self.is_converted(subject["anon_subject"])]
+
+    def _spec2bids(self, spec: list):
+        # since logging can not be controlled when using the datalad api, the
+        # console output will be flooded -> circument it by using the command
+        # line interface
+        cmd = ["datalad", "hirni-spec2bids", "--anonymize"] + spec
+        utils.run_cmd(cmd, self.log, cwd=self.dataset_path)
+
+    def _discard_uncommitted(self, anon_subject: str):
+        """ Reset the converted data of an anon_subject to the last commit
+
+        A failed conversion can leave partial output behind which would
+        otherwise be taken as converted.
+        """
+
+        path = "sub-{}".format(anon_subject)
+        git = ["git", "-C", str(self.dataset_path)]
+
+        self.log.info("Discard uncommitted changes of %s", path)
+        utils.run_cmd(git + ["reset", "-q", "--", path], self.log)
+        if utils.run_cmd(git + ["ls-tree", "--name-only", "HEAD", path],
+                         self.log).strip():
+            utils.run_cmd(git + ["checkout", "HEAD", "--", path], self.log)
+        utils.run_cmd(git + ["clean", "-fdq", "--", path], self.log)
+
+    def is_converted(self, anon_subject: str = None) -> bool:
+        """ Check if data for an anon_subject was already converted
+
+        Args:
+            anon_subject: Optional; The anon_subject to check, defaults to
+                the one of this conversion.
+        """
+        if anon_subject is None:
+            anon_subject = self.anon_subject
+
         converted_path = Path(self.dataset_path,
-                              "sub-{}".format(self.anon_subject))
+                              "sub-{}".format(anon_subject))
         if converted_path.exists():
             return True
 
         return False
 
-    def run_procedures(self, procedures: dict):
+    def remove_conversion(self):
+        """ Remove the converted data of the anon_subject
+
+        E.g. because it is based on an outdated import and has to be
+        converted again.
+        """
+
+        converted_path = Path(self.dataset_path,
+                              "sub-{}".format(self.anon_subject))
+        if not converted_path.exists():
+            return
+
+        self.log.info("Remove outdated conversion %s", converted_path)
+        with utils.ChangeWorkingDir(self.dataset_path):
+            datalad.remove(dataset=self.dataset_path,
+                           path=converted_path.name, check=False,
+                           if_dirty="ignore", on_failure="ignore")
+
+        # e.g. not saved parts of an interrupted conversion
+        if converted_path.exists():
+            utils.remove_tree(converted_path)
+
+    def drop_source_content(self, acqid: str) -> bool:
+        """ Drop the DICOM content of an acquisition in installed sourcedata
+
+        Unless the annex is shared with the source dataset, this includes the
+        tarball it was extracted from. Everything stays retrievable from the
+        source dataset.
+
+        Returns:
+            True if everything was dropped.
+        """
+
+        # in ephemeral mode the annex is shared with the source dataset, thus
+        # only the extracted files are dropped, they can be extracted from
+        # the tarball kept there again
+        return _drop_content(Path(self.install_dataset_path, acqid, "dicoms"),
+                             self.log,
+                             all_keys=self.install_mode != "ephemeral")
+
+    def run_procedures(self, procedures: dict, force: bool = False):
         """ Run a list of procedures procedures
 
         Args:
             active_procedures: The procedures to run in the form
             {<proc name>: "parameters": <parameters as string>}
+            force: Optional; Run even if data for the anon_subject exists
+                already.
         """
-        if self._check_already_converted():
+        if not force and self.is_converted():
             return
 
         # run procedures
@@ -192,15 +880,37 @@ class BidsConversion():
             self.log.info("Execute procedure %s", proc_spec)
             datalad.run_procedure(proc_spec, dataset=self.dataset)
 
-    def run_bids_validator(self):
-        """ Checks the dataset for bids conformity"""
+    def run_precheck(self) -> list:
+        """ Check the converted anon_subject for the most common BIDS errors
 
-        name = self.config["validator_container_name"]
-        image_url = self.config["validator_image_url"]
+        Returns:
+            The issues found.
+        """
+        precheck = BidsPrecheck(self.dataset_path)
+        issues = precheck.run(anon_subject=self.anon_subject)
+        precheck.log_issues(issues)
+
+        return issues
+
+    def _get_validator_container_path(self) -> Path:
         container_dir = Path(self.config["container_dir"])
         if not container_dir.is_absolute():
             container_dir = Path(self.dataset_path, container_dir)
 
+        return Path(container_dir, self.config["validator_container_name"])
+
+    def _get_validator_container(self) -> Path:
+        """ Get the validator container and prepare the validator config
+
+        Returns:
+            The path of the validator container image.
+        """
+
+        container_path = self._get_validator_container_path()
+        container_dir = container_path.parent
+        name = container_path.name
+        image_url = self.config["validator_image_url"]
+
         container_dir.mkdir(parents=True, exist_ok=True)
 
         # if no .bids-validator-config.json file exists create it
@@ -211,7 +921,6 @@ class BidsConversion():
             this_file_path=Path(__file__)
         )
 
-        container_path = Path(container_dir, name)
         if not container_path.exists():
             # modify environment only for executed command and not whole
             # process
@@ -221,16 +930,52 @@ class BidsConversion():
             cmd = ["singularity", "pull", "--name", name, image_url]
             utils.run_cmd(cmd, self.log, env=environment)
 
+        return container_path
+
+    def _get_validator_options(self) -> list:
+        return [
+            "--no-home",
+            "--containall",
+            "--bind", "{}:/data".format(self.dataset_path),
+        ]
+
+    def get_validator_instance(self) -> SingularityInstance:
+        """ Creates a long-lived validator container instance
+
+        The instance is only started on first usage and has to be stopped by
+        the caller.
+
+        Returns:
+            The (not yet started) container instance.
+        """
+        return SingularityInstance(
+            image=self._get_validator_container_path(),
+            name="data-pipeline-bids-validator",
+            options=self._get_validator_options()
+        )
+
+    def run_bids_validator(self, instance: SingularityInstance = None):
+        """ Checks the dataset for bids conformity
+
+        Args:
+            instance: Optional; A container instance to run the validator in
+                instead of starting a new container.
+        """
+
+        container_path = self._get_validator_container()
+
+        if instance is not None:
+            res = instance.run(["/data"], raise_exception=False,
+                               suppress_output=True)
+            self.log.info(res)
+            return
+
         # singularity run --no-home --containall --bind $DIR_TO_CHECK:/data
         #     $CONTAINER_PATH /data
         res = utils.run_cmd(
-            [
-                "singularity", "run",
-                "--no-home",
-                "--containall",
-                "--bind", "{}:/data".format(self.dataset_path),
-                str(container_path), "/data"
-            ],
+            ["singularity", "run"]
+            + self._get_validator_options()
+            + [str(container_path), "/data"],
             self.log,
             raise_exception=False,
             suppress_output=True
@@ -0,0 +1,220 @@
+""" Fast native check for the most common BIDS errors
+
+This does not replace the bids validator but is cheap enough to be run after
+every conversion step so that errors surface immediately.
+"""
+
+import os
+from pathlib import Path
+import re
+from typing import List, NamedTuple, Union
+
+import data_pipeline.utils as utils
+
+
+class Issue(NamedTuple):
+    """ A problem found in the BIDS dataset """
+    code: str
+    path: Path
+    message: str
+
+
+# sub-<label>[_<key>-<label>...]_<suffix>.<extension>
+FILENAME_REGEX = re.compile(
+    r"sub-(?P<sub>[a-zA-Z0-9]+)"
+    r"(?P<entities>(_[a-zA-Z0-9]+-[a-zA-Z0-9]+)*)"
+    r"_(?P<suffix>[a-zA-Z0-9]+)"
+    r"(?P<extension>(\.[a-zA-Z0-9]+)+)"
+)
+
+DATA_EXTENSIONS = (".nii", ".nii.gz")
+
+# directories on top level of the dataset which are not part of the raw data
+IGNORED_DIRS = ("code", "derivatives", "sourcedata", "stimuli")
+
+
+def _split_name(name: str):
+    """ Split a BIDS file name into entities, suffix and extension
+
+    Returns:
+        A tuple of (entities as dict, suffix, extension) or None if the name
+        is not BIDS conform.
+    """
+    match = FILENAME_REGEX.fullmatch(name)
+    if not match:
+        return None
+
+    entities = {"sub": match.group("sub")}
+    for entity in match.group("entities").split("_")[1:]:
+        key, value = entity.split("-")
+        entities[key] = value
+
+    return entities, match.group("suffix"), match.group("extension")
+
+
+def _split_sidecar_name(name: str):
+    """ Like _split_name but also allows sidecars without subject entity
+
+    These are the inheritable sidecars at top level, e.g. task-rest_bold.json
+    """
+    if name.startswith("sub-"):
+        return _split_name(name)
+
+    parts = name.split(".", 1)
+    if len(parts) != 2:
+        return None
+
+    *entities, suffix = parts[0].split("_")
+    try:
+        entities = dict(entity.split("-") for entity in entities)
+    except ValueError:
+        return None
+
+    return entities, suffix, "." + parts[1]
+
+
+class BidsPrecheck():
+    """ Checks a BIDS dataset for the most frequent problems """
+
+    def __init__(self, dataset_path: Union[str, Path]):
+        self.log = utils.get_logger(__class__)  # type: ignore
+        self.dataset_path = Path(dataset_path)
+
+    def run(self, anon_subject: str = None) -> List[Issue]:
+        """ Walk the dataset once and collect all issues
+
+        Args:
+            anon_subject: Optional; Only check this subject (and the top level
+                of the dataset) instead of all subjects.
+        Returns:
+            The issues found.
+        """
+
+        issues = []
+
+        if not Path(self.dataset_path, "dataset_description.json").exists():
+            issues.append(Issue("MISSING_DATASET_DESCRIPTION",
+                                self.dataset_path,
+                                "dataset_description.json is missing"))
+
+        # sidecars on top level can be inherited by all subjects
+        top_level_sidecars = []
+
+        with os.scandir(self.dataset_path) as entries:
+            subject_dirs = []
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name in IGNORED_DIRS:
+                        continue
+                    if anon_subject is None:
+                        if entry.name.startswith("sub-"):
+                            subject_dirs.append(entry.path)
+                    elif entry.name == "sub-{}".format(anon_subject):
+                        subject_dirs.append(entry.path)
+                    continue
+
+                issues += self._check_empty(entry)
+                if entry.name.endswith(".json"):
+                    top_level_sidecars.append(entry.name)
+
+        for subject_dir in subject_dirs:
+            issues += self._check_dir(subject_dir, top_level_sidecars)
+
+        return issues
+
+    def _check_dir(self, path: str, inherited_sidecars: list) -> List[Issue]:
+        """ Recursively check a directory inside of a subject """
+
+        issues = []
+        subject = Path(path).relative_to(self.dataset_path).parts[0]
+
+        files = []
+        subdirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                else:
+                    files.append(entry)
+
+        sidecars = inherited_sidecars + [entry.name for entry in files
+                                         if entry.name.endswith(".json")]
+
+        for entry in files:
+            issues += self._check_empty(entry)
+
+            split = _split_name(entry.name)
+            if split is None:
+                issues.append(Issue("INVALID_FILENAME", Path(entry.path),
+                                    "file name is not BIDS conform"))
+                continue
+
+            entities, _, extension = split
+            if "sub-" + entities["sub"] != subject:
+                issues.append(Issue(
+                    "SUBJECT_MISMATCH", Path(entry.path),
+                    "subject in file name does not match directory {}"
+                    .format(subject)
+                ))
+
+            if (extension in DATA_EXTENSIONS
+                    and not self._has_sidecar(entry.name, sidecars)):
+                issues.append(Issue("MISSING_SIDECAR", Path(entry.path),
+                                    "no JSON sidecar found"))
+
+        for subdir in subdirs:
+            issues += self._check_dir(subdir, sidecars)
+
+        return issues
+
+    @staticmethod
+    def _check_empty(entry: os.DirEntry) -> List[Issue]:
+        try:
+            size = entry.stat().st_size
+        except FileNotFoundError:
+            # broken symlink, i.e. annexed content which is not present
+            return []
+
+        if size == 0:
+            return [Issue("EMPTY_FILE", Path(entry.path), "file is empty")]
+        return []
+
+    @staticmethod
+    def _has_sidecar(name: str, sidecars: list) -> bool:
+        """ Check if a sidecar applies to a data file
+
+        Following the inheritance principle a sidecar applies if it has the
+        same suffix and its entities are a subset of the ones of the data
+        file.
+        """
+
+        entities, suffix, _ = _split_name(name)
+        for sidecar in sidecars:
+            split = _split_sidecar_name(sidecar)
+            if split is None:
+                continue
+
+            sidecar_entities, sidecar_suffix, _ = split
+            if (sidecar_suffix == suffix
+                    and sidecar_entities.items() <= entities.items()):
+                return True
+
+        return False
+
+    def log_issues(self, issues: List[Issue]):
+        """ Report the issues found to the user """
+
+        if not issues:
+            self.log.info("BIDS pre-check found no issues")
+            return
+
+        for issue in issues:
+            self.log.error("%s: %s (%s)", issue.code,
+                           issue.path.relative_to(self.dataset_path),
+                           issue.message)
+        self.log.error("BIDS pre-check found %s issue(s)", len(issues))
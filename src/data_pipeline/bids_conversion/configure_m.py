@@ -5,12 +5,11 @@ from typing import Tuple
 
 import questionary
 
-from data_pipeline.setup_datalad import SetupDatalad
+from data_pipeline.setup_datalad import SetupDatalad, setup_datasets
 from data_pipeline.config_handler import ConfigHandler
-from .source_configuration import (
-    SourceConfiguration, BidsGitHandling, ProcedureHandling
-)
+from .source_configuration import BidsGitHandling
 from .bids_configuration import BidsConfiguration
+from .configure_session import ConfigureSession
 
 
 def configure(project_dir):
@@ -25,7 +24,10 @@ def configure(project_dir):
                 "properties": {
                     "dataset_name": {"type": "string"},
                     "setup_procedures": {"type": "array"},
-                    "patches": {"type": "array"}
+                    "patches": {"type": "array"},
+                    "performance_tuning": {"type": "boolean"},
+                    "git_config": {"type": "object"},
+                    "template_cache": {"type": ["string", "null"]}
                 },
                 "required": [
                     "dataset_name",
@@ -37,7 +39,10 @@ def configure(project_dir):
                 "properties": {
                     "dataset_name": {"type": "string"},
                     "setup_procedures": {"type": "array"},
-                    "patches": {"type": "array"}
+                    "patches": {"type": "array"},
+                    "performance_tuning": {"type": "boolean"},
+                    "git_config": {"type": "object"},
+                    "template_cache": {"type": ["string", "null"]}
                 },
                 "required": [
                     "dataset_name",
@@ -53,6 +58,23 @@ def configure(project_dir):
             "validator_container_name": {"type": "string"},
             "validator_image_url": {"type": "string"},
             "container_dir": {"type": "string"},
+            "validator_persistent_instance": {"type": "boolean"},
+            "import_jobs": {"type": "integer", "minimum": 1},
+            "import_staging_dir": {"type": ["string", "null"]},
+            "selective_import": {"type": "boolean"},
+            "disk_high_water_mark": {"type": ["number", "null"],
+                                     "minimum": 0, "maximum": 100},
+            "disk_poll_interval": {"type": "number", "minimum": 0},
+            "disk_wait_timeout": {"type": "number", "minimum": 0},
+            "get_jobs": {
+                "anyOf": [{"type": "integer", "minimum": 1},
+                          {"type": "string", "enum": ["auto"]}]
+            },
+            "conversion_batch_size": {"type": "integer", "minimum": 1},
+            "source_install_mode": {
+                "type": "string",
+                "enum": ["default", "ephemeral"]
+            },
             "config_acqid": {"type": "string"},
             "config_anon_subject": {"type": "string"},
         },
@@ -76,35 +98,44 @@ def configure(project_dir):
     config_handler.add_schema("bids_conversion", schema)
     config = config_handler.get("bids_conversion")
 
-    # create source dataset
+    # create source and bids dataset, they are independent of each other
     source_setup = SetupDatalad(project_dir, config["source"])
-    if not source_setup.dataset_path.exists():
-        source_setup.run()
-
-    # create bids dataset
     bids_setup = SetupDatalad(project_dir, config["bids"])
-    if not bids_setup.dataset_path.exists():
-        bids_setup.run()
-
-    repo = BidsGitHandling(source_setup.dataset_path)
-
-    while True:
-        try:
-            answers, choices = _ask_questions()
-            if not answers or answers["step_select"] == "Exit":
-                break
-
-            repo.checkout_config_branch()
-
-            switch = StepSwitcher(source_setup.dataset_path,
-                                  bids_setup.dataset_path,
-                                  choices, answers, repo)
-            choices_reverted = {v: k for k, v in choices.items()}
-            getattr(switch, choices_reverted[answers["step_select"]])()
-        finally:
-            repo.checkout_starting_branch()
-            # commit changes in .datalad/config, rules, procedures
-            repo.commit()
+    setup_datasets([source_setup, bids_setup])
+
+    repo = BidsGitHandling(source_setup.dataset_path, config["config_acqid"])
+
+    # the container instance is only started when the validator is used for
+    # the first time and reused for the rest of the session
+    if config.get("validator_persistent_instance", False):
+        validator_instance = (BidsConfiguration(bids_setup.dataset_path)
+                              .get_validator_instance())
+    else:
+        validator_instance = None
+
+    # dataset handles are kept for the whole run
+    session = ConfigureSession(repo, bids_setup.dataset_path,
+                               validator_instance)
+
+    try:
+        while True:
+            try:
+                answers, choices = _ask_questions()
+                if not answers or answers["step_select"] == "Exit":
+                    break
+
+                repo.open_config_worktree()
+                session.refresh()
+
+                switch = StepSwitcher(session, choices, answers)
+                choices_reverted = {v: k for k, v in choices.items()}
+                getattr(switch, choices_reverted[answers["step_select"]])()
+            finally:
+                # commit changes in .datalad/config, rules, procedures
+                repo.commit()
+    finally:
+        if validator_instance is not None:
+            validator_instance.stop()
 
 
 def _ask_questions(**kwargs) -> Tuple[dict, dict]:
@@ -120,6 +151,7 @@ def _ask_questions(**kwargs) -> Tuple[dict, dict]:
 
         rule_create="Create new rule",
         rule_import="Import rule",
+        rule_evaluate="Dry-evaluate rule",
 
         proc_change="Change active procedures",
         proc_create="Create new procedure",
@@ -165,6 +197,7 @@ def _ask_questions(**kwargs) -> Tuple[dict, dict]:
             "choices": [
                 choices["rule_create"],
                 choices["rule_import"],
+                choices["rule_evaluate"],
                 questionary.Separator(),
                 "Return"
             ],
@@ -249,14 +282,12 @@ class StepSwitcher():
            ...
     """
 
-    def __init__(self, source_dataset_path, bids_dataset_path,
-                 choices, answers, git_repo):
-        self.source_dataset_path = source_dataset_path
+    def __init__(self, session, choices, answers):
+        self.session = session
         self.choices = choices
         self.answers = answers
-        self.git_repo = git_repo
-        self.src_conf = SourceConfiguration(self.source_dataset_path)
-        self.bids_conf = BidsConfiguration(bids_dataset_path)
+        self.src_conf = session.src_conf
+        self.bids_conf = session.bids_conf
 
     def import_data(self):
         """ Create dataset and import data"""
@@ -277,7 +308,7 @@ class StepSwitcher():
                for key in ["procedure_select", "procedure_type"]):
             return
 
-        switch = ProcSwitcher(self.source_dataset_path, self.answers)
+        switch = ProcSwitcher(self.session.proc_handler, self.answers)
         choices_reverted = {v: k for k, v in self.choices.items()}
         getattr(switch, choices_reverted[self.answers["procedure_select"]])()
 
@@ -287,8 +318,7 @@ class StepSwitcher():
         # after every drop
         self.src_conf.get_heudiconv_container()
 
-        proc_handler = ProcedureHandling(self.source_dataset_path)
-        active_procedures = proc_handler.get_active_procedures()
+        active_procedures = self.session.proc_handler.get_active_procedures()
         self.bids_conf.generate_preview(
             source_dataset=self.src_conf.dataset_path,
             active_procedures=active_procedures
@@ -296,12 +326,14 @@ class StepSwitcher():
 
     def check(self):
         """ Wrapper around BidsConfiguration """
-        self.bids_conf.run_bids_validator()
+        self.bids_conf.run_bids_validator(self.session.validator_instance)
 
     def cleanup(self):
         """ Wrapper around BidsConfiguration """
-        self.src_conf.cleanup(self.git_repo)
+        self.src_conf.cleanup(self.session.git_repo)
         self.bids_conf.cleanup()
+        # the handles point into the removed worktree
+        self.session.invalidate()
 
 
 class RuleSwitcher():
@@ -329,6 +361,10 @@ class RuleSwitcher():
         """ Wrapper around ProcedureHandler """
         self.src_conf.import_rule(self.answers["rule_file"])
 
+    def rule_evaluate(self):
+        """ Wrapper around ProcedureHandler """
+        self.src_conf.evaluate_rule()
+
 
 class ProcSwitcher():
     """ Switcher for procedure action
@@ -343,8 +379,8 @@ class ProcSwitcher():
            proc_handler.create_procedure(...)
     """
 
-    def __init__(self, dataset_path, answers):
-        self.proc_handler = ProcedureHandling(dataset_path)
+    def __init__(self, proc_handler, answers):
+        self.proc_handler = proc_handler
         self.answers = answers
 
     def proc_create(self):
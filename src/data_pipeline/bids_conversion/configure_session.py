@@ -0,0 +1,76 @@
+""" Keeps the state of a configure run across the single actions """
+
+from pathlib import Path
+from typing import Callable, Union
+
+import data_pipeline.utils as utils
+from data_pipeline.config_handler import ConfigHandler
+
+from .bids_configuration import BidsConfiguration
+from .source_configuration import (
+    SourceConfiguration, BidsGitHandling, ProcedureHandling
+)
+
+
+class ConfigureSession():
+    """ Holds the dataset handles of one configure run
+
+    The handles (and with them the discovered procedures) are created on first
+    use and then reused by all following actions. They are only recreated if
+    the configuration changed or the config worktree was removed.
+    """
+
+    def __init__(self, git_repo: BidsGitHandling,
+                 bids_dataset_path: Union[str, Path],
+                 validator_instance=None):
+        self.log = utils.get_logger(__class__)  # type: ignore
+
+        self.git_repo = git_repo
+        self.source_dataset_path = git_repo.worktree_path
+        self.bids_dataset_path = Path(bids_dataset_path)
+        self.validator_instance = validator_instance
+
+        self.config: dict = {}
+        self._handles: dict = {}
+
+        self.refresh()
+
+    def refresh(self):
+        """ Drop the handles if the configuration changed since their creation
+        """
+        config = ConfigHandler.get_instance().get("bids_conversion")
+        if config != self.config:
+            if self._handles:
+                self.log.debug("Configuration changed, recreate handles")
+            self.invalidate()
+            self.config = config
+
+    def invalidate(self):
+        """ Drop all handles, they are recreated on next use """
+        self._handles = {}
+
+    def _get_handle(self, name: str, factory: Callable):
+        if name not in self._handles:
+            self._handles[name] = factory()
+        return self._handles[name]
+
+    @property
+    def src_conf(self) -> SourceConfiguration:
+        """ The configuration handling of the source dataset worktree """
+        return self._get_handle(
+            "src_conf", lambda: SourceConfiguration(self.source_dataset_path)
+        )
+
+    @property
+    def bids_conf(self) -> BidsConfiguration:
+        """ The configuration handling of the bids dataset """
+        return self._get_handle(
+            "bids_conf", lambda: BidsConfiguration(self.bids_dataset_path)
+        )
+
+    @property
+    def proc_handler(self) -> ProcedureHandling:
+        """ The procedure handling of the source dataset worktree """
+        return self._get_handle(
+            "proc_handler", lambda: ProcedureHandling(self.source_dataset_path)
+        )
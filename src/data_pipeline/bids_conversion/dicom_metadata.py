@@ -0,0 +1,122 @@
+""" Cache of the DICOM metadata hirni bases the studyspec on """
+
+import json
+import os
+from pathlib import Path
+from typing import Union
+
+import datalad.api as datalad
+
+import data_pipeline.utils as utils
+
+
+class DicomMetadataCache():
+    """ Keeps the per series DICOM metadata of imported acquisitions
+
+    Getting the metadata via datalad takes seconds to minutes for large
+    acquisitions, while applying a rule to it only takes milliseconds. Thus
+    the metadata is stored once per content of the dicoms dataset of an
+    acquisition. The cache is located in the git directory shared by all
+    worktrees of the dataset, so it survives reimports, cleanups and the
+    removal of the config worktree.
+
+    Only the evaluation of rules during the configuration reads the cache.
+    hirni-dicom2spec, which creates the studyspec on import and for the
+    preview, still gets the metadata via datalad.
+    """
+
+    def __init__(self, dataset_path: Union[str, Path]):
+        self.dataset_path = Path(dataset_path)
+        self.log = utils.get_logger(__class__)  # type: ignore
+
+        self.cache_dir = utils.get_git_path(
+            self.dataset_path, "data_pipeline/dicom_metadata", self.log,
+            common=True
+        )
+
+    def get_series(self, acqid: str) -> list:
+        """ Get the metadata of all image series of an acquisition
+
+        The metadata is extracted and cached if it is not cached yet.
+
+        Args:
+            acqid: The acquisition identifier.
+        Returns:
+            One dict per image series, as passed to the hirni rules.
+        """
+
+        dicom_path = self._get_dicom_path(acqid)
+
+        cache_file = self._get_cache_file(dicom_path)
+        if cache_file.exists():
+            self.log.debug("Use cached DICOM metadata of %s", acqid)
+            return json.loads(cache_file.read_text())
+
+        self.log.info("Extract DICOM metadata of %s", acqid)
+        series = self._extract_series(dicom_path)
+
+        # write atomically, imports might run concurrently
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_name(
+            "{}.{}.tmp".format(cache_file.name, os.getpid())
+        )
+        tmp_file.write_text(json.dumps(series))
+        os.replace(tmp_file, cache_file)
+
+        return series
+
+    def populate(self, acqid: str):
+        """ Cache the metadata of a newly imported acquisition
+
+        Failing to do so does not prevent the metadata from being extracted
+        on first use, thus no error is passed on.
+
+        Args:
+            acqid: The acquisition identifier.
+        """
+
+        try:
+            self.get_series(acqid)
+        except Exception:  # pylint: disable=broad-except
+            self.log.warning("Could not cache the DICOM metadata of %s",
+                             acqid, exc_info=True)
+
+    def _get_dicom_path(self, acqid: str) -> Path:
+        dicom_path = Path(self.dataset_path, acqid, "dicoms")
+        if not dicom_path.exists():
+            raise utils.UsageError(
+                "Acquisition {} was not imported".format(acqid)
+            )
+
+        return dicom_path
+
+    def _get_cache_file(self, dicom_path: Path) -> Path:
+        # the tree contains the annex keys of all DICOM files and with it
+        # their checksums, i.e. acquisitions with the same content share the
+        # same entry
+        tree = utils.run_cmd(
+            ["git", "-C", str(dicom_path), "rev-parse", "HEAD^{tree}"],
+            self.log
+        ).strip()
+
+        return Path(self.cache_dir, "{}.json".format(tree))
+
+    def _extract_series(self, dicom_path: Path) -> list:
+        # same call as hirni-dicom2spec uses
+        for meta in datalad.meta_dump(
+                path=str(dicom_path),
+                dataset=str(self.dataset_path),
+                recursive=False,
+                reporton="datasets",
+                return_type="generator",
+                result_renderer="disabled"):
+            if meta.get("status", None) not in ["ok", "notneeded"]:
+                continue
+
+            series = meta.get("metadata", {}).get("dicom", {}).get("Series")
+            if series:
+                return series
+
+        raise utils.NotPossible(
+            "Found no DICOM metadata for {}".format(dicom_path)
+        )
@@ -0,0 +1,214 @@
+""" Keeps track of which tarball was imported as which acquisition """
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import data_pipeline.utils as utils
+
+
+def get_file_hash(path: Union[str, Path]) -> str:
+    """ Compute the sha256 checksum of a file """
+
+    sha256 = hashlib.sha256()
+    with Path(path).open("rb") as file_handle:
+        for block in iter(lambda: file_handle.read(1024 * 1024), b""):
+            sha256.update(block)
+
+    return sha256.hexdigest()
+
+
+class ImportRegistry():
+    """ Registry of the imported acquisitions of a dataset
+
+    For every acquisition the size, modification time and checksum of the
+    imported tarball is stored together with the information whether the
+    import was completed. Checking if a tarball was imported thus only
+    requires a stat call as long as it was not touched.
+
+    Since several runs might use the registry at the same time, it is read
+    again under a lock before every change.
+    """
+
+    NEW = "new"
+    IMPORTED = "imported"
+    CHANGED = "changed"
+    INCOMPLETE = "incomplete"
+
+    def __init__(self, dataset_path: Union[str, Path]):
+        self.dataset_path = Path(dataset_path)
+        self.log = utils.get_logger(__class__)  # type: ignore
+
+        # shared by all worktrees
+        self.registry_file = utils.get_git_path(
+            self.dataset_path, "data_pipeline/import_registry.json", self.log,
+            common=True
+        )
+        self.entries = self._read()
+
+    def _read(self) -> dict:
+        if not self.registry_file.exists():
+            return {}
+
+        return json.loads(self.registry_file.read_text())
+
+    @contextlib.contextmanager
+    def _update(self) -> Iterator[dict]:
+        """ Change the entries as stored on disk and write them back """
+
+        self.registry_file.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = self.registry_file.with_name(
+            self.registry_file.name + ".lock"
+        )
+        with lock_file.open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.entries = self._read()
+                yield self.entries
+                self._write()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write(self):
+        tmp_file = self.registry_file.with_name(
+            "{}.{}.tmp".format(self.registry_file.name, os.getpid())
+        )
+        tmp_file.write_text(json.dumps(self.entries, indent=4))
+        os.replace(tmp_file, self.registry_file)
+
+    def get_status(self, acqid: str, tarball: Union[str, Path]) -> str:
+        """ Check if a tarball was imported as acquisition
+
+        Args:
+            acqid: The acquisition identifier
+            tarball: The path of the tarball
+        Returns:
+            One of
+            NEW: The acquisition was not imported yet.
+            IMPORTED: The tarball was imported completely.
+            CHANGED: The acquisition was imported from a different tarball or
+                the content of the tarball changed since.
+            INCOMPLETE: The import was started but did not finish.
+        """
+
+        acq_path = Path(self.dataset_path, acqid, "dicoms")
+        entry = self.entries.get(acqid)
+
+        if entry is None:
+            if acq_path.exists():
+                # imported before the registry existed
+                self.log.info("Register existing acquisition %s", acqid)
+                self.start(acqid, tarball)
+                self.complete(acqid)
+                return self.IMPORTED
+            return self.NEW
+
+        if not acq_path.exists():
+            # e.g. removed during cleanup
+            return self.NEW
+
+        if not entry["complete"]:
+            return self.INCOMPLETE
+
+        stat = Path(tarball).stat()
+        if (entry["tarball"] == str(tarball)
+                and entry["size"] == stat.st_size
+                and entry["mtime_ns"] == stat.st_mtime_ns):
+            return self.IMPORTED
+
+        # only compute the checksum if the tarball was touched
+        if (entry["size"] == stat.st_size
+                and entry["sha256"] == get_file_hash(tarball)):
+            self._set_entry(acqid, tarball, entry["sha256"], complete=True)
+            return self.IMPORTED
+
+        return self.CHANGED
+
+    def find_duplicate(self, acqid: str,
+                       tarball: Union[str, Path]) -> Optional[str]:
+        """ Find another acquisition imported from an identical tarball
+
+        The tarball is only hashed if an acquisition of the same size exists.
+
+        Args:
+            acqid: The acquisition identifier
+            tarball: The path of the tarball
+        Returns:
+            The acquisition identifier of the duplicate or None.
+        """
+
+        size = Path(tarball).stat().st_size
+        sha256 = None
+        for other_acqid, entry in self.entries.items():
+            if (other_acqid == acqid
+                    or not entry["complete"]
+                    or entry["size"] != size
+                    or not Path(self.dataset_path, other_acqid,
+                                "dicoms").exists()):
+                continue
+
+            if sha256 is None:
+                sha256 = get_file_hash(tarball)
+            if entry["sha256"] == sha256:
+                return other_acqid
+
+        return None
+
+    def _set_entry(self, acqid: str, tarball: Union[str, Path], sha256: str,
+                   complete: bool):
+        stat = Path(tarball).stat()
+        with self._update() as entries:
+            previous = entries.get(acqid, {})
+            entries[acqid] = {
+                "tarball": str(tarball),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": sha256,
+                "complete": complete,
+                # survives the reimport
+                "reconvert": previous.get("reconvert", False)
+            }
+
+    def start(self, acqid: str, tarball: Union[str, Path],
+              sha256: str = None):
+        """ Register the start of an import
+
+        Args:
+            acqid: The acquisition identifier
+            tarball: The path of the tarball
+            sha256: Optional; The checksum of the tarball if already known.
+        """
+        self._set_entry(acqid, tarball, sha256 or get_file_hash(tarball),
+                        complete=False)
+
+    def complete(self, acqid: str):
+        """ Mark the import of an acquisition as done """
+        with self._update() as entries:
+            entries[acqid]["complete"] = True
+
+    def forget(self, acqid: str):
+        """ Remove an acquisition from the registry """
+        with self._update() as entries:
+            entries.pop(acqid, None)
+
+    def request_reconversion(self, acqid: str):
+        """ Remember that the conversion of an acquisition is outdated
+
+        E.g. because the acquisition is reimported from a changed tarball.
+        """
+        with self._update() as entries:
+            entries[acqid]["reconvert"] = True
+
+    def needs_reconversion(self, acqid: str) -> bool:
+        """ Check if the conversion of an acquisition is outdated """
+        return self.entries.get(acqid, {}).get("reconvert", False)
+
+    def clear_reconversion(self, acqid: str):
+        """ Mark the outdated conversion of an acquisition as removed """
+        with self._update() as entries:
+            if acqid in entries:
+                entries[acqid]["reconvert"] = False
@@ -0,0 +1,24 @@
+""" Maintain the datasets of the BIDS conversion """
+
+from data_pipeline.config_handler import ConfigHandler
+from data_pipeline.maintenance import DatasetMaintenance
+from data_pipeline.setup_datalad import get_dataset_path
+
+
+def maintain(project_dir, full: bool = False):
+    """ Run repository maintenance on source and bids dataset
+
+    Args:
+        project_dir: The project directory
+        full: Optional; Do a full instead of an incremental maintenance.
+    """
+
+    config = ConfigHandler.get_instance().get("bids_conversion")
+
+    for dataset in ["source", "bids"]:
+        dataset_path = get_dataset_path(project_dir,
+                                        config[dataset]["dataset_name"])
+        if not dataset_path.exists():
+            continue
+
+        DatasetMaintenance(dataset_path).run(full=full)
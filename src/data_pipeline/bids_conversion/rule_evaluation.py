@@ -0,0 +1,71 @@
+""" Apply hirni rules in-process, without creating a studyspec """
+
+import importlib.util
+from pathlib import Path
+import sys
+from typing import Union
+
+from .spec_diff import IGNORE_TAG
+
+
+def load_rules(rule_file: Union[str, Path]):
+    """ Load the rule class from a rule file as hirni does
+
+    Args:
+        rule_file: The python file defining `__datalad_hirni_rules`.
+    Returns:
+        The rule class.
+    """
+
+    rule_file = Path(rule_file)
+
+    spec = importlib.util.spec_from_file_location(rule_file.stem, rule_file)
+    module = importlib.util.module_from_spec(spec)
+
+    # the rules import rules_base from the same directory
+    sys.path.insert(0, str(rule_file.parent))
+    try:
+        # always load from file to get the latest changes
+        sys.modules.pop("rules_base", None)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(str(rule_file.parent))
+
+    if not hasattr(module, "__datalad_hirni_rules"):
+        raise ValueError("Rules definition file {} missed attribute "
+                         "'__datalad_hirni_rules'.".format(rule_file))
+
+    return getattr(module, "__datalad_hirni_rules")
+
+
+def evaluate_rules(rules, series: list, subject: str = None,
+                   anon_subject: str = None, session: str = None) -> list:
+    """ Apply a rule class to the metadata of image series
+
+    Args:
+        rules: The rule class.
+        series: The DICOM metadata, one dict per image series.
+        subject: Optional; Passed on to the rules.
+        anon_subject: Optional; Passed on to the rules.
+        session: Optional; Passed on to the rules.
+    Returns:
+        The entries the series would get in the studyspec (without the
+        automatically managed ones like location).
+    """
+
+    results = rules(series)(subject=subject, anon_subject=anon_subject,
+                            session=session)
+    if len(results) != len(series):
+        raise ValueError("Rules returned {} results for {} series".format(
+            len(results), len(series)
+        ))
+
+    entries = []
+    for values, is_valid in results:
+        entry = {key: {"value": value, "approved": False}
+                 for key, value in values.items()}
+        if not is_valid:
+            entry["tags"] = [IGNORE_TAG]
+        entries.append(entry)
+
+    return entries
@@ -3,10 +3,15 @@
 Converts a tar ball into bids compatible dataset using datalad and hirni
 """
 
+from pathlib import Path
+import shutil
+import time
+
 from data_pipeline.config_handler import ConfigHandler
 from data_pipeline.setup_datalad import get_dataset_path
 from data_pipeline import utils
 from .bids_conversion import SourceHandler, BidsConversion
+from .import_registry import ImportRegistry
 from .source_configuration import ProcedureHandling
 
 
@@ -14,12 +19,42 @@ class Conversion():
     """ Import and convert data """
     # pylint: disable=too-few-public-methods
 
-    def __init__(self, source_dataset_path, bids_dataset_path, data_path):
+    def __init__(self, source_dataset_path, bids_dataset_path, data_path,
+                 config: dict = None):
+        """
+        Args:
+            source_dataset_path: The path of the source dataset
+            bids_dataset_path: The path of the bids dataset
+            data_path: The tarball path template of the subject file
+            config: Optional; The bids_conversion configuration to take the
+                tuning options from.
+        """
+        self.log = utils.get_logger(__class__)  # type: ignore
+
         self.source_dataset_path = source_dataset_path
         self.bids_dataset_path = bids_dataset_path
         self.data_path = data_path
 
+        config = config or {}
+        self.import_jobs = config.get("import_jobs", 1)
+        self.staging_dir = config.get("import_staging_dir")
+        self.selective_import = config.get("selective_import", False)
+        self.disk_high_water_mark = config.get("disk_high_water_mark")
+        self.disk_poll_interval = config.get("disk_poll_interval", 60)
+        self.disk_wait_timeout = config.get("disk_wait_timeout", 3600)
+        self.get_jobs = config.get("get_jobs", 1)
+        self.conversion_batch_size = config.get("conversion_batch_size", 1)
+
         self.source_handler = None
+        self.validator_instance = None
+        # whether the source dataset installed in the bids dataset has to be
+        # updated to see the latest imports
+        self.source_outdated = True
+        # converted subjects whose DICOM content might still be present,
+        # mapped to their acquisition
+        self.cleanup_pending = {}
+        # anon_subjects whose conversion failed
+        self.failed = []
 
     def run(self, anon_subject: str, acqid: str, check_bids=True):
         """ Run the bids convertion
@@ -29,9 +64,30 @@ class Conversion():
             acqid:  The acquisition identifier
         """
 
-        self._import_data(anon_subject, acqid)
-        self._convert(anon_subject, acqid, check_bids)
-        self._cleanup()
+        self.run_batch([dict(anon_subject=anon_subject, acqid=acqid)],
+                       check_bids)
+
+    def run_batch(self, subjects: list, check_bids=True):
+        """ Run the bids conversion of several subjects in one spec2bids call
+
+        Args:
+            subjects: The subjects as listed in the subject file
+        """
+
+        acqids = {}
+        for subject in subjects:
+            self._import_data(subject["anon_subject"], subject["acqid"])
+            acqids[subject["anon_subject"]] = subject["acqid"]
+
+        self._remove_outdated_conversions(subjects)
+
+        converted = self._convert_batch(subjects, check_bids)
+        for anon_subject in converted:
+            if not self._cleanup(anon_subject, acqids[anon_subject]):
+                self.cleanup_pending[anon_subject] = acqids[anon_subject]
+
+        self.failed += [anon_subject for anon_subject in acqids
+                        if anon_subject not in converted]
 
     def _import_data(self, anon_subject: str, acqid: str):
         """ import tarball into sourcedata """
@@ -39,51 +95,226 @@ class Conversion():
         tarball = self.data_path.format(anon_subject=anon_subject, acqid=acqid)
 
         try:
-            self.source_handler = SourceHandler(self.source_dataset_path)
+            self.source_handler = SourceHandler(
+                self.source_dataset_path,
+                staging_dir=self.staging_dir,
+                selective_import=self.selective_import
+            )
         except utils.UsageError:
             # error was already logged and more traceback is not needed
             return
 
-        self.source_handler.import_data(
-            tarball=tarball,
-            anon_subject=anon_subject,
-            acqid=acqid
-        )
+        if self.source_handler.needs_import(acqid, tarball):
+            self._wait_for_disk_space()
+
+        if self.source_handler.import_data(
+                tarball=tarball,
+                anon_subject=anon_subject,
+                acqid=acqid):
+            self.source_outdated = True
+
+    def import_data(self, subjects: list):
+        """ Import the tarballs of several subjects at once
+
+        Args:
+            subjects: The subjects as listed in the subject file
+        """
 
-    def _convert(self, anon_subject: str, acqid: str, check_bids=True):
         try:
-            conversion = BidsConversion(self.bids_dataset_path, anon_subject)
+            source_handler = SourceHandler(
+                self.source_dataset_path,
+                staging_dir=self.staging_dir,
+                selective_import=self.selective_import
+            )
         except utils.UsageError:
             # error was already logged and more traceback is not needed
             return
 
+        acquisitions = [
+            dict(tarball=self.data_path.format(
+                     anon_subject=subject["anon_subject"],
+                     acqid=subject["acqid"]
+                 ),
+                 anon_subject=subject["anon_subject"],
+                 acqid=subject["acqid"])
+            for subject in subjects
+        ]
+        if any(source_handler.needs_import(acq["acqid"], acq["tarball"])
+               for acq in acquisitions):
+            self._wait_for_disk_space()
+
+        imported = source_handler.import_data_bulk(
+            acquisitions=acquisitions,
+            jobs=self.import_jobs
+        )
+        if imported:
+            self.source_outdated = True
+
+    def _remove_outdated_conversions(self, subjects: list):
+        """ Remove the conversions of acquisitions reimported since """
+
+        try:
+            registry = ImportRegistry(self.source_dataset_path)
+        except Exception:  # pylint: disable=broad-except
+            # e.g. the source dataset does not exist, nothing was imported
+            return
+
+        for subject in subjects:
+            if not registry.needs_reconversion(subject["acqid"]):
+                continue
+
+            BidsConversion(self.bids_dataset_path,
+                           subject["anon_subject"]).remove_conversion()
+            registry.clear_reconversion(subject["acqid"])
+
+    def _wait_for_disk_space(self):
+        """ Pause until the disk usage is below the high-water mark
+
+        The DICOM content of converted subjects is dropped first. If this
+        does not suffice, nothing in this process frees space, thus it waits
+        only up to disk_wait_timeout seconds for someone else to do it.
+
+        Raises:
+            NotPossible: If the disk usage stays above the high-water mark.
+        """
+
+        if self.disk_high_water_mark is None:
+            return
+
+        paths = [self.source_dataset_path]
+        if self.staging_dir is not None:
+            paths.append(self.staging_dir)
+
+        cleaned_up = False
+        deadline = time.monotonic() + self.disk_wait_timeout
+        while True:
+            usage = max(self._get_disk_usage(path) for path in paths)
+            if usage < self.disk_high_water_mark:
+                return
+
+            if not cleaned_up:
+                cleaned_up = True
+                self._cleanup_pending()
+                continue
+
+            if time.monotonic() >= deadline:
+                self.log.error("Disk usage of %.1f%% stays above the "
+                               "high-water mark of %s%%, free space or raise "
+                               "disk_high_water_mark", usage,
+                               self.disk_high_water_mark)
+                raise utils.NotPossible(
+                    "Disk usage stays above the high-water mark"
+                )
+
+            self.log.warning("Disk usage of %.1f%% reached the high-water "
+                             "mark of %s%%, pause imports for %ss", usage,
+                             self.disk_high_water_mark,
+                             self.disk_poll_interval)
+            time.sleep(self.disk_poll_interval)
+
+    def _cleanup_pending(self):
+        """ Drop the DICOM content of all converted subjects """
+
+        for anon_subject, acqid in list(self.cleanup_pending.items()):
+            if self._cleanup(anon_subject, acqid):
+                del self.cleanup_pending[anon_subject]
+
+    @staticmethod
+    def _get_disk_usage(path) -> float:
+        """ The usage of the file system containing path in percent """
+
+        path = Path(path).resolve()
+        # the staging dir might not be created yet
+        while not path.exists():
+            path = path.parent
+
+        usage = shutil.disk_usage(path)
+        return usage.used / usage.total * 100
+
+    def _convert_batch(self, subjects: list, check_bids=True) -> list:
+        """ Convert the acquisitions of several subjects
+
+        Returns:
+            The anon_subjects for which data was converted.
+        """
+        try:
+            conversion = BidsConversion(self.bids_dataset_path, "")
+        except utils.UsageError:
+            # error was already logged and more traceback is not needed
+            return []
+
         # to avoid reloading the container after a uninstall
         self.source_handler.get_heudiconv_container()
 
-        # install/update sourcedata into bids
-        conversion.install_source_dataset(self.source_dataset_path)
+        # install/update sourcedata into bids, only once per import
+        conversion.install_source_dataset(
+            self.source_dataset_path,
+            acqids=[subject["acqid"] for subject in subjects],
+            update=self.source_outdated
+        )
+        self.source_outdated = False
+
+        for subject in subjects:
+            if not conversion.is_converted(subject["anon_subject"]):
+                # in parallel instead of file by file during spec2bids
+                conversion.prefetch(subject["acqid"], jobs=self.get_jobs)
+            else:
+                # e.g. by an earlier run which did not drop the content
+                self.cleanup_pending[subject["anon_subject"]] = \
+                    subject["acqid"]
 
         # spec2bids
-        conversion.convert(spec=[
-            conversion.install_dataset_name/"studyspec.json",
-            conversion.install_dataset_name/acqid/"studyspec.json"
-        ])
+        converted = conversion.convert_batch(subjects)
 
         # procedures
         active_procedures = (ProcedureHandling(self.source_dataset_path)
                              .get_active_procedures())
-        conversion.run_procedures(active_procedures)
+        for anon_subject in converted:
+            subject_conversion = BidsConversion(self.bids_dataset_path,
+                                                anon_subject)
+            subject_conversion.run_procedures(active_procedures)
+
+            # cheap check to surface errors directly and not only at the end
+            subject_conversion.run_precheck()
+
+            if check_bids:
+                subject_conversion.run_bids_validator(self.validator_instance)
+
+        return converted
+
+    def start_validator_instance(self):
+        """ Use one long-lived container instance for all validator runs """
+        self.validator_instance = (BidsConversion(self.bids_dataset_path, "")
+                                   .get_validator_instance())
 
-        if check_bids:
-            conversion.run_bids_validator()
+    def stop_validator_instance(self):
+        """ Shut down the validator container instance if there is one """
+        if self.validator_instance is not None:
+            self.validator_instance.stop()
+            self.validator_instance = None
 
     def run_bids_validator(self):
         """ Run BIDS validator for the whole dataset """
-        BidsConversion(self.bids_dataset_path, "").run_bids_validator()
+        BidsConversion(self.bids_dataset_path, "").run_bids_validator(
+            self.validator_instance
+        )
+
+    def _cleanup(self, anon_subject: str, acqid: str) -> bool:
+        """ Drop the DICOM content of a converted acquisition
+
+        Only the content retrieved into the bids dataset for the conversion
+        is dropped. It stays retrievable from the source dataset, e.g. for a
+        reconversion.
+
+        Returns:
+            True if everything was dropped.
+        """
+
+        self.log.info("Clean up anon_subject=%s, aquisition=%s", anon_subject,
+                      acqid)
 
-    def _cleanup(self):
-        pass
-        # TODO uninstall
+        return BidsConversion(self.bids_dataset_path,
+                              anon_subject).drop_source_content(acqid)
 
 
 def run(project_dir):
@@ -100,16 +331,38 @@ def run(project_dir):
     )
 
     conv = Conversion(source_dataset_path, bids_dataset_path,
-                      data_path=subject_config["data_path"])
+                      data_path=subject_config["data_path"],
+                      config=config["bids_conversion"])
+    # a chunk is imported in parallel and converted in one batch
+    chunk_size = max(conv.import_jobs, conv.conversion_batch_size)
+
+    if config["bids_conversion"].get("validator_persistent_instance", False):
+        conv.start_validator_instance()
+
+    subjects = subject_config["subjects"]
+    try:
+        # import chunks of subjects in parallel, each chunk is converted
+        # before the next one is imported
+        for start in range(0, len(subjects), chunk_size):
+            chunk = subjects[start:start + chunk_size]
+            if len(chunk) > 1:
+                # conv.run skips the import of the imported subjects
+                conv.import_data(chunk)
 
-    # TODO enable parallel run
-    for subject in subject_config["subjects"]:
-        # get anon_subject, acquid, and tarball
-        anon_subject = subject["anon_subject"]
-        acqid = subject["acqid"]
+            for batch_start in range(0, len(chunk),
+                                     conv.conversion_batch_size):
+                conv.run_batch(
+                    chunk[batch_start:
+                          batch_start + conv.conversion_batch_size],
+                    check_bids=False
+                )
 
-        conv.run(anon_subject=anon_subject, acqid=acqid, check_bids=False)
+        # the validator checks all anon-subject anyway and thus only has to
+        # run once at the end
+        conv.run_bids_validator()
+    finally:
+        conv.stop_validator_instance()
 
-    # the validator checks all anon-subject anyway and thus only has to run
-    # once at the end
-    conv.run_bids_validator()
+    if conv.failed:
+        raise utils.NotPossible("Conversion of anon_subjects {} failed"
+                                .format(", ".join(conv.failed)))
@@ -14,6 +14,9 @@ from data_pipeline.config_handler import ConfigHandler
 from data_pipeline.git_handler import GitBase
 
 from .bids_conversion import SourceHandler
+from .dicom_metadata import DicomMetadataCache
+from .import_registry import ImportRegistry
+from . import rule_evaluation
 
 
 class SourceConfiguration():
@@ -32,7 +35,10 @@ class SourceConfiguration():
         self.spec_file = Path(self.dataset_path, self.acqid, "studyspec.json")
         self.anon_subject = self.config["config_anon_subject"]
 
-        self.source_handler = SourceHandler(self.dataset_path)
+        # the cached metadata speeds up the dry evaluation of the rules
+        self.source_handler = SourceHandler(self.dataset_path,
+                                            cache_metadata=True)
+        self.metadata_cache = DicomMetadataCache(self.dataset_path)
 
     def import_data(self, tarball: str):
         """ Import tarball as subdataset
@@ -62,6 +68,44 @@ class SourceConfiguration():
 
         self._create_studyspec()
 
+    def evaluate_rule(self):
+        """ Apply the rule to the imported data without creating a studyspec
+
+        The rule file is loaded and applied in-process to the cached DICOM
+        metadata, which makes checking changes to it fast.
+        """
+
+        rule_file = Path(self.dataset_path, self.config["rule_dir"],
+                         self.config["rule_name"])
+        if not rule_file.exists():
+            self.log.error("No rule was created or imported yet.")
+            return
+
+        try:
+            series = self.metadata_cache.get_series(self.acqid)
+        except utils.UsageError:
+            self.log.error("No data was imported yet.")
+            return
+
+        rules = rule_evaluation.load_rules(rule_file)
+        # same parameters as used by _create_studyspec
+        entries = rule_evaluation.evaluate_rules(rules, series)
+
+        lines = []
+        for series_dict, entry in zip(series, entries):
+            lines.append("Series {} ({}):".format(
+                series_dict.get("SeriesNumber", "?"),
+                series_dict.get("SeriesDescription", "")
+            ))
+            for key, value in entry.items():
+                if key == "tags":
+                    continue
+                lines.append("    {}: {}".format(key, value["value"]))
+            if "tags" in entry:
+                lines.append("    -> ignored")
+
+        self.log.info("Rule result:\n%s", "\n".join(lines))
+
     def _register_and_add_rule(self, rule_template):
         """Register datalad hirni rule"""
 
@@ -175,8 +219,8 @@ class SourceConfiguration():
             # datalad remove bids_rule_config
             datalad.remove(dataset=self.dataset_path, path=self.acqid,
                            recursive=True, if_dirty="ignore")
+        ImportRegistry(self.dataset_path).forget(self.acqid)
 
-        git_repo.checkout_starting_branch()
         git_repo.remove_config_branch()
 
 
@@ -192,9 +236,16 @@ class ProcedureHandling():
 
         self.log = utils.get_logger(__class__)  # type: ignore
 
+        # discovering procedures is slow, thus it is only redone after the
+        # procedures were changed
+        self._available_procedures = None
+
     def get_available_procedures(self):
         """ Show all procedures known to datalad """
 
+        if self._available_procedures is not None:
+            return self._available_procedures
+
         # self.log.info("Available procedures are:")
         # datalad.run_procedure(dataset=self.dataset, discover=True)
 
@@ -217,6 +268,7 @@ class ProcedureHandling():
                         "type": procedure["type"]
                     }
 
+        self._available_procedures = procs
         return procs
 
     def create_procedure(self, procedure_type: str, procedure_name: str):
@@ -262,6 +314,8 @@ class ProcedureHandling():
             this_file_path=Path(__file__)
         )
 
+        self._available_procedures = None
+
         # edit procedure template
         self.log.info("Opening %s", target)
         click.edit(filename=str(target))
@@ -338,6 +392,7 @@ class ProcedureHandling():
             return
 
         shutil.copy(procedure_path, target)
+        self._available_procedures = None
 
         self.log.info("Procedure %s was created and can now be activated.",
                       procedure_file_name)
@@ -422,44 +477,119 @@ class ProcedureHandling():
 
 
 class BidsGitHandling(GitBase):
-    """ To switch between starting and config branch """
+    """ Keeps the config branch in a separate working tree
+
+    The config branch stays checked out in its own git worktree for the whole
+    configure session. Thus switching between starting and config branch is
+    not needed and the working tree of the source dataset is never touched.
+    """
 
-    def __init__(self, dataset_path):
+    def __init__(self, dataset_path, acqid: str = None):
+        """
+        Args:
+            dataset_path: The path of the source dataset
+            acqid: Optional; The acquisition used for the configuration. Of
+                all imported acquisitions only this one is installed into the
+                config working tree.
+        """
         super().__init__()
 
-        self.dataset_path = dataset_path
+        self.dataset_path = Path(dataset_path)
+        self.acqid = acqid
         self.log = utils.get_logger(__class__)  # type: ignore
         self.starting_branch = self._get_current_branch()
         self.config_branch = "bids_config_branch"
 
+        self.worktree_path = Path(
+            self.dataset_path.parent,
+            ".{}_{}".format(self.dataset_path.name, self.config_branch)
+        )
+        # the config branch only has to be rebased once per session
+        self.is_rebased = False
+        # the subdatasets only have to be installed once per worktree
+        self.has_subdatasets = False
+
     def _get_current_branch(self):
         with utils.ChangeWorkingDir(self.dataset_path):
             return super()._get_current_branch()
 
-    def checkout_config_branch(self):
-        """ Switch to branch dedicated for bids config """
+    def open_config_worktree(self):
+        """ Check out the config branch in its own working tree
 
-        with utils.ChangeWorkingDir(self.dataset_path):
-            self.checkout_branch(self.config_branch,
-                                 rebase_branch=self.starting_branch,
-                                 do_create=True)
+        If the working tree does already exist it is reused.
+        """
 
-    def checkout_starting_branch(self):
-        """ Switch back to starting branch """
+        if not self.worktree_path.exists():
+            self.log.info("Check out %s in %s", self.config_branch,
+                          self.worktree_path)
+            with utils.ChangeWorkingDir(self.dataset_path):
+                if not self.check_if_branch_exists(self.config_branch):
+                    self.create_branch(self.config_branch,
+                                       self.starting_branch)
+                self.add_worktree(self.worktree_path, self.config_branch)
+
+        if not self.is_rebased:
+            # ChangeWorkingDir swallows exceptions, thus raise outside of it
+            is_rebased = False
+            with utils.ChangeWorkingDir(self.worktree_path):
+                is_rebased = self.rebase(self.starting_branch)
+            if not is_rebased:
+                raise utils.UsageError(
+                    "Rebasing {} onto {} failed due to conflicts. Resolve "
+                    "them in {} first.".format(self.config_branch,
+                                               self.starting_branch,
+                                               self.worktree_path)
+                )
+            self.is_rebased = True
 
-        self.stash()
-        with utils.ChangeWorkingDir(self.dataset_path):
-            self.checkout_branch(self.starting_branch)
-        self.stash(pop=True)
+        if not self.has_subdatasets:
+            self._install_subdatasets()
+            self.has_subdatasets = True
 
-    def stash(self, pop: bool = False):
-        """Wrapper anound GitBase """
-        with utils.ChangeWorkingDir(self.dataset_path):
-            super().stash(pop)
+    def _install_subdatasets(self):
+        """ Install the subdatasets of the source dataset into the worktree
+
+        A new working tree does not contain the subdatasets (e.g. the hirni
+        toolbox), thus they are cloned from the already installed ones of the
+        source dataset. Of the imported acquisitions only the one used for the
+        configuration is needed.
+        """
+
+        subdatasets = datalad.subdatasets(
+            dataset=str(self.dataset_path),
+            state="present",
+            result_xfm="relpaths",
+            result_renderer="disabled"
+        )
+
+        for subdataset in subdatasets:
+            parts = Path(subdataset).parts
+            # <acqid>/dicoms
+            is_acquisition = len(parts) == 2 and parts[1] == "dicoms"
+            if is_acquisition and parts[0] != self.acqid:
+                continue
+
+            target = Path(self.worktree_path, subdataset)
+            if Path(target, ".git").exists():
+                continue
+
+            self.log.debug("Install %s into worktree", subdataset)
+            # the subdataset is already registered in the worktree, cloning
+            # into the dataset would commit the location of the source as its
+            # url on the config branch
+            datalad.clone(
+                source=str(Path(self.dataset_path, subdataset)),
+                path=str(target),
+                result_renderer="disabled"
+            )
+            # nested subdatasets, e.g. the dicoms of an acquisition
+            datalad.get(path=str(target), dataset=str(target),
+                        recursive=True, get_data=False,
+                        result_renderer="disabled")
 
     def check_if_to_be_committed(self, path: str):
         """ Check if a path has changed and should be committed """
-        with utils.ChangeWorkingDir(self.dataset_path):
+        with utils.ChangeWorkingDir(self.worktree_path):
 
             if self.is_tracked(path):
                 # path is already tracked but was changed
@@ -471,17 +601,26 @@ class BidsGitHandling(GitBase):
             return False
 
     def commit(self):
-        """ Commit changes done during bids configuration """
+        """ Commit changes done during bids configuration
 
-        with utils.ChangeWorkingDir(self.dataset_path):
+        The changes are committed on the config branch and then transferred
+        to the starting branch.
+        """
+
+        if not self.worktree_path.exists():
+            return
+
+        to_transfer = []
+
+        # one snapshot answers all the status queries below
+        with utils.ChangeWorkingDir(self.worktree_path), \
+                self.status_snapshot():
             # add config and hirni changes
-            path = ".datalad/config"
+            path = Path(self.worktree_path, ".datalad", "config")
             if self.check_if_to_be_committed(path):
-                datalad.save(
-                    path,
-                    dataset=self.dataset_path,
-                    message=("Modify datalad config for custom rule and "
-                             "procedures")
+                to_transfer.append(
+                    (path, "Modify datalad config for custom rule and "
+                           "procedures")
                 )
 
             # add rule
@@ -490,39 +629,64 @@ class BidsGitHandling(GitBase):
             )
 
             if rule_file and self.check_if_to_be_committed(rule_file):
-                datalad.save(rule_file, dataset=self.dataset_path,
-                             message="Add/modify custom rule", to_git=True)
+                to_transfer.append((rule_file, "Add/modify custom rule"))
 
                 rule_base_file = Path(rule_file).with_name("rules_base.py")
                 if self.check_if_to_be_committed(rule_base_file):
-                    datalad.save(rule_base_file, dataset=self.dataset_path,
-                                 message="Add rule_base file", to_git=True)
+                    to_transfer.append((rule_base_file,
+                                        "Add rule_base file"))
 
             # add procedures
             procedure_dir = self.determine_dir(section="datalad.locations",
                                                option="dataset-procedures")
 
             if procedure_dir and self.check_if_to_be_committed(procedure_dir):
-                datalad.save(procedure_dir, dataset=self.dataset_path,
-                             message="Add procedures", to_git=True)
+                to_transfer.append((procedure_dir, "Add procedures"))
                 # TODO check what happens if one procedure is only modified
 
+            for path, message in to_transfer:
+                datalad.save(path, dataset=self.worktree_path,
+                             message=message, to_git=True)
+
+        for path, message in to_transfer:
+            self._transfer_to_starting_branch(
+                Path(path).relative_to(self.worktree_path), message
+            )
+
+    def _transfer_to_starting_branch(self, path: Path, message: str):
+        """ Take over the state of a path from the config branch
+
+        Only the path itself is written into the working tree of the source
+        dataset. Since the resulting commit has the same changes as the one on
+        the config branch, it is skipped when rebasing the config branch.
+        """
+
+        with utils.ChangeWorkingDir(self.dataset_path):
+            self._run_cmd(["git", "checkout", self.config_branch, "--",
+                           str(path)])
+            datalad.save(str(path), dataset=self.dataset_path,
+                         message=message, to_git=True)
+
     def determine_dir(self, section: str, option: str) -> Union[str, Path]:
         """ Get dir from datalad config """
 
-        config = datalad.Dataset(self.dataset_path).config
+        config = datalad.Dataset(self.worktree_path).config
 
         if config.has_option(section, option):
             configured_dir = Path(config.get(section + "." + option))
 
             if not configured_dir.is_absolute():
-                configured_dir = self.dataset_path/configured_dir
+                configured_dir = self.worktree_path/configured_dir
 
             return configured_dir
 
         return ""
 
     def remove_config_branch(self):
-        """ Remove the config branch """
+        """ Remove the config branch including its working tree """
         with utils.ChangeWorkingDir(self.dataset_path):
+            self.remove_worktree(self.worktree_path)
             super().remove_branch(self.config_branch)
+
+        self.is_rebased = False
+        self.has_subdatasets = False
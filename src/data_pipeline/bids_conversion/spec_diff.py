@@ -0,0 +1,172 @@
+""" Determine what has to be reconverted after a studyspec changed """
+
+from typing import Optional, Tuple
+
+# series with this tag are skipped by the hirni heuristic
+IGNORE_TAG = "hirni-dicom-converter-ignore"
+
+# The following mirrors the file naming of the hirni heuristic
+# (datalad_hirni/support/hirni_heuristic.py)
+
+# map the various guesses to the cannonical labels
+MODALITY_LABELS = {
+    "t1": "T1w",
+    "t1w": "T1w",
+    "t2": "T2w",
+    "t2w": "T2w",
+    "t1rho": "T1rho",
+    "t1map": "T1map",
+    "t2map": "T2map",
+    "t2star": "T2star",
+    "flair": "FLAIR",
+    "flash": "FLASH",
+    "pd": "PD",
+    "pdmap": "PDmap",
+    "pdt2": "PDT2",
+    "inplanet1": "inplaneT1",
+    "inplanet2": "inplaneT2",
+}
+
+# map the cannonical modality labels to data types
+DATA_TYPES = {
+    "bold": "func",
+    **{label: "anat" for label in [
+        "T1w", "T2w", "T1rho", "T1map", "T2map", "T2star", "FLAIR", "FLASH",
+        "PD", "PDmap", "PDT2", "inplaneT1", "inplaneT2", "angio"
+    ]},
+    "swi": "swi",
+    "dwi": "dwi",
+    **{label: "fmap" for label in [
+        "phasediff", "phase1", "phase2", "magnitude1", "magnitude2",
+        "fieldmap", "epi"
+    ]},
+}
+
+# the entities in file name order and the fixed suffixes per data type
+ENTITIES = {
+    "func": [("bids-task", "task"), ("bids-acquisition", "acq"),
+             ("bids-reconstruction_algorithm", "rec"), ("bids-run", "run"),
+             ("bids-echo", "echo")],
+    "anat": [("bids-acquisition", "acq"), ("bids-contrast_enhancement", "ce"),
+             ("bids-reconstruction_algorithm", "rec"), ("bids-run", "run")],
+    "dwi": [("bids-acquisition", "acq"), ("bids-run", "run")],
+    "swi": [("bids-acquisition", "acq"),
+            ("bids-reconstruction_algorithm", "rec"), ("bids-part", "part"),
+            ("bids-coil", "coil"), ("bids-echo", "echo"), ("bids-run", "run")],
+    "fmap": [("bids-acquisition", "acq"), ("bids-direction", "dir"),
+             ("bids-run", "run")],
+}
+SUFFIXES = {
+    "dwi": "dwi",
+    "swi": "GRE",
+}
+
+
+def _split_spec(spec: list) -> Tuple[dict, list]:
+    series = {}
+    other = []
+    for entry in spec:
+        if entry["type"] == "dicomseries":
+            series[entry["uid"]] = entry
+        else:
+            other.append(entry)
+
+    return series, other
+
+
+def get_series(spec: list) -> dict:
+    """ Get the dicomseries entries of a studyspec
+
+    Returns:
+        The entries by series uid.
+    """
+    return _split_spec(spec)[0]
+
+
+def diff_studyspec(old_spec: list, new_spec: list) -> Optional[set]:
+    """ Compare two versions of the studyspec of an acquisition
+
+    Args:
+        old_spec: The studyspec entries used for the last conversion.
+        new_spec: The current studyspec entries.
+    Returns:
+        The uids of the dicomseries which were added, removed or changed. None
+        if any other entry (e.g. dicomseries:all) changed, since then the
+        whole acquisition has to be converted again.
+    """
+
+    old_series, old_other = _split_spec(old_spec)
+    new_series, new_other = _split_spec(new_spec)
+
+    if old_other != new_other:
+        return None
+
+    return {uid for uid in old_series.keys() | new_series.keys()
+            if old_series.get(uid) != new_series.get(uid)}
+
+
+def _get_value(entry: dict, key: str):
+    value = entry.get(key)
+    if isinstance(value, dict):
+        return value.get("value")
+    return None
+
+
+def get_bids_stem(entry: dict, subject: str) -> Optional[str]:
+    """ Determine the output of a dicomseries entry
+
+    Args:
+        entry: The dicomseries entry of the studyspec.
+        subject: The subject label the data is converted to.
+    Returns:
+        The output path relative to the dataset and without extension, e.g.
+        sub-001/func/sub-001_task-rest_bold. None if the series is not
+        converted.
+    """
+
+    if IGNORE_TAG in (entry.get("tags") or []):
+        return None
+
+    modality = _get_value(entry, "bids-modality")
+    if not modality:
+        return None
+    modality = MODALITY_LABELS.get(modality, modality)
+
+    data_type = DATA_TYPES.get(modality)
+    if data_type is None:
+        return None
+
+    dirname = filename = "sub-{}".format(subject)
+    session = _get_value(entry, "bids-session")
+    if session:
+        dirname += "/ses-{}".format(session)
+        filename += "_ses-{}".format(session)
+
+    for key, entity in ENTITIES[data_type]:
+        value = _get_value(entry, key)
+        if value:
+            filename += "_{}-{}".format(entity, value)
+
+    filename += "_{}".format(SUFFIXES.get(data_type, modality))
+
+    return "{}/{}/{}".format(dirname, data_type, filename)
+
+
+def mark_unchanged(spec: list, changed: set) -> list:
+    """ Tag all unchanged dicomseries to be skipped by the converter
+
+    Args:
+        spec: The studyspec entries.
+        changed: The uids of the series to convert.
+    Returns:
+        A copy of the studyspec entries.
+    """
+
+    result = []
+    for entry in spec:
+        if entry["type"] == "dicomseries" and entry["uid"] not in changed:
+            entry = dict(entry)
+            entry["tags"] = list(entry.get("tags") or []) + [IGNORE_TAG]
+        result.append(entry)
+
+    return result
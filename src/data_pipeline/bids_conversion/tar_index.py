@@ -0,0 +1,252 @@
+""" Index of the DICOM series contained in a tarball
+
+Allows to import only the series the rule would convert.
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import tarfile
+import tempfile
+from typing import Iterator, Optional, Union
+
+import data_pipeline.utils as utils
+from . import rule_evaluation
+from .tarball import get_compressor, get_uncompressed_name
+
+try:
+    import pydicom
+    from pydicom.errors import InvalidDicomError
+    from pydicom.multival import MultiValue
+except ImportError:
+    pydicom = None
+
+
+def _header_to_dict(header) -> dict:
+    """ The header fields as the datalad DICOM extractor reports them """
+
+    fields = {}
+    for element in header:
+        if not element.keyword or element.VR in ["SQ", "OB", "OW", "UN"]:
+            continue
+
+        value = element.value
+        if isinstance(value, bytes):
+            continue
+        if isinstance(value, MultiValue):
+            value = [_to_json(item) for item in value]
+        else:
+            value = _to_json(value)
+        fields[element.keyword] = value
+
+    return fields
+
+
+def _to_json(value):
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    return str(value)
+
+
+def build_index(tarball: Union[str, Path]) -> dict:
+    """ Group the members of a tarball by DICOM series
+
+    The tarball is read once sequentially, for each file only the header is
+    parsed.
+
+    Returns:
+        A dict with the keys
+        series: Maps the SeriesInstanceUID to a dict with the header fields of
+            the first file of the series (metadata) and the member names
+            (members).
+        other: The names of all members which are no DICOM files.
+    """
+
+    if pydicom is None:
+        raise utils.NotPossible("Indexing tarballs requires pydicom")
+
+    index = {"series": {}, "other": []}
+    with tarfile.open(tarball, "r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+
+            try:
+                # members of a stream cannot be seeked in
+                header = pydicom.dcmread(
+                    io.BytesIO(tar.extractfile(member).read()),
+                    stop_before_pixels=True
+                )
+                uid = str(header.SeriesInstanceUID)
+            except (InvalidDicomError, AttributeError):
+                index["other"].append(member.name)
+                continue
+
+            if uid not in index["series"]:
+                index["series"][uid] = {
+                    "metadata": _header_to_dict(header),
+                    "members": []
+                }
+            index["series"][uid]["members"].append(member.name)
+
+    return index
+
+
+def get_index(tarball: Union[str, Path], sha256: str,
+              dataset_path: Union[str, Path],
+              log: logging.Logger) -> dict:
+    """ Get the index of a tarball, building it only once
+
+    The index is cached by the checksum of the original tarball in the git
+    directory shared by all worktrees of the dataset.
+
+    Args:
+        tarball: The tarball to index, e.g. the decompressed one.
+        sha256: The checksum of the original tarball.
+        dataset_path: The path of the source dataset.
+        log: a logging logger
+    """
+
+    cache_file = utils.get_git_path(
+        dataset_path, "data_pipeline/tar_index/{}.json".format(sha256), log,
+        common=True
+    )
+    if cache_file.exists():
+        return json.loads(cache_file.read_text())
+
+    log.info("Index %s", tarball)
+    index = build_index(tarball)
+
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_name(
+        "{}.{}.tmp".format(cache_file.name, os.getpid())
+    )
+    tmp_file.write_text(json.dumps(index))
+    os.replace(tmp_file, cache_file)
+
+    return index
+
+
+def get_members_to_import(index: dict,
+                          rule_file: Union[str, Path]) -> Optional[set]:
+    """ The members of all series the rule does not ignore, plus non DICOMs
+
+    Returns:
+        The member names or None if all series are kept.
+    """
+
+    rules = rule_evaluation.load_rules(rule_file)
+    series = list(index["series"].values())
+    entries = rule_evaluation.evaluate_rules(
+        rules, [series_info["metadata"] for series_info in series]
+    )
+
+    members = set(index["other"])
+    ignored = 0
+    for series_info, entry in zip(series, entries):
+        if "tags" in entry:
+            ignored += 1
+        else:
+            members.update(series_info["members"])
+
+    return members if ignored else None
+
+
+def write_filtered_tar(tarball: Union[str, Path], members: set,
+                       target: Union[str, Path]):
+    """ Copy the given members of a tarball into a new gzipped one
+
+    hirni stores the tarball in the annex of the acquisition, thus it is
+    compressed with pigz if installed.
+    """
+
+    with tarfile.open(tarball, "r|*") as tar, \
+            _open_gzipped_tar(target) as filtered:
+        for member in tar:
+            if member.isdir():
+                filtered.addfile(member)
+            elif member.name in members:
+                filtered.addfile(member, tar.extractfile(member))
+
+
+@contextlib.contextmanager
+def _open_gzipped_tar(target: Union[str, Path]) -> Iterator[tarfile.TarFile]:
+    compressor = get_compressor()
+    if compressor is None:
+        with tarfile.open(target, "w:gz", compresslevel=6) as tar:
+            yield tar
+        return
+
+    with Path(target).open("wb") as file_handle:
+        # pylint: disable=consider-using-with
+        proc = subprocess.Popen(compressor, stdin=subprocess.PIPE,
+                                stdout=file_handle, stderr=subprocess.PIPE)
+        try:
+            with tarfile.open(fileobj=proc.stdin, mode="w|") as tar:
+                yield tar
+        finally:
+            proc.stdin.close()
+            errors = proc.stderr.read()
+            proc.wait()
+
+    if proc.returncode:
+        raise utils.NotPossible("Compressing {} failed: {}".format(
+            target, errors.decode("utf-8")
+        ))
+
+
+@contextlib.contextmanager
+def select_series(tarball: Path, sha256: str, rule_file: Union[str, Path],
+                  dataset_path: Union[str, Path], log: logging.Logger,
+                  staging_dir: Union[str, Path] = None) -> Iterator[Path]:
+    """ Restrict a tarball to the series the rule would convert
+
+    If the tarball cannot be indexed or the rule fails, all series are
+    imported.
+
+    Args:
+        tarball: The tarball to import
+        sha256: The checksum of the original tarball
+        rule_file: The rule to apply
+        dataset_path: The path of the source dataset
+        log: a logging logger
+        staging_dir: Optional; Where to write the filtered tarball to.
+    Yields:
+        The path of the tarball to hand to hirni.
+    """
+
+    try:
+        index = get_index(tarball, sha256, dataset_path, log)
+        members = get_members_to_import(index, rule_file)
+    except Exception:  # pylint: disable=broad-except
+        log.warning("Selecting the series of %s failed, import all of them",
+                    tarball, exc_info=True)
+        members = None
+
+    if members is None:
+        yield tarball
+        return
+
+    if staging_dir is not None:
+        Path(staging_dir).mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(
+        tempfile.mkdtemp(prefix="select_", dir=staging_dir)
+    ).resolve()
+    try:
+        filtered = Path(tmp_dir, get_uncompressed_name(tarball) + ".gz")
+
+        log.info("Import %s of %s files of %s", len(members),
+                 len(index["other"]) + sum(
+                     len(series_info["members"])
+                     for series_info in index["series"].values()
+                 ), tarball)
+        write_filtered_tar(tarball, members, filtered)
+
+        yield filtered
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,160 @@
+""" Prepare incoming tarballs for the import """
+
+import contextlib
+import logging
+from pathlib import Path
+import shutil
+import subprocess
+import tempfile
+from typing import Iterator, Optional, Union
+
+import data_pipeline.utils as utils
+
+MAGIC_BYTES = {
+    "gzip": b"\x1f\x8b",
+    "bzip2": b"BZh",
+    "xz": b"\xfd7zXZ\x00",
+    "zstd": b"\x28\xb5\x2f\xfd",
+}
+
+# multithreaded decoders, in order of preference, for the compressions hirni
+# cannot extract itself
+DECOMPRESSORS = {
+    "zstd": [["zstd", "-T0", "-dc"]],
+}
+
+# hirni stores the tarball it imports in the annex of the acquisition, thus
+# it is compressed again, in order of preference
+COMPRESSORS = [["pigz", "-c"], ["gzip", "-c"]]
+
+SUFFIXES = [".gz", ".tgz", ".bz2", ".tbz2", ".xz", ".txz", ".zst", ".tzst"]
+
+
+def detect_compression(tarball: Union[str, Path]) -> Optional[str]:
+    """ Detect the compression of a file by its magic bytes
+
+    Returns:
+        The compression (one of MAGIC_BYTES) or None if the file is not
+        compressed in a known way.
+    """
+
+    with Path(tarball).open("rb") as file_handle:
+        header = file_handle.read(max(len(magic)
+                                      for magic in MAGIC_BYTES.values()))
+
+    for compression, magic in MAGIC_BYTES.items():
+        if header.startswith(magic):
+            return compression
+
+    return None
+
+
+def get_decompressor(compression: str) -> Optional[list]:
+    """ The command to decompress to stdout, None if none is installed """
+
+    for cmd in DECOMPRESSORS.get(compression, []):
+        if shutil.which(cmd[0]):
+            return cmd
+
+    return None
+
+
+def get_compressor() -> Optional[list]:
+    """ The command to gzip stdin to stdout, None if none is installed """
+
+    for cmd in COMPRESSORS:
+        if shutil.which(cmd[0]):
+            return cmd
+
+    return None
+
+
+def get_uncompressed_name(tarball: Path) -> str:
+    """ The name of a tarball without compression suffix """
+
+    name = tarball.name
+    for suffix in SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+
+    if not name.endswith(".tar"):
+        name += ".tar"
+
+    return name
+
+
+@contextlib.contextmanager
+def stage_tarball(tarball: Union[str, Path], log: logging.Logger,
+                  staging_dir: Union[str, Path] = None) -> Iterator[Path]:
+    """ Convert a tarball hirni cannot extract into a gzipped one
+
+    hirni copies the tarball it is given into the annex of the acquisition.
+    Thus tarballs it can extract itself are used as they are, only the
+    others are decompressed with a multithreaded decoder and compressed with
+    gzip again. The result is written to a temporary directory which is
+    removed on exit.
+
+    Args:
+        tarball: The tarball to import
+        log: a logging logger
+        staging_dir: Optional; Where to write the converted tarball to,
+            preferably on fast local scratch. Defaults to the system temporary
+            directory.
+    Yields:
+        The path of the tarball to hand to hirni.
+    Raises:
+        NotPossible: If the tarball has a compression hirni cannot extract and
+            no decoder or gzip is installed, or the conversion failed.
+    """
+
+    tarball = Path(tarball)
+    compression = detect_compression(tarball)
+
+    if compression not in DECOMPRESSORS:
+        yield tarball
+        return
+
+    decompressor = get_decompressor(compression)
+    compressor = get_compressor()
+    if decompressor is None or compressor is None:
+        raise utils.NotPossible(
+            "Converting {} requires {} and gzip to be installed".format(
+                tarball, DECOMPRESSORS[compression][0][0]
+            )
+        )
+
+    if staging_dir is not None:
+        Path(staging_dir).mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(
+        tempfile.mkdtemp(prefix="import_", dir=staging_dir)
+    ).resolve()
+    try:
+        staged_tarball = Path(tmp_dir,
+                              get_uncompressed_name(tarball) + ".gz")
+
+        log.info("Convert %s (%s) with %s and %s", tarball, compression,
+                 decompressor[0], compressor[0])
+        with staged_tarball.open("wb") as file_handle:
+            # pylint: disable=consider-using-with
+            decompress = subprocess.Popen(decompressor + [str(tarball)],
+                                          stdout=subprocess.PIPE,
+                                          stderr=subprocess.PIPE)
+            compress = subprocess.Popen(compressor, stdin=decompress.stdout,
+                                        stdout=file_handle,
+                                        stderr=subprocess.PIPE)
+            # allow decompress to receive a SIGPIPE if compress exits
+            decompress.stdout.close()
+            _, compress_errors = compress.communicate()
+            _, decompress_errors = decompress.communicate()
+
+        if decompress.returncode or compress.returncode:
+            log.debug("stderr: %s", (decompress_errors
+                                     + compress_errors).decode("utf-8"))
+            raise utils.NotPossible(
+                "Converting {} failed".format(tarball)
+            )
+
+        yield staged_tarball
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
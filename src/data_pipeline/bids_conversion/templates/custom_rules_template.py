@@ -29,5 +29,27 @@ class MyDICOM2SpecRules(RulesBase):
             # 'bids-run': run,
         }
 
+    # Additionally, the values of all series can be derived at once, which is
+    # faster for acquisitions with many series. `table` maps each DICOM field
+    # to the list of its values, one per series, e.g.
+    #
+    # def _batch_rules(self, table, subject=None, anon_subject=None,
+    #                  session=None):
+    #     is_bold = table.matches('SeriesDescription', 'bold|fmri')
+    #     return [
+    #         {
+    #             'description': description,
+    #             'subject': subject or patient_id,
+    #             'anon-subject': anon_subject or None,
+    #             'bids-session': session or None,
+    #             'bids-modality': 'bold' if bold else None,
+    #         }
+    #         for description, patient_id, bold in zip(
+    #             table.column('SeriesDescription', ""),
+    #             table.column('PatientID'),
+    #             is_bold
+    #         )
+    #     ]
+
 
 __datalad_hirni_rules = MyDICOM2SpecRules
@@ -1,6 +1,60 @@
 """Custom rules for dicom2spec"""
 
 import abc
+import collections.abc
+import re
+
+
+class SeriesTable(collections.abc.Mapping):
+    """ The metadata of all series in columnar form
+
+    Maps each DICOM field to a list of values, one per series in the order of
+    the series. Series which do not have a field get None.
+    """
+
+    def __init__(self, dicommetadata):
+        self.n_series = len(dicommetadata)
+
+        fields = {}
+        for series_dict in dicommetadata:
+            fields.update(dict.fromkeys(series_dict))
+
+        self._columns = {
+            field: [series_dict.get(field) for series_dict in dicommetadata]
+            for field in fields
+        }
+
+    def __getitem__(self, field):
+        return self._columns[field]
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def column(self, field, default=None):
+        """ The values of a field, default for series missing it """
+        if field not in self._columns:
+            return [default] * self.n_series
+        return [default if value is None else value
+                for value in self._columns[field]]
+
+    def equals(self, field, value):
+        """ Per series: Is the field equal to value """
+        return [entry == value for entry in self.column(field)]
+
+    def contains(self, field, value):
+        """ Per series: Does the field (string or list) contain value """
+        return [entry is not None and value in entry
+                for entry in self.column(field)]
+
+    def matches(self, field, pattern, flags=0):
+        """ Per series: Does the regular expression match the field """
+        regex = re.compile(pattern, flags)
+        return [entry is not None and regex.search(str(entry)) is not None
+                for entry in self.column(field)]
+
 
 class RulesBase(abc.ABC):
 
@@ -24,22 +78,67 @@ class RulesBase(abc.ABC):
         -------
         list of tuple (dict, bool)
         """
-        spec_dicts = []
-        for dicom_dict in self._dicom_series:
-            rules = self._rules(
+        table = SeriesTable(self._dicom_series)
+
+        spec_dicts = self._batch_rules(
+            table,
+            subject=subject,
+            anon_subject=anon_subject,
+            session=session
+        )
+
+        is_valid = self._batch_series_is_valid(table)
+
+        if not len(spec_dicts) == len(is_valid) == len(self._dicom_series):
+            raise ValueError("Rules have to return one result per series")
+
+        return list(zip(spec_dicts, is_valid))
+
+    def _batch_rules(self, table, subject=None, anon_subject=None,
+                     session=None):
+        """ Derive the spec values of all series at once
+
+        By default _rules is applied to each series. Override this to work on
+        whole columns instead, e.g. table.matches("SeriesDescription", "bold")
+        instead of matching each series separately.
+
+        Parameters
+        ----------
+        table: SeriesTable
+            the metadata of all series
+
+        Returns
+        -------
+        list of dict, one per series
+        """
+        return [
+            self._rules(
                 dicom_dict,
                 subject=subject,
                 anon_subject=anon_subject,
                 session=session
             )
-            is_valid = self.series_is_valid(dicom_dict)
-            spec_dicts.append((rules, is_valid))
-        return spec_dicts
+            for dicom_dict in self._dicom_series
+        ]
 
     @abc.abstractmethod
     def _rules(self, series_dict, subject=None, anon_subject=None,
                session=None):
         pass
 
+    def _batch_series_is_valid(self, table):
+        """ Per series: Should it be converted
+
+        Returns
+        -------
+        list of bool, one per series
+        """
+        if type(self).series_is_valid is not RulesBase.series_is_valid:
+            # respect a customized check per series
+            return [self.series_is_valid(dicom_dict)
+                    for dicom_dict in self._dicom_series]
+
+        return [name != 'ExamCard' for name in table.column('ProtocolName')]
+
     def series_is_valid(self, series_dict):
         return series_dict['ProtocolName'] != 'ExamCard'
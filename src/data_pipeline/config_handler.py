@@ -1,5 +1,7 @@
 """ Implements a singleton for the config handling"""
 
+import copy
+from pathlib import Path
 from typing import Any
 
 import jsonschema
@@ -31,6 +33,9 @@ class ConfigHandler():
             "properties": {},
             "required": []
         }
+        # (config file, file content, schema, parsed config) of the last
+        # successful read
+        self._cache = None
         self.config = self.get()
 
     @staticmethod
@@ -55,6 +60,7 @@ class ConfigHandler():
 
         self.schema["properties"][module] = schema
         self.schema["required"].append(module)
+        self._cache = None
 
     def validate(self, config: dict = None, module: str = None,
                  schema: dict = None):
@@ -91,6 +97,9 @@ class ConfigHandler():
     def get(self, module: str = None) -> dict:
         """ Reads the configuration from the config file
 
+        Parsing and validation is skipped if neither the config file nor the
+        schema changed since the last call.
+
         Args:
             module: Optional; The module of which the configuration should be
                 loaded.
@@ -98,8 +107,18 @@ class ConfigHandler():
             Either the whole configuration or if module is set, only the
             configuration of the module.
         """
-        self.config = utils.get_config(filename=self.config_file)
-        self.validate()
+        content = Path(self.config_file).read_text()
+        if (self._cache is not None
+                and self._cache[:3] == (self.config_file, content,
+                                        self.schema)):
+            # callers are allowed to modify what they get
+            self.config = copy.deepcopy(self._cache[3])
+        else:
+            self.config = utils.get_config(filename=self.config_file)
+            self.validate()
+            self._cache = (self.config_file, content,
+                           copy.deepcopy(self.schema),
+                           copy.deepcopy(self.config))
 
         if module is not None:
             return self.config[module]
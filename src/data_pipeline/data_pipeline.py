@@ -65,9 +65,20 @@ def _setup_logging(project):
               help="Prepares and configure the BIDS conversion")
 @click.option("--run", is_flag=True,
               help="Run the BIDS conversion")
-def main(setup, project, configure, run):
+@click.option("--maintain", is_flag=True,
+              help=("Run repository maintenance on the datasets. Combined "
+                    "with --run it is done after the conversion"))
+@click.option("--full", is_flag=True,
+              help=("Do a full instead of an incremental maintenance "
+                    "(repack, prune, hardlink identical annex objects). "
+                    "Requires --maintain"))
+def main(setup, project, configure, run, maintain, full):
     """ Execute data-pipeline """
 
+    if full and not maintain:
+        logging.error("--full can only be used together with --maintain")
+        sys.exit(2)
+
     # also relative paths like ../<my_project_dir> are allowed
     project = Path(project).resolve()
 
@@ -107,6 +118,9 @@ def main(setup, project, configure, run):
     if run:
         bids_conversion.run(project)
 
+    if maintain:
+        bids_conversion.maintain(project, full=full)
+
 
 if __name__ == "__main__":
     main()  # pylint: disable=no-value-for-parameter
@@ -1,17 +1,139 @@
 """ Baisc git commands """
 
+import contextlib
+import os
 from pathlib import Path
+from typing import Union
 
 import data_pipeline.utils as utils
 
 
+class GitStatus():
+    """ Snapshot of the state of the repository in the current directory
+
+    All information is gathered with a fixed number of git calls. Afterwards
+    branch, tracking and change queries are answered from memory.
+    """
+
+    def __init__(self, log):
+        self.toplevel = Path(utils.run_cmd(
+            ["git", "rev-parse", "--show-toplevel"], log
+        ).rstrip())
+
+        self.branches = set(utils.run_cmd(
+            ["git", "for-each-ref", "--format=%(refname:short)",
+             "refs/heads"], log
+        ).split())
+
+        self.current_branch = ""
+        # paths with changes in the working tree compared to the index
+        self.changed = set()
+        self._parse_status(utils.run_cmd(
+            ["git", "status", "--porcelain=v2", "--branch", "-z",
+             "--untracked-files=no"], log
+        ))
+
+        self.tracked = set(utils.run_cmd(
+            ["git", "ls-files", "-z"], log
+        ).split("\0")) - {""}
+        # directories count as tracked as soon as they contain tracked files
+        self.tracked_dirs = {str(parent)
+                             for path in self.tracked
+                             for parent in Path(path).parents}
+
+    def _parse_status(self, output: str):
+        entries = iter(output.split("\0"))
+        for entry in entries:
+            if entry.startswith("# branch.head "):
+                branch = entry[len("# branch.head "):]
+                if branch != "(detached)":
+                    self.current_branch = branch
+            elif entry[:2] in ("1 ", "2 ", "u "):
+                fields = entry.split(" ")
+                # ordinary: 1 XY sub mH mI mW hH hI path
+                # renamed:  2 XY sub mH mI mW hH hI Xscore path<NUL>origPath
+                # unmerged: u XY sub m1 m2 m3 mW h1 h2 h3 path
+                n_fields = {"1": 8, "2": 9, "u": 10}[entry[0]]
+                path = " ".join(fields[n_fields:])
+                if entry[0] == "2":
+                    # skip the original path of the rename
+                    next(entries, None)
+
+                worktree_status = fields[1][1]
+                if worktree_status != ".":
+                    self.changed.add(path)
+
+    def relative_path(self, path: Union[str, Path]) -> str:
+        """ Get the path relative to the top level of the repository
+
+        Args:
+            path: An absolute path or one relative to the current directory.
+        """
+        path = Path(path)
+        if not path.is_absolute():
+            path = Path.cwd()/path
+
+        # do not resolve the path itself since it might be an annex symlink
+        path = Path(os.path.realpath(path.parent), path.name)
+        return path.relative_to(self.toplevel).as_posix()
+
+    def is_tracked(self, path: Union[str, Path]) -> bool:
+        """ Check if a path (or anything underneath it) is tracked """
+        path = self.relative_path(path)
+        return path in self.tracked or path in self.tracked_dirs
+
+    def was_changed(self, path: Union[str, Path]) -> bool:
+        """ Check if a path (or anything underneath it) has changed """
+        path = self.relative_path(path)
+        if path == ".":
+            return bool(self.changed)
+
+        prefix = path + "/"
+        return any(changed == path or changed.startswith(prefix)
+                   for changed in self.changed)
+
+
 class GitBase():
     """ basic git command """
 
     def __init__(self):
         self.log = utils.get_logger(__class__)  # type: ignore
 
+        self._use_snapshot = False
+        self._status = None
+
+    @contextlib.contextmanager
+    def status_snapshot(self):
+        """ Answer all status queries inside of the context from a snapshot
+
+        The snapshot is taken on the first query. Changes done through this
+        class invalidate it, other changes to the repository (e.g. by datalad)
+        are not noticed while the context is active.
+        """
+        self._use_snapshot = True
+        try:
+            yield
+        finally:
+            self._use_snapshot = False
+            self._status = None
+
+    def _get_status(self) -> Union[GitStatus, None]:
+        if not self._use_snapshot:
+            return None
+
+        if self._status is None:
+            self._status = GitStatus(self.log)
+
+        return self._status
+
+    def _invalidate_status(self):
+        self._status = None
+
     def _get_current_branch(self):
+        status = self._get_status()
+        if status is not None:
+            return status.current_branch
+
         return self._run_cmd(["git", "branch", "--show-current"])
 
     def checkout_branch(self, branch, rebase_branch="", do_create=False):
@@ -35,10 +157,10 @@ class GitBase():
                            "-> create and switch", branch)
             cmd = ["git", "checkout", "-b", branch]
 
+        self._invalidate_status()
         self._run_cmd(cmd)
 
-    @staticmethod
-    def check_if_branch_exists(branch: str) -> bool:
+    def check_if_branch_exists(self, branch: str) -> bool:
         """ Check if a branch exists
 
         Args:
@@ -46,6 +168,10 @@ class GitBase():
         Returns:
             True if the branch exists and False if not.
         """
+        status = self._get_status()
+        if status is not None:
+            return branch in status.branches
+
         return utils.check_cmd(
             ["git", "show-ref", "--verify", "--quiet",
              "refs/heads/" + branch]
@@ -68,10 +194,10 @@ class GitBase():
             cmd = ["git", "stash"]
 
         # do not react on exceptions
+        self._invalidate_status()
         utils.check_cmd(cmd)
 
-    @staticmethod
-    def was_changed(path: str) -> bool:
+    def was_changed(self, path: str) -> bool:
         """ Check if a file has changed,
 
         Args:
@@ -82,13 +208,16 @@ class GitBase():
         if not Path(path).exists():
             return False
 
+        status = self._get_status()
+        if status is not None:
+            return status.was_changed(path)
+
         cmd = ["git", "diff", "--exit-code", path]
         # check_cmd returns True if no exception was thrown, but in this case
         # an exception means, that path was changed
         return not utils.check_cmd(cmd)
 
-    @staticmethod
-    def is_tracked(path: str) -> bool:
+    def is_tracked(self, path: str) -> bool:
         """ Check if a path is tracked in git
 
         Args:
@@ -105,15 +234,80 @@ class GitBase():
 #            self.log.error(msg)
 #             raise Exception(msg)
 
+        status = self._get_status()
+        if status is not None:
+            return status.is_tracked(path)
+
         cmd = ["git", "ls-files", "--error-unmatch", path]
         return utils.check_cmd(cmd)
 
-    @staticmethod
-    def remove_branch(branch: str):
+    def create_branch(self, branch: str, start_point: str = ""):
+        """ Create a branch without switching to it
+
+        Args:
+            branch: The name of the branch to create
+            start_point: Optional; The commit or branch the new branch should
+                start from. Defaults to the current HEAD.
+        """
+        cmd = ["git", "branch", branch]
+        if start_point:
+            cmd.append(start_point)
+
+        self._invalidate_status()
+        self._run_cmd(cmd)
+
+    def add_worktree(self, path: Union[str, Path], branch: str):
+        """ Check out a branch in an additional working tree
+
+        Args:
+            path: The directory of the new working tree
+            branch: The (existing) branch to check out there
+        """
+        # clean up registrations of working trees which were deleted manually
+        utils.check_cmd(["git", "worktree", "prune"])
+
+        self._run_cmd(["git", "worktree", "add", str(path), branch])
+
+    def remove_worktree(self, path: Union[str, Path]):
+        """ Remove an additional working tree
+
+        `git worktree remove` refuses to remove working trees containing
+        submodules (i.e. datalad subdatasets), thus the directory is deleted
+        and the registration pruned afterwards.
+
+        Args:
+            path: The directory of the working tree
+        """
+        if Path(path).exists():
+            utils.remove_tree(path)
+
+        self._invalidate_status()
+        utils.check_cmd(["git", "worktree", "prune"])
+
+    def rebase(self, branch: str) -> bool:
+        """ Rebase the current branch onto another one
+
+        In case of conflicts the rebase is aborted.
+
+        Args:
+            branch: The branch to rebase onto
+        Returns:
+            True if the rebase succeeded, False otherwise
+        """
+        self._invalidate_status()
+        if utils.check_cmd(["git", "rebase", "--autostash", branch]):
+            return True
+
+        self.log.warning("Rebase onto %s failed, abort it", branch)
+        utils.check_cmd(["git", "rebase", "--abort"])
+        return False
+
+    def remove_branch(self, branch: str):
         """ Remove a branch
 
         Args:
             branch: The branch to remove
         """
+        self._invalidate_status()
         cmd = ["git", "branch", "-D", branch]
         utils.check_cmd(cmd)
@@ -0,0 +1,163 @@
+""" Repository maintenance for long-lived datasets """
+
+import os
+from pathlib import Path
+import stat
+from typing import Union
+
+import datalad.api as datalad
+
+import data_pipeline.utils as utils
+
+
+class DatasetMaintenance():
+    """ Keeps the repositories of a dataset and its subdatasets fast
+
+    The many small commits created during import and conversion, as well as
+    loose objects, slow down every git operation over time.
+    """
+
+    def __init__(self, dataset_path: Union[str, Path]):
+        self.log = utils.get_logger(__class__)  # type: ignore
+        self.dataset_path = Path(dataset_path)
+
+    def run(self, full: bool = False):
+        """ Maintain the dataset and all installed subdatasets
+
+        Args:
+            full: Optional; If False only cheap incremental tasks are run,
+                which is suitable after every conversion run. Otherwise
+                everything is repacked, unreachable objects are pruned and
+                identical annex objects are hardlinked.
+        """
+
+        for repo in self._get_repositories():
+            self.log.info("Maintain %s (%s)", repo,
+                          "full" if full else "incremental")
+            if full:
+                self._full(repo)
+            else:
+                self._incremental(repo)
+
+        if full:
+            self.dedupe_annex_objects()
+
+    def dedupe_annex_objects(self) -> int:
+        """ Hardlink identical annex objects of different repositories
+
+        The same DICOM files imported as several acquisitions end up in
+        separate subdatasets and with it in separate annexes. Since annex
+        keys of checksum backends identify the content, objects with the same
+        key can share their storage.
+
+        Returns:
+            The number of bytes reclaimed.
+        """
+
+        objects = {}
+        linked = 0
+        reclaimed = 0
+        for repo in self._get_repositories():
+            if not self._is_annex(repo) or self._is_thin(repo):
+                # in thin mode the objects are hardlinked to the worktree
+                # and thus not immutable
+                continue
+
+            object_dir = utils.get_git_path(repo, "annex/objects", self.log)
+            for path in object_dir.glob("*/*/*/*"):
+                key = path.name
+                if path.parent.name != key or not self._has_checksum(key):
+                    continue
+
+                path_stat = path.stat()
+                if key not in objects:
+                    objects[key] = (path, path_stat)
+                    continue
+
+                original, original_stat = objects[key]
+                if (original_stat.st_dev != path_stat.st_dev
+                        or original_stat.st_ino == path_stat.st_ino
+                        or original_stat.st_size != path_stat.st_size):
+                    continue
+
+                self._replace_with_link(original, path)
+                linked += 1
+                reclaimed += path_stat.st_size
+
+        self.log.info("Hardlinked %s duplicate annex objects, reclaimed %s",
+                      linked, utils.format_size(reclaimed))
+        return reclaimed
+
+    @staticmethod
+    def _has_checksum(key: str) -> bool:
+        # e.g. SHA256E-s1234--<checksum>.dcm, WORM and URL keys only
+        # identify the file name or its location
+        backend = key.split("-", 1)[0]
+        return backend not in ["WORM", "URL", "VURL"]
+
+    @staticmethod
+    def _replace_with_link(original: Path, path: Path):
+        # the object directories are write protected by git-annex
+        mode = path.parent.stat().st_mode
+        os.chmod(path.parent, mode | stat.S_IWUSR)
+        try:
+            tmp_path = path.with_name(path.name + ".dedupe")
+            os.link(original, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            os.chmod(path.parent, mode)
+
+    def _get_repositories(self) -> list:
+        subdatasets = datalad.subdatasets(
+            dataset=str(self.dataset_path),
+            recursive=True,
+            state="present",
+            result_xfm="paths",
+            result_renderer="disabled"
+        )
+        return [self.dataset_path] + [Path(path) for path in subdatasets]
+
+    def _git(self, repo: Path, args: list):
+        utils.run_cmd(["git", "-C", str(repo)] + args, self.log,
+                      error_message="Maintenance of {} failed".format(repo))
+
+    def _incremental(self, repo: Path):
+        """ Cheap tasks which only touch new objects """
+
+        # loose-objects: pack loose objects into a new pack
+        # commit-graph: add new commits to the commit-graph
+        self._git(repo, ["maintenance", "run",
+                         "--task=loose-objects",
+                         "--task=commit-graph"])
+
+        # the packs written by the loose-objects task are not seen when
+        # running in the same call and without any pack the task fails
+        if self._has_packs(repo):
+            # combine small packs via the multi-pack-index
+            self._git(repo, ["maintenance", "run",
+                             "--task=incremental-repack"])
+
+    def _full(self, repo: Path):
+        """ Repack everything and clean up """
+
+        # repacks all objects, prunes unreachable ones which are older than
+        # gc.pruneExpire and packs the refs
+        self._git(repo, ["gc", "--quiet"])
+        self._git(repo, ["commit-graph", "write", "--reachable"])
+
+    def _has_packs(self, repo: Path) -> bool:
+        pack_dir = utils.get_git_path(repo, "objects/pack", self.log)
+        return any(pack_dir.glob("*.pack"))
+
+    @staticmethod
+    def _is_annex(repo: Path) -> bool:
+        return utils.check_cmd(
+            ["git", "-C", str(repo), "config", "annex.uuid"]
+        )
+
+    def _is_thin(self, repo: Path) -> bool:
+        return utils.run_cmd(
+            ["git", "-C", str(repo), "config", "--type=bool",
+             "--default=false", "annex.thin"],
+            self.log
+        ).strip() == "true"
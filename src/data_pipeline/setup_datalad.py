@@ -1,7 +1,13 @@
 """ Converts tar ball into bids compatible dataset using datalad and hirni"""
 
+import concurrent.futures
+import hashlib
+import json
+import os
 from pathlib import Path
-from typing import Union
+import tempfile
+from typing import Tuple, Union
+import uuid
 
 import datalad.api as datalad
 
@@ -9,6 +15,26 @@ import data_pipeline.utils as utils
 from data_pipeline.config_handler import ConfigHandler
 
 
+# git and git-annex settings which keep status and save fast in datasets
+# with many files
+PERFORMANCE_CONFIG = {
+    # index version 4 and untracked cache
+    "feature.manyFiles": "true",
+    "core.untrackedCache": "true",
+    # only write the changed part of the index
+    "core.splitIndex": "true",
+    "core.commitGraph": "true",
+    "fetch.writeCommitGraph": "true",
+    "gc.writeCommitGraph": "true",
+    # transfer annexed content in parallel
+    "annex.jobs": "cpus",
+}
+
+
+# dataset configuration option to record the hashes of applied patches
+APPLIED_PATCHES_OPTION = "data-pipeline.patches.applied"
+
+
 def get_dataset_path(project_dir: Union[Path, str],
                      dataset_name: Union[Path, str]) -> Path:
     """ Creates the dataset full path
@@ -22,6 +48,37 @@ def get_dataset_path(project_dir: Union[Path, str],
     return Path(project_dir, dataset_name).expanduser()
 
 
+def setup_datasets(setups: list):
+    """ Set up multiple independent datasets concurrently
+
+    Every dataset is set up in its own process since the setup changes the
+    working directory. Datasets which already exist are only updated.
+
+    Args:
+        setups: The SetupDatalad instances to run
+    """
+
+    to_create = []
+    for setup in setups:
+        if setup.dataset_path.exists():
+            setup.update()
+        else:
+            to_create.append(setup)
+
+    if len(to_create) < 2:
+        for setup in to_create:
+            setup.run()
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=len(to_create)) as executor:
+        futures = [executor.submit(setup.run) for setup in to_create]
+
+        # raises the exception of a failed setup after all are done
+        for future in futures:
+            future.result()
+
+
 class SetupDatalad():
     """ Set up a datalad dataset and preconfigure it"""
 
@@ -52,7 +109,10 @@ class SetupDatalad():
                 "dataset_name": {"type": "string"},
                 "setup_procedures": {"type": "array"},
                 "patches": {"type": "array"},
-                "add_gitignore": {"type": "boolean"}
+                "add_gitignore": {"type": "boolean"},
+                "performance_tuning": {"type": "boolean"},
+                "git_config": {"type": "object"},
+                "template_cache": {"type": ["string", "null"]}
             },
             "required": ["dataset_name", "setup_procedures"]
         }
@@ -63,6 +123,10 @@ class SetupDatalad():
         # set default values for optional parameters
         config["patches"] = config.get("patches", [])
         config["add_gitignore"] = config.get("add_gitignore", False)
+        config["performance_tuning"] = config.get("performance_tuning",
+                                                  False)
+        config["git_config"] = config.get("git_config", {})
+        config["template_cache"] = config.get("template_cache", None)
 
         return config
 
@@ -73,25 +137,29 @@ class SetupDatalad():
             raise Exception("ERROR: dataset under {} already exists"
                             .format(self.dataset_path))
 
+        if self.config["template_cache"]:
+            self._clone_from_template()
+            return
+
         self.log.info("Create dataset %s", self.dataset_path)
 
         try:
-            procs = self.config["setup_procedures"]
-            # IMPORTANT: name of the procedure differs depending if it is an
-            # argument for create or used in run_procedure:
-            # create and command line use: hirni
-            # run_procedure use full name: cfg_hirni
-#            prefix = "cfg_"
-#            proc = proc[len(prefix):] if proc.startswith(prefix) else proc
-#            with utils.ChangeWorkingDir(self.project_dir):
-#                utils.check_cmd(
-#                    ["datalad", "create",
-#                     "-c", proc,
-#                     self.dataset_path]
-#                )
-#            self.dataset = datalad.Dataset(self.dataset_path)
-
-            self.dataset = datalad.create(str(self.dataset_path))
+            cfg_procs, procs = self._split_setup_procedures()
+
+            # the configuration procedures are run by create itself in the
+            # same process instead of a separate datalad process each
+            if cfg_procs:
+                self.log.info("Run %s", ", ".join(cfg_procs))
+            self.dataset = datalad.create(
+                str(self.dataset_path),
+                # IMPORTANT: name of the procedure differs depending if it is
+                # an argument for create or used in run_procedure:
+                # create and command line use: hirni
+                # run_procedure use full name: cfg_hirni
+                cfg_proc=[proc[len("cfg_"):] for proc in cfg_procs]
+            )
+            self._tune_repository()
+
             for spec in procs:
                 # use command line to suppress output
                 self.log.info("Run %s", spec)
@@ -112,27 +180,224 @@ class SetupDatalad():
 
             self._commit_hirni_patches()
 
+            if self.config["performance_tuning"]:
+                self._write_commit_graph()
+
         except Exception:
             self.log.error("Some error occurred", exc_info=True)
             self._remove_all()
             raise
 
-    def _apply_patches(self):
+    def _split_setup_procedures(self) -> Tuple[list, list]:
+        """ Determine which setup procedures can be run by create
 
-        # for readability
-        patches = self.config["patches"]
+        Only configuration procedures (cfg_*) can be handed to create. To
+        keep the order of the procedures only the leading ones are used.
 
-        if not patches:
-            self.log.debug("No patches to apply")
+        Returns:
+            A tuple of the procedures to be run by create and the remaining
+            ones.
+        """
+        procs = self.config["setup_procedures"]
+
+        n_cfg_procs = 0
+        for proc in procs:
+            if not proc.startswith("cfg_"):
+                break
+            n_cfg_procs += 1
+
+        return procs[:n_cfg_procs], procs[n_cfg_procs:]
+
+    def _tune_repository(self):
+        """ Apply git and git-annex settings to the new dataset
+
+        The settings are only stored in the local repository configuration and
+        are thus not shared with clones of the dataset.
+        """
+
+        git_config = {}
+        if self.config["performance_tuning"]:
+            git_config.update(PERFORMANCE_CONFIG)
+        # explicitly configured options take precedence
+        git_config.update(self.config["git_config"])
+
+        if not git_config:
             return
 
-        self.log.debug("patches %s", patches)
-        for patch in patches:
+        config = self.dataset.config
+        for option, value in git_config.items():
+            if isinstance(value, bool):
+                value = str(value).lower()
+            self.log.debug("Set %s=%s", option, value)
+            config.set(option, str(value), where="local", reload=False)
+
+        config.reload()
+
+    def _write_commit_graph(self):
+        """ Write the commit-graph to speed up history traversal """
+        utils.run_cmd(
+            ["git", "-C", str(self.dataset_path), "commit-graph", "write",
+             "--reachable"],
+            self.log,
+            error_message="Failed to write commit-graph"
+        )
+
+    def _get_template_key(self) -> str:
+        """ Identifies datasets which are set up in the same way
+
+        Local repository settings (e.g. performance_tuning) are not part of
+        the key since they are not passed on by cloning.
+        """
+        key = {
+            "setup_procedures": self.config["setup_procedures"],
+            "patches": [hashlib.sha256(patch.read_bytes()).hexdigest()
+                        for patch in self._get_patch_files()],
+            "add_gitignore": self.config["add_gitignore"],
+        }
+
+        return hashlib.sha256(
+            json.dumps(key, sort_keys=True).encode("utf-8")
+        ).hexdigest()
 
+    def _build_template(self, template_path: Path):
+        """ Set up a dataset to be used as template
+
+        The dataset is set up in a temporary location first, such that an
+        interrupted setup does not leave a broken template behind.
+        """
+        self.log.info("Set up template dataset %s", template_path)
+        template_path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_dir = Path(tempfile.mkdtemp(dir=template_path.parent))
+        config = dict(self.config, dataset_name=template_path.name,
+                      template_cache=None)
+        try:
+            SetupDatalad(tmp_dir, config).run()
+            try:
+                os.rename(tmp_dir/template_path.name, template_path)
+            except OSError:
+                # the same template was built in parallel
+                if not template_path.exists():
+                    raise
+        finally:
+            utils.remove_tree(tmp_dir)
+
+    def _clone_from_template(self):
+        """ Create the dataset by cloning a pre-configured template dataset
+
+        The template is set up on first usage and reused afterwards.
+        """
+
+        template_path = Path(self.config["template_cache"],
+                             self._get_template_key()).expanduser()
+        if not template_path.exists():
+            self._build_template(template_path)
+
+        self.log.info("Create dataset %s from template %s",
+                      self.dataset_path, template_path)
+        try:
+            self.dataset = datalad.clone(source=str(template_path),
+                                         path=str(self.dataset_path),
+                                         result_renderer="disabled")
+
+            # install the subdatasets (e.g. the hirni toolbox) from the
+            # template as well
+            datalad.get(path=str(self.dataset_path),
+                        dataset=str(self.dataset_path),
+                        recursive=True, get_data=False,
+                        result_renderer="disabled")
+
+            repos = [self.dataset_path] + [
+                Path(path) for path in datalad.subdatasets(
+                    dataset=str(self.dataset_path), recursive=True,
+                    state="present", result_xfm="paths",
+                    result_renderer="disabled"
+                )
+            ]
+            for repo in repos:
+                # annexed content got from the template is hardlinked (or
+                # reflinked) instead of copied where the filesystem allows it
+                utils.run_cmd(["git", "-C", str(repo), "config",
+                               "annex.hardlink", "true"], self.log)
+
+            # a new project must not be mistaken for the template
+            self.dataset.config.set("datalad.dataset.id", str(uuid.uuid4()),
+                                    where="dataset")
+            datalad.save(path=self.dataset_path/".datalad"/"config",
+                         dataset=self.dataset_path,
+                         message="Assign new dataset id")
+            utils.run_cmd(["git", "-C", str(self.dataset_path), "remote",
+                           "rename", "origin", "template"], self.log)
+
+            self._tune_repository()
+            if self.config["performance_tuning"]:
+                self._write_commit_graph()
+
+        except Exception:
+            self.log.error("Some error occurred", exc_info=True)
+            self._remove_all()
+            raise
+
+    def _get_patch_files(self) -> list:
+        """ Get the absolute paths of the configured patches """
+
+        patch_files = []
+        for patch in self.config["patches"]:
             patch = patch.format(
                 data_pipeline_path=Path(__file__).parent.absolute()
             )
             patch = Path(patch).expanduser()  # to be able to cope with ~
+            patch_files.append(patch)
+
+        return patch_files
+
+    def update(self):
+        """ Bring an existing dataset up to date with the configuration
+
+        Patches which were added to the configuration after the dataset was
+        set up are applied.
+        """
+        self.dataset = datalad.Dataset(self.dataset_path)
+
+        if self._apply_patches():
+            self._commit_hirni_patches()
+
+    def _get_applied_patches(self) -> list:
+        """ Get the hashes of the patches already applied to the dataset """
+        applied_patches = self.dataset.config.get(APPLIED_PATCHES_OPTION,
+                                                  default=(), get_all=True)
+        # a single value is returned as string and not as tuple
+        if isinstance(applied_patches, str):
+            return [applied_patches]
+        return list(applied_patches)
+
+    def _apply_patches(self) -> bool:
+        """ Apply all patches which were not applied yet
+
+        The hashes of applied patches are recorded in the dataset
+        configuration.
+
+        Returns:
+            True if new patches were applied, False otherwise.
+        """
+
+        # for readability
+        patches = self._get_patch_files()
+
+        if not patches:
+            self.log.debug("No patches to apply")
+            return False
+
+        applied_patches = self._get_applied_patches()
+
+        self.log.debug("patches %s", patches)
+        newly_applied = False
+        for patch in patches:
+
+            patch_hash = hashlib.sha256(patch.read_bytes()).hexdigest()
+            if patch_hash in applied_patches:
+                self.log.debug("Patch %s already applied", patch)
+                continue
 
             cmd = ["patch", "-p0", "-d", str(self.dataset_path),
                    "-i", str(patch)]
@@ -141,7 +406,28 @@ class SetupDatalad():
             # -d DIR Change the working directory to DIR first.
             # -i PATCHFILE Read patch from PATCHFILE instead of stdin.
 
-            utils.run_cmd(cmd, self.log, error_message="Failed to apply patch")
+            # if the patch can be reverted, it was already applied without
+            # being recorded
+            # -R Assume patches were created with old and new files swapped.
+            # -f Do not ask any questions.
+            if utils.check_cmd(cmd + ["--dry-run", "-R", "-f"]):
+                self.log.info("Patch %s was already applied", patch)
+            else:
+                utils.run_cmd(cmd, self.log,
+                              error_message="Failed to apply patch")
+
+            self.dataset.config.add(APPLIED_PATCHES_OPTION, patch_hash,
+                                    where="dataset", reload=False)
+            applied_patches.append(patch_hash)
+            newly_applied = True
+
+        if newly_applied:
+            self.dataset.config.reload()
+            datalad.save(path=self.dataset_path/".datalad"/"config",
+                         dataset=self.dataset_path,
+                         message="Record applied patches")
+
+        return newly_applied
 
     def _commit_hirni_patches(self):
         """ commit patches to hirni """
@@ -150,7 +436,11 @@ class SetupDatalad():
         if not hirni_path.exists():
             return
 
-        # TODO check if there where changes at all
+        status = utils.run_cmd(["git", "-C", str(hirni_path), "status",
+                                "--porcelain"], self.log)
+        if not status.strip():
+            self.log.debug("No changes in hirni to commit")
+            return
 
         hirni_dataset = datalad.Dataset(hirni_path)
         # commit inside the submodule
@@ -0,0 +1,83 @@
+""" Handling of long-lived singularity container instances """
+
+import os
+from pathlib import Path
+from typing import Union
+
+import data_pipeline.utils as utils
+
+
+class SingularityInstance():
+    """ A singularity container instance which is reused for multiple calls
+
+    Starting a container has a noticeable startup cost. Instead of using
+    `singularity run` for every call, the instance is started once (lazily on
+    the first call) and every following call executes inside of it.
+    """
+
+    def __init__(self, image: Union[str, Path], name: str,
+                 options: list = None):
+        """
+
+        Args:
+            image: The path of the container image.
+            name: The name prefix of the instance. The process id is
+                appended to avoid collisions between multiple sessions.
+            options: Optional; Additional options for `instance start`, e.g.
+                bind mounts.
+        """
+        self.log = utils.get_logger(__class__)  # type: ignore
+
+        self.image = Path(image)
+        self.name = "{}-{}".format(name, os.getpid())
+        self.options = options or []
+
+        self.is_running = False
+
+    def start(self):
+        """ Start the instance if it is not running yet """
+
+        if self.is_running:
+            return
+
+        self.log.info("Start container instance %s", self.name)
+        # singularity instance start [options] <image> <instance name>
+        cmd = (["singularity", "instance", "start"]
+               + self.options
+               + [str(self.image), self.name])
+        utils.run_cmd(cmd, self.log,
+                      error_message="Failed to start container instance")
+
+        self.is_running = True
+
+    def run(self, args: list, **kwargs) -> str:
+        """ Execute the runscript of the container inside the instance
+
+        Args:
+            args: The arguments to pass to the runscript.
+            kwargs: Additional parameters passed through to utils.run_cmd
+        Returns:
+            The output of the command
+        """
+        self.start()
+
+        cmd = ["singularity", "run", "instance://" + self.name] + args
+        return utils.run_cmd(cmd, self.log, **kwargs)
+
+    def stop(self):
+        """ Stop the instance if it is running """
+
+        if not self.is_running:
+            return
+
+        self.log.info("Stop container instance %s", self.name)
+        # do not react on exceptions, the instance might already be gone
+        utils.check_cmd(["singularity", "instance", "stop", self.name])
+
+        self.is_running = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -5,9 +5,10 @@ import json
 import logging
 import os
 from pathlib import Path
+import re
 import shutil
 import subprocess
-from typing import Union
+from typing import Tuple, Union
 import yaml
 
 from datalad.distribution.dataset import require_dataset
@@ -155,6 +156,26 @@ def copy_template(template: Union[str, Path], target: Union[str, Path],
         shutil.copy(template, target)
 
 
+def remove_tree(path: Union[str, Path]):
+    """ Remove a directory tree including write protected content
+
+    git-annex write protects the directories inside its object store, which
+    makes shutil.rmtree fail.
+
+    Args:
+        path: The directory to remove
+    """
+
+    def _make_writable_and_retry(func, failed_path, _):
+        os.chmod(Path(failed_path).parent, 0o700)
+        if os.path.isdir(failed_path) and not os.path.islink(failed_path):
+            os.chmod(failed_path, 0o700)
+        func(failed_path)
+
+    # pylint: disable=deprecated-argument
+    shutil.rmtree(path, onerror=_make_writable_and_retry)
+
+
 class ChangeWorkingDir(contextlib.ContextDecorator):
     """ Change the working directory temporaly """
 
@@ -202,7 +223,8 @@ def get_logger(my_class, postfix: str = None) -> logging.Logger:
 
 def run_cmd(cmd: list, log: logging.Logger, error_message: str = None,
             raise_exception: bool = True, env: dict = None,
-            suppress_output: bool = False) -> str:
+            suppress_output: bool = False,
+            cwd: Union[str, Path] = None) -> str:
     """ Runs a command via subprocess and returns the output
 
     Args:
@@ -215,11 +237,14 @@ def run_cmd(cmd: list, log: logging.Logger, error_message: str = None,
             environment
         suppress_output: Optional; In case the calling application want to
             control the output separately, it can be disabled.
+        cwd: Optional; The directory to run the command in. In contrast to
+            ChangeWorkingDir this does not affect the whole process and thus
+            can be used from multiple threads.
     """
 
     try:
         # pylint: disable=subprocess-run-check
-        proc = subprocess.run(cmd, capture_output=True, env=env)
+        proc = subprocess.run(cmd, capture_output=True, env=env, cwd=cwd)
     except Exception:
         if error_message:
             log.error(error_message)
@@ -264,12 +289,15 @@ def run_cmd_piped(cmds: list,
     if not cmds:
         return ""
 
-    proc = subprocess.Popen(cmds[0], stdout=subprocess.PIPE)
     try:
-        # pylint: disable=subprocess-run-check
-        for cmd in cmds:
-            proc = subprocess.Popen(cmd, stdin=proc.stdout,
+        # pylint: disable=consider-using-with
+        proc = subprocess.Popen(cmds[0], stdout=subprocess.PIPE)
+        for cmd in cmds[1:]:
+            previous = proc
+            proc = subprocess.Popen(cmd, stdin=previous.stdout,
                                     stdout=subprocess.PIPE)
+            # allow previous to receive a SIGPIPE if proc exits
+            previous.stdout.close()
         output, errors = proc.communicate()
     except Exception:
         if error_message:
@@ -285,7 +313,8 @@ def run_cmd_piped(cmds: list,
         if output:
             log.info(output.decode("utf-8"))
 
-        log.debug("cmds: %s", " ".join(cmds))
+        log.debug("cmds: %s", " | ".join(" ".join(map(str, cmd))
+                                          for cmd in cmds))
         if error_message:
             log.error("%s, error was: %s", error_message,
                       errors.decode("utf-8"))
@@ -333,17 +362,116 @@ def show_side_by_side(left: list, right: list) -> str:
         A string where both lists are printed side by side.
     """
 
-    col_width = max(len(line) for line in left) + 2  # padding
+    col_width = max((len(line) for line in left), default=0) + 2  # padding
 
     max_len = max(len(left), len(right))
-    left.extend([""] * (max_len - len(left)))
-    right.extend([""] * (max_len - len(right)))
+    left = left + [""] * (max_len - len(left))
+    right = right + [""] * (max_len - len(right))
+
+    return "".join(
+        left_line.ljust(col_width) + right_line.ljust(col_width) + "\n"
+        for left_line, right_line in zip(left, right)
+    )
 
-    result = ""
-    for row in zip(left, right):
-        result += "".join(word.ljust(col_width) for word in row) + "\n"
 
-    return result
+# the size is part of the key an annexed file links to, e.g.
+# MD5E-s1024--d41d8cd98f00b204e9800998ecf8427e.nii.gz
+ANNEX_KEY_SIZE = re.compile(r"-s(\d+)--")
+
+
+def format_size(size: int) -> str:
+    """ Format a size in bytes to be human readable, e.g. 1.5 MiB """
+
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = "TiB"
+
+    if unit == "B":
+        return "{} B".format(size)
+    return "{:.1f} {}".format(size, unit)
+
+
+def _get_file_size(entry: os.DirEntry) -> int:
+    try:
+        return entry.stat().st_size
+    except OSError:
+        # annexed file without content, take the size from the annex key
+        if entry.is_symlink():
+            match = ANNEX_KEY_SIZE.search(os.readlink(entry.path))
+            if match:
+                return int(match.group(1))
+        return 0
+
+
+def _render_tree_dir(path: str, prefix: str, dirs_only: bool,
+                     lines: list) -> Tuple[int, int]:
+    try:
+        with os.scandir(path) as scanned:
+            # hidden files are skipped as tree does
+            entries = sorted((entry for entry in scanned
+                              if not entry.name.startswith(".")),
+                             key=lambda entry: entry.name)
+    except OSError:
+        return 0, 0
+
+    shown = [entry for entry in entries
+             if not dirs_only or entry.is_dir(follow_symlinks=False)]
+
+    n_files = 0
+    size = 0
+    for entry in entries:
+        is_last = bool(shown) and entry is shown[-1]
+        connector = "└── " if is_last else "├── "
+
+        if entry.is_dir(follow_symlinks=False):
+            # the annotation is only known after the content was rendered
+            index = len(lines)
+            lines.append("")
+            dir_files, dir_size = _render_tree_dir(
+                entry.path, prefix + ("    " if is_last else "│   "),
+                dirs_only, lines
+            )
+            lines[index] = "{}{}{}/ ({} files, {})".format(
+                prefix, connector, entry.name, dir_files,
+                format_size(dir_size)
+            )
+            n_files += dir_files
+            size += dir_size
+        else:
+            file_size = _get_file_size(entry)
+            n_files += 1
+            size += file_size
+            if not dirs_only:
+                lines.append("{}{}{} ({})".format(prefix, connector,
+                                                  entry.name,
+                                                  format_size(file_size)))
+
+    return n_files, size
+
+
+def render_tree(path: Union[str, Path], dirs_only: bool = False) -> list:
+    """ Renders a directory tree similar to the tree command
+
+    Directories are annotated with the number and size of the files they
+    contain, files with their size. Annexed files are shown with the size of
+    their content even if it is not present.
+
+    Args:
+        path: The directory to render
+        dirs_only: Optional; Only show directories (the files are still
+            counted).
+    Returns:
+        The lines of the rendered tree, the first one is the root directory.
+    """
+
+    lines = [str(path)]
+    n_files, size = _render_tree_dir(str(path), "", dirs_only, lines)
+    lines[0] += " ({} files, {})".format(n_files, format_size(size))
+
+    return lines
 
 
 def get_dataset(dataset_path: Union[str, Path], log):
@@ -366,3 +494,33 @@ def get_dataset(dataset_path: Union[str, Path], log):
                          "first.") from excp
 
     return dataset
+
+
+def get_git_path(repo: Union[str, Path], path: Union[str, Path],
+                 log: logging.Logger, common: bool = False) -> Path:
+    """ Resolve a path inside of the git directory of a repository
+
+    In contrast to <repo>/.git/<path> this also works for linked worktrees and
+    submodules where .git is only a file.
+
+    Args:
+        repo: The repository
+        path: The path relative to the git directory, e.g. "objects/pack"
+        log: a logging logger
+        common: Optional; Resolve the path inside of the git directory which
+            is shared by all worktrees of the repository.
+    Returns:
+        The absolute path.
+    """
+
+    if common:
+        git_dir = run_cmd(
+            ["git", "-C", str(repo), "rev-parse", "--git-common-dir"], log
+        ).rstrip()
+        return Path(repo, git_dir, path).resolve()
+
+    git_path = run_cmd(
+        ["git", "-C", str(repo), "rev-parse", "--git-path", str(path)], log
+    ).rstrip()
+
+    return Path(repo, git_path).resolve()
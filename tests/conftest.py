@@ -3,6 +3,7 @@
 from importlib import reload
 from pathlib import Path
 import shutil
+import subprocess
 
 from click.testing import CliRunner
 import pytest
@@ -38,3 +39,40 @@ def project(tmp_path):
     reload(data_pipeline.config_handler)
 
     return tmp_path
+
+
+def _git(repo, *args):
+    return subprocess.run(["git", "-C", str(repo)] + list(args), check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture(name="git")
+def git_fixture():
+    """ Run a git command in a repository and return its output """
+    return _git
+
+
+@pytest.fixture(name="init_repo")
+def init_repo_fixture():
+    """ Create a git repository with a commit containing the given files """
+
+    def _init_repo(path, files):
+        path.mkdir(parents=True, exist_ok=True)
+        _git(path, "init", "-q", "-b", "main")
+        _git(path, "config", "user.name", "test")
+        _git(path, "config", "user.email", "test@example.com")
+        for name, content in files.items():
+            (path / name).write_text(content)
+        _git(path, "add", "-A")
+        _git(path, "commit", "-q", "-m", "Initial commit")
+
+    return _init_repo
+
+
+@pytest.fixture(name="repo")
+def repo_fixture(tmp_path, init_repo):
+    """ A git repository with a single commit on the branch main """
+    repo = tmp_path / "repo"
+    init_repo(repo, {"file.txt": "content"})
+
+    return repo
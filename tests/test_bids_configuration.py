@@ -0,0 +1,104 @@
+""" Test the incremental preview of the bids configuration """
+
+# pylint: disable=missing-function-docstring,protected-access
+
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from data_pipeline.bids_conversion.bids_configuration import (
+    BidsConfiguration
+)
+
+
+@pytest.fixture(name="bids_conf")
+def bids_conf_fixture(tmp_path, init_repo):
+    dataset_path = tmp_path / "bids"
+    init_repo(dataset_path, {"README": "bids"})
+    init_repo(dataset_path / "sourcedata", {
+        "studyspec.json": "{}\n",
+        "rule.py": "# rule\n",
+    })
+    (dataset_path / "sourcedata" / "acq1").mkdir()
+
+    with mock.patch("data_pipeline.utils.get_dataset"), \
+            mock.patch("data_pipeline.bids_conversion.bids_configuration"
+                       ".ConfigHandler") as config_handler, \
+            mock.patch("data_pipeline.bids_conversion.bids_configuration"
+                       ".BidsConversion") as conversion:
+        config_handler.get_instance.return_value.get.return_value = {
+            "config_acqid": "acq1",
+            "config_anon_subject": "001",
+        }
+        conversion.return_value.install_dataset_name = Path("sourcedata")
+        conversion.return_value.install_dataset_path = Path(dataset_path,
+                                                            "sourcedata")
+        yield BidsConfiguration(dataset_path)
+
+
+def test_input_hashes(bids_conf, git):
+    source = bids_conf.dataset_path / "sourcedata"
+    hashes = bids_conf._get_input_hashes()
+    assert hashes["studyspec"]
+    # not registered
+    assert hashes["rule"] == "" and hashes["procedures"] == ""
+
+    (source / ".datalad").mkdir()
+    git(source, "config", "-f", ".datalad/config",
+        "datalad.hirni.dicom2spec.rules", "rule.py")
+    hashes = bids_conf._get_input_hashes()
+    assert hashes["rule"]
+
+    (source / "rule.py").write_text("# changed rule\n")
+    git(source, "commit", "-q", "-am", "Change rule")
+    changed = bids_conf._get_input_hashes()
+    assert changed["rule"] != hashes["rule"]
+    assert changed["studyspec"] == hashes["studyspec"]
+
+
+@pytest.mark.parametrize("changes", [
+    {"inputs": {"rule": "changed"}},
+    {"active_procedures": {"my_proc": {"parameters": ""}}},
+])
+def test_full_rebuild(bids_conf, changes):
+    state = {
+        "anon_subject": "001",
+        "active_procedures": {},
+        "inputs": {"rule": "original"},
+        "studyspec": [],
+    }
+    bids_conf._write_preview_state(state)
+    bids_conf._get_bids_dir().mkdir()
+    assert bids_conf._plan_incremental_preview(dict(state)) == (set(), [])
+
+    assert bids_conf._plan_incremental_preview(dict(state, **changes)) is None
+
+
+def test_restore_on_failure(bids_conf, git):
+    dataset_path = bids_conf.dataset_path
+    anat = dataset_path / "sub-001" / "anat"
+    anat.mkdir(parents=True)
+    (anat / "sub-001_T1w.json").write_text("{}")
+    scans = dataset_path / "sub-001" / "sub-001_scans.tsv"
+    scans.write_text("filename\nanat/sub-001_T1w.json\n")
+
+    spec = [Path("sourcedata", "studyspec.json"),
+            Path("sourcedata", "acq1", "studyspec.json")]
+    state = {"studyspec": [], "active_procedures": {}}
+    bids_conf.conversion.convert.side_effect = RuntimeError("failed")
+
+    with pytest.raises(RuntimeError):
+        bids_conf._convert_changed_series(
+            {"1.1"}, [anat / "sub-001_T1w.json"], state, spec
+        )
+
+    # the source dataset stays clean during and after the conversion
+    preview_spec = bids_conf.conversion.convert.call_args.args[0][1]
+    assert preview_spec == Path("sourcedata", "acq1",
+                                "studyspec_preview.json")
+    assert not (dataset_path / preview_spec).exists()
+    assert git(dataset_path / "sourcedata", "status", "--porcelain") == ""
+
+    assert (anat / "sub-001_T1w.json").read_text() == "{}"
+    assert scans.read_text() == "filename\nanat/sub-001_T1w.json\n"
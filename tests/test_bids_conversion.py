@@ -0,0 +1,410 @@
+""" Test the source and bids dataset handling """
+
+# pylint: disable=missing-function-docstring, protected-access
+
+import logging
+from pathlib import Path
+import shutil
+import subprocess
+from unittest import mock
+
+import pytest
+
+from data_pipeline.bids_conversion import bids_conversion as bids_conversion_m
+from data_pipeline.bids_conversion.bids_conversion import (
+    BidsConversion,
+    SourceHandler
+)
+from data_pipeline.bids_conversion.import_registry import ImportRegistry
+from data_pipeline import utils
+
+
+@pytest.fixture(name="source_handler")
+def source_handler_fixture(tmp_path):
+    dataset_path = tmp_path / "sourcedata"
+    dataset_path.mkdir()
+    subprocess.run(["git", "init", "-q", str(dataset_path)], check=True)
+
+    with mock.patch("data_pipeline.utils.get_dataset"):
+        return SourceHandler(dataset_path)
+
+
+class TestImportDataBulk:
+    """ Collection of tests concerning the parallel import """
+
+    @pytest.fixture(name="acquisitions")
+    def acquisitions_fixture(self, tmp_path, source_handler):
+        acquisitions = []
+        for acqid in ["acq1", "acq2", "acq3"]:
+            tarball = tmp_path / "{}.tar.gz".format(acqid)
+            tarball.write_text(acqid)
+            acquisitions.append(dict(tarball=str(tarball), acqid=acqid,
+                                     anon_subject="sub" + acqid))
+
+        (source_handler.dataset_path / "acq1" / "dicoms").mkdir(parents=True)
+        acquisitions.append(dict(tarball=str(tmp_path / "missing.tar.gz"),
+                                 acqid="acq4", anon_subject="acq4"))
+
+        return acquisitions
+
+    def test_import(self, source_handler, acquisitions):
+        def _import(acq, scratch_dir):
+            if acq["acqid"] == "acq3":
+                raise Exception("Import failed")
+            (scratch_dir / acq["acqid"]).mkdir(parents=True)
+            return "checksum"
+
+        with mock.patch.object(source_handler, "_import_into_clone",
+                               side_effect=_import) as import_into_clone, \
+                mock.patch.object(source_handler,
+                                  "_register_acquisitions") as register:
+            source_handler.import_data_bulk(acquisitions, jobs=2)
+
+        # already imported and missing tarballs are skipped
+        assert sorted(call.args[0]["acqid"]
+                      for call in import_into_clone.call_args_list) == \
+            ["acq2", "acq3"]
+        # failed imports are not registered
+        assert register.call_args.args[0] == ["acq2"]
+        # scratch clones are removed
+        assert not any(source_handler.dataset_path.parent.glob(".*_import"))
+
+        entries = ImportRegistry(source_handler.dataset_path).entries
+        assert sorted(entries) == ["acq1", "acq2"]
+        assert entries["acq2"]["sha256"] == "checksum"
+        assert entries["acq2"]["complete"]
+
+    @pytest.mark.parametrize("failing", ["save", "meta_aggregate"])
+    def test_register_rollback(self, source_handler, tmp_path, failing):
+        scratch_dir = tmp_path / "scratch"
+        for acqid in ["acq1", "acq2"]:
+            (scratch_dir / acqid / acqid / "dicoms").mkdir(parents=True)
+
+        with mock.patch("datalad.api.save"), \
+                mock.patch("datalad.api.meta_aggregate"), \
+                mock.patch("datalad.api.remove") as remove, \
+                mock.patch("datalad.api." + failing,
+                           side_effect=Exception("failed")):
+            with pytest.raises(Exception):
+                source_handler._register_acquisitions(["acq1", "acq2"],
+                                                      scratch_dir)
+
+        assert remove.call_count == 2
+        assert not (source_handler.dataset_path / "acq1").exists()
+        assert not (source_handler.dataset_path / "acq2").exists()
+
+
+class TestReuseDuplicate:
+    """ Collection of tests concerning identical tarballs """
+
+    @pytest.fixture(name="tarball")
+    def tarball_fixture(self, tmp_path, source_handler):
+        tarball = tmp_path / "acq1.tar.gz"
+        tarball.write_text("content")
+
+        registry = ImportRegistry(source_handler.dataset_path)
+        registry.start("acq1", tarball)
+        (source_handler.dataset_path / "acq1" / "dicoms").mkdir(parents=True)
+        registry.complete("acq1")
+
+        duplicate = tmp_path / "acq2.tar.gz"
+        duplicate.write_text("content")
+        return duplicate
+
+    @pytest.fixture(name="datalad_api")
+    def datalad_api_fixture(self):
+        def _clone(source, path, **_):
+            (Path(path) / ".git").mkdir(parents=True)
+
+        run_git = utils.run_cmd
+
+        def _run_cmd(cmd, *args, **kwargs):
+            if "annex" in cmd:
+                return ""
+            return run_git(cmd, *args, **kwargs)
+
+        with mock.patch("datalad.api.clone", side_effect=_clone) as clone, \
+                mock.patch("data_pipeline.utils.run_cmd",
+                           side_effect=_run_cmd) as run_cmd, \
+                mock.patch("datalad.api.save") as save, \
+                mock.patch("datalad.api.meta_aggregate") as meta_aggregate, \
+                mock.patch("data_pipeline.bids_conversion.bids_conversion"
+                           "._drop_content") as drop, \
+                mock.patch("datalad.api.remove"), \
+                mock.patch("datalad.api.hirni_dicom2spec",
+                           create=True) as dicom2spec:
+            yield dict(clone=clone, run_cmd=run_cmd, save=save,
+                       meta_aggregate=meta_aggregate, drop=drop,
+                       dicom2spec=dicom2spec)
+
+    def test_reuse(self, source_handler, tarball, datalad_api):
+        dataset_path = source_handler.dataset_path
+        dicom_path = dataset_path / "acq2" / "dicoms"
+
+        assert source_handler._reuse_duplicate("acq2", tarball, "002")
+
+        # not registered with the url of the original
+        assert "dataset" not in datalad_api["clone"].call_args.kwargs
+        # the tarball is hardlinked instead of depending on the original
+        get = next(call for call in datalad_api["run_cmd"].call_args_list
+                   if "annex" in call.args[0])
+        assert get.args[0] == ["git", "-c", "annex.hardlink=true", "annex",
+                               "get", "--all"]
+        assert get.kwargs["cwd"] == dicom_path
+        assert datalad_api["save"].call_args.kwargs["path"] == str(dicom_path)
+        assert datalad_api["dicom2spec"].call_args.kwargs["acquisition"] == \
+            "acq2"
+        # the extracted files are only needed for the metadata, the tarball
+        # is kept
+        assert datalad_api["drop"].call_args.args[0] == dicom_path
+        assert datalad_api["drop"].call_args.kwargs == {"all_keys": False}
+        assert ImportRegistry(dataset_path).entries["acq2"]["complete"]
+
+    def test_reuse_failed(self, source_handler, tarball, datalad_api):
+        dataset_path = source_handler.dataset_path
+        datalad_api["meta_aggregate"].side_effect = Exception("failed")
+
+        with pytest.raises(Exception):
+            source_handler._reuse_duplicate("acq2", tarball, "002")
+
+        assert not (dataset_path / "acq2").exists()
+        assert not ImportRegistry(dataset_path).entries["acq2"]["complete"]
+
+    def test_no_duplicate(self, source_handler, tarball, datalad_api):
+        tarball.write_text("other")
+
+        assert not source_handler._reuse_duplicate("acq2", tarball, "002")
+        assert not datalad_api["clone"].called
+
+
+@pytest.mark.parametrize("cache_metadata", [False, True])
+def test_populate_metadata_cache(source_handler, cache_metadata):
+    source_handler.cache_metadata = cache_metadata
+
+    with mock.patch("data_pipeline.bids_conversion.bids_conversion"
+                    ".DicomMetadataCache") as cache:
+        source_handler._populate_metadata_cache(["acq1", "acq2"])
+
+    assert cache.return_value.populate.call_count == (2 if cache_metadata
+                                                      else 0)
+
+
+@pytest.mark.parametrize("output, expected", [
+    ("", True),
+    ('{"command":"drop","key":"SHA256E-s1--1.dcm","success":true}\n', True),
+    ('{"command":"drop","key":"SHA256E-s1--1.dcm","success":true}\n'
+     '{"command":"drop","key":"SHA256E-s9--a.tar.gz","success":false}\n',
+     False),
+])
+@pytest.mark.parametrize("all_keys", [True, False])
+def test_drop_content(tmp_path, output, expected, all_keys):
+    dicom_path = tmp_path / "acq1" / "dicoms"
+    dicom_path.mkdir(parents=True)
+    log = logging.getLogger(__name__)
+
+    with mock.patch("data_pipeline.utils.run_cmd",
+                    return_value=output) as run_cmd:
+        assert bids_conversion_m._drop_content(
+            dicom_path, log, all_keys=all_keys
+        ) == expected
+        # nothing to drop
+        assert bids_conversion_m._drop_content(tmp_path / "acq2", log)
+
+    run_cmd.assert_called_once()
+    # also the keys which are not in the working tree, e.g. the tarball
+    assert ("--all" in run_cmd.call_args.args[0]) == all_keys
+    assert run_cmd.call_args.args[0][-1] == "--json"
+
+
+def git_annex(repo, *args):
+    return subprocess.run(["git", "-C", str(repo), "annex"] + list(args),
+                          check=True, capture_output=True, text=True).stdout
+
+
+def has_content(repo, key):
+    return subprocess.run(
+        ["git", "-C", str(repo), "annex", "contentlocation", key],
+        check=False, capture_output=True
+    ).returncode == 0
+
+
+@pytest.mark.skipif(shutil.which("git-annex") is None,
+                    reason="git-annex is not installed")
+@pytest.mark.parametrize("all_keys", [True, False])
+def test_drop_content_frees_tarball(tmp_path, init_repo, git, all_keys):
+    # the tarball is only referenced by the history, like on the incoming
+    # branch of a hirni import
+    origin = tmp_path / "origin"
+    init_repo(origin, {"README": "origin"})
+    git_annex(origin, "init", "-q")
+    (origin / "sourcedata.tar.gz").write_bytes(b"tarball")
+    git_annex(origin, "add", "sourcedata.tar.gz")
+    git(origin, "commit", "-q", "-m", "Add tarball")
+    key = git_annex(origin, "lookupkey", "sourcedata.tar.gz").strip()
+    git(origin, "rm", "-q", "sourcedata.tar.gz")
+    git(origin, "commit", "-q", "-m", "Extract tarball")
+
+    clone = tmp_path / "clone"
+    git(tmp_path, "clone", "-q", str(origin), str(clone))
+    git_annex(clone, "init", "-q")
+    git_annex(clone, "get", "--key", key)
+    assert has_content(clone, key)
+
+    assert bids_conversion_m._drop_content(
+        clone, logging.getLogger(__name__), all_keys=all_keys
+    )
+
+    # the tarball is kept if only the working tree is dropped
+    assert has_content(clone, key) != all_keys
+    # still available in the origin
+    assert has_content(origin, key)
+
+
+@pytest.fixture(name="bids_conversion")
+def bids_conversion_fixture(tmp_path):
+    with mock.patch("data_pipeline.utils.get_dataset"), \
+            mock.patch("data_pipeline.bids_conversion.bids_conversion"
+                       ".ConfigHandler"):
+        return BidsConversion(tmp_path / "bids", "001")
+
+
+@pytest.mark.parametrize("update", [True, False])
+def test_install_source_dataset_once(bids_conversion, update):
+    sourcedata = bids_conversion.install_dataset_path
+    # acq1 is installed, acq2 only registered
+    (sourcedata / "acq1" / "dicoms" / "1.dcm").mkdir(parents=True)
+    (sourcedata / "acq2" / "dicoms").mkdir(parents=True)
+
+    with mock.patch("datalad.api.update") as datalad_update, \
+            mock.patch("datalad.api.get") as datalad_get:
+        bids_conversion.install_source_dataset(
+            "source", acqids=["acq1", "acq2", "acq3"], update=update
+        )
+
+    updated = [call.args[0] for call in datalad_update.call_args_list]
+    if update:
+        assert updated == [bids_conversion.install_dataset_name,
+                           str(sourcedata / "acq1" / "dicoms")]
+    else:
+        assert not updated
+    assert not any(call.kwargs["recursive"]
+                   for call in datalad_update.call_args_list)
+    datalad_get.assert_called_once_with(
+        path=str(sourcedata / "acq2" / "dicoms"), dataset=str(sourcedata),
+        get_data=False
+    )
+
+
+@pytest.mark.parametrize("install_mode,reckless,warned", [
+    ("default", None, False),
+    ("ephemeral", "ephemeral", False),
+    ("ephemeral", None, True),
+    ("default", "ephemeral", True),
+])
+def test_check_install_mode(bids_conversion, init_repo, git, caplog,
+                            install_mode, reckless, warned):
+    sourcedata = bids_conversion.install_dataset_path
+    init_repo(sourcedata, {"README": "source"})
+    if reckless:
+        git(sourcedata, "config", "datalad.clone.reckless", reckless)
+    bids_conversion.install_mode = install_mode
+
+    with caplog.at_level(logging.WARNING):
+        bids_conversion.install_source_dataset("source", update=False)
+
+    assert ("Uninstall it to apply the configured mode" in caplog.text) \
+        == warned
+
+
+@pytest.mark.parametrize("install_mode", ["default", "ephemeral"])
+def test_drop_source_content(bids_conversion, install_mode):
+    bids_conversion.install_mode = install_mode
+    dicom_path = bids_conversion.install_dataset_path / "acq1" / "dicoms"
+    dicom_path.mkdir(parents=True)
+
+    with mock.patch("data_pipeline.bids_conversion.bids_conversion"
+                    "._drop_content", return_value=True) as drop:
+        assert bids_conversion.drop_source_content("acq1")
+
+    # the tarball must stay in a shared annex
+    assert drop.call_args.kwargs["all_keys"] == (install_mode == "default")
+
+
+def test_prefetch(bids_conversion, caplog):
+    dicom_path = bids_conversion.install_dataset_path / "acq1" / "dicoms"
+    dicom_path.mkdir(parents=True)
+    results = [
+        {"type": "file", "status": "ok", "annexkey": "MD5E-s1024--1.dcm"},
+        {"type": "file", "status": "notneeded",
+         "annexkey": "MD5E-s2048--2.dcm"},
+        {"type": "file", "status": "error"},
+        {"type": "dataset", "status": "ok"},
+    ]
+
+    with mock.patch("datalad.api.get", return_value=iter(results)) as get, \
+            caplog.at_level("INFO"):
+        bids_conversion.prefetch("acq1", jobs=8)
+
+    assert get.call_args.kwargs["jobs"] == 8
+    assert "acq1: 2 files, retrieved 1.0 KiB" in caplog.text
+    assert "Could not get 1 files of acq1" in caplog.text
+
+
+def test_convert_batch(bids_conversion):
+    bids_path = bids_conversion.dataset_path
+    (bids_path / "sub-001").mkdir(parents=True)
+    subjects = [dict(anon_subject=anon_subject, acqid="acq" + anon_subject)
+                for anon_subject in ["001", "002", "003", "004"]]
+
+    def spec2bids(cmd, *_args, **_kwargs):
+        # 004 fails in the batch but not on its own
+        for anon_subject in ["002", "004"]:
+            spec = "sourcedata/acq{}/studyspec.json".format(anon_subject)
+            if spec in map(str, cmd) and (anon_subject == "002"
+                                          or len(cmd) == 5):
+                (bids_path / "sub-{}".format(anon_subject)).mkdir()
+        return ""
+
+    with mock.patch("data_pipeline.utils.run_cmd",
+                    side_effect=spec2bids) as run_cmd:
+        converted = bids_conversion.convert_batch(subjects)
+
+    assert converted == ["001", "002", "004"]
+    specs = [[str(arg) for arg in call.args[0][3:]]
+             for call in run_cmd.call_args_list]
+    assert specs == [
+        # already converted subjects are skipped
+        ["sourcedata/studyspec.json", "sourcedata/acq002/studyspec.json",
+         "sourcedata/acq003/studyspec.json",
+         "sourcedata/acq004/studyspec.json"],
+        # fallback for the missing ones
+        ["sourcedata/studyspec.json", "sourcedata/acq003/studyspec.json"],
+        ["sourcedata/studyspec.json", "sourcedata/acq004/studyspec.json"],
+    ]
+
+
+def test_convert_batch_discards_failed(bids_conversion, init_repo):
+    bids_path = bids_conversion.dataset_path
+    init_repo(bids_path, {"README": "bids"})
+    subjects = [dict(anon_subject=anon_subject, acqid="acq" + anon_subject)
+                for anon_subject in ["001", "002"]]
+
+    def spec2bids(spec):
+        specs = [str(path) for path in spec[1:]]
+        for subject in subjects:
+            if "sourcedata/{}/studyspec.json".format(subject["acqid"]) \
+                    in specs:
+                (bids_path / "sub-{}".format(subject["anon_subject"])) \
+                    .mkdir(exist_ok=True)
+        # the batch fails, only 001 is converted on its own
+        if len(specs) > 1 or specs == ["sourcedata/acq002/studyspec.json"]:
+            raise Exception()
+
+    with mock.patch.object(bids_conversion, "_spec2bids",
+                           side_effect=spec2bids) as spec2bids_mock:
+        converted = bids_conversion.convert_batch(subjects)
+
+    assert converted == ["001"]
+    assert spec2bids_mock.call_count == 3
+    # the partial outputs of the failed conversions are removed
+    assert not (bids_path / "sub-002").exists()
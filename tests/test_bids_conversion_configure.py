@@ -49,6 +49,7 @@ def choices_fixture():
         # rule_select
         rule_create="Create new rule",
         rule_import="Import rule",
+        rule_evaluate="Dry-evaluate rule",
 
         # procedure_select
         proc_change="Change active procedures",
@@ -88,7 +89,7 @@ class TestQuestions:
         assert answer["data_path"] == filename
 
     def test_rule_return(self, choices):
-        text = Press.REGISTER_RULE + "3" + KeyInputs.ENTER
+        text = Press.REGISTER_RULE + "4" + KeyInputs.ENTER
         answer, _ = ask_with_patched_input(_ask_questions, text)
         assert answer["step_select"] == choices["register_rule"]
         assert answer["rule_select"] == "Return"
@@ -109,6 +110,12 @@ class TestQuestions:
         assert answer["rule_select"] == choices["rule_import"]
         assert answer["rule_file"] == filename
 
+    def test_rule_evaluate(self, choices):
+        text = Press.REGISTER_RULE + "3" + KeyInputs.ENTER
+        answer, _ = ask_with_patched_input(_ask_questions, text)
+        assert answer["step_select"] == choices["register_rule"]
+        assert answer["rule_select"] == choices["rule_evaluate"]
+
     def test_procedure_return(self, choices):
         text = Press.ADD_PROCEDURE + "4" + KeyInputs.ENTER
         answer, _ = ask_with_patched_input(_ask_questions, text)
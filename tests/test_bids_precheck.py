@@ -0,0 +1,82 @@
+""" Test the native BIDS pre-check """
+
+# pylint: disable=missing-function-docstring
+
+import pytest
+
+from data_pipeline.bids_conversion.bids_precheck import BidsPrecheck
+
+
+@pytest.fixture(name="bids_dir")
+def bids_dir_fixture(tmp_path):
+    (tmp_path / "dataset_description.json").write_text("{}")
+
+    anat = tmp_path / "sub-01" / "anat"
+    anat.mkdir(parents=True)
+    (anat / "sub-01_T1w.nii.gz").write_text("data")
+    (anat / "sub-01_T1w.json").write_text("{}")
+
+    func = tmp_path / "sub-01" / "func"
+    func.mkdir(parents=True)
+    (func / "sub-01_task-rest_run-1_bold.nii.gz").write_text("data")
+
+    # ignored directories
+    (tmp_path / "sourcedata").mkdir()
+    (tmp_path / "sourcedata" / "invalid").write_text("")
+    (tmp_path / ".git").mkdir()
+
+    return tmp_path
+
+
+def codes(issues):
+    return sorted(issue.code for issue in issues)
+
+
+def test_missing_sidecar(bids_dir):
+    issues = BidsPrecheck(bids_dir).run()
+    assert codes(issues) == ["MISSING_SIDECAR"]
+    assert issues[0].path.name == "sub-01_task-rest_run-1_bold.nii.gz"
+
+
+def test_inherited_sidecar(bids_dir):
+    (bids_dir / "task-rest_bold.json").write_text("{}")
+    assert not BidsPrecheck(bids_dir).run()
+
+
+def test_inherited_sidecar_other_task(bids_dir):
+    (bids_dir / "task-other_bold.json").write_text("{}")
+    assert codes(BidsPrecheck(bids_dir).run()) == ["MISSING_SIDECAR"]
+
+
+def test_missing_dataset_description(bids_dir):
+    (bids_dir / "dataset_description.json").unlink()
+    (bids_dir / "task-rest_bold.json").write_text("{}")
+    assert codes(BidsPrecheck(bids_dir).run()) == [
+        "MISSING_DATASET_DESCRIPTION"
+    ]
+
+
+def test_invalid_filenames(bids_dir):
+    (bids_dir / "task-rest_bold.json").write_text("{}")
+    anat = bids_dir / "sub-01" / "anat"
+    (anat / "T1w.nii.gz").write_text("data")
+    (anat / "sub-02_T2w.json").write_text("{}")
+
+    assert codes(BidsPrecheck(bids_dir).run()) == [
+        "INVALID_FILENAME", "SUBJECT_MISMATCH"
+    ]
+
+
+def test_empty_file(bids_dir):
+    (bids_dir / "task-rest_bold.json").write_text("")
+    assert codes(BidsPrecheck(bids_dir).run()) == ["EMPTY_FILE"]
+
+
+def test_only_selected_subject(bids_dir):
+    (bids_dir / "task-rest_bold.json").write_text("{}")
+    other = bids_dir / "sub-02" / "anat"
+    other.mkdir(parents=True)
+    (other / "sub-02_T1w.nii.gz").write_text("data")
+
+    assert codes(BidsPrecheck(bids_dir).run()) == ["MISSING_SIDECAR"]
+    assert not BidsPrecheck(bids_dir).run(anon_subject="01")
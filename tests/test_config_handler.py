@@ -147,6 +147,19 @@ class TestGet:
         module_config = config_handler.get("test_module")
         assert module_config == multi_config["test_module"]
 
+    def test_unchanged_config_is_not_reparsed(self, config_handler,
+                                              write_config, config):
+        config_handler.config_file = write_config(config)
+        config_handler.get()["name"] = "modified by caller"
+
+        with mock.patch.object(utils, "get_config") as get_config:
+            assert config_handler.get() == config
+        assert not get_config.called
+
+        config["price"] = 5
+        write_config(config)
+        assert config_handler.get() == config
+
 
 class TestWrite():
     """ Collection of tests concerning the write method """
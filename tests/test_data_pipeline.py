@@ -77,3 +77,24 @@ def test_run(project):
         assert not result.exception
         assert result.exit_code == 0
         assert mock_run.called
+
+
+def test_maintain(project):
+    """ Test that maintain option works """
+    with mock.patch("data_pipeline.bids_conversion.maintain") as mocked:
+        result = CliRunner().invoke(main, ["--project", project, "--maintain",
+                                           "--full"])
+        assert not result.exception
+        assert result.exit_code == 0
+        mocked.assert_called_once_with(project, full=True)
+
+
+def test_full_requires_maintain(project):
+    """ Test that a full maintenance is not requested by accident """
+    with mock.patch("data_pipeline.bids_conversion.run") as mock_run, \
+            mock.patch("data_pipeline.bids_conversion.maintain") as mocked:
+        result = CliRunner().invoke(main, ["--project", project, "--run",
+                                           "--full"])
+        assert result.exit_code == 2
+        assert not mock_run.called
+        assert not mocked.called
@@ -0,0 +1,70 @@
+""" Test the DICOM metadata cache """
+
+# pylint: disable=missing-function-docstring
+
+from unittest import mock
+
+import pytest
+
+from data_pipeline.bids_conversion.dicom_metadata import DicomMetadataCache
+import data_pipeline.utils as utils
+
+
+@pytest.fixture(name="dataset")
+def dataset_fixture(tmp_path, init_repo):
+    dataset = tmp_path / "source"
+    init_repo(dataset, {"README": "source"})
+    init_repo(dataset / "acq1" / "dicoms", {"1.dcm": "one"})
+    # same content, different acquisition
+    init_repo(dataset / "acq2" / "dicoms", {"1.dcm": "one"})
+    init_repo(dataset / "acq3" / "dicoms", {"1.dcm": "other"})
+
+    return dataset
+
+
+@pytest.fixture(name="meta_dump")
+def meta_dump_fixture():
+    with mock.patch("datalad.api.meta_dump") as meta_dump:
+        meta_dump.side_effect = lambda path, **_: [{
+            "status": "ok",
+            "metadata": {"dicom": {"Series": [{"path": path}]}}
+        }]
+        yield meta_dump
+
+
+def test_cached_by_content(dataset, meta_dump):
+    cache = DicomMetadataCache(dataset)
+    series = cache.get_series("acq1")
+    assert series == [{"path": str(dataset / "acq1" / "dicoms")}]
+
+    # a new instance uses the cache as well
+    assert DicomMetadataCache(dataset).get_series("acq1") == series
+    assert cache.get_series("acq2") == series
+    assert meta_dump.call_count == 1
+
+    assert cache.get_series("acq3") != series
+    assert meta_dump.call_count == 2
+
+
+def test_not_imported(dataset, meta_dump):
+    with pytest.raises(utils.UsageError):
+        DicomMetadataCache(dataset).get_series("not_imported")
+    assert not meta_dump.called
+
+
+def test_populate_without_metadata(dataset, meta_dump):
+    meta_dump.side_effect = lambda **_: [{"status": "ok", "metadata": {}}]
+    cache = DicomMetadataCache(dataset)
+    cache.populate("acq1")
+
+    assert not any(cache.cache_dir.glob("*.json"))
+
+
+@pytest.mark.parametrize("error", [
+    utils.UsageError("not imported"),
+    Exception("rev-parse failed"),
+])
+def test_populate_ignores_errors(dataset, error):
+    cache = DicomMetadataCache(dataset)
+    with mock.patch.object(cache, "get_series", side_effect=error):
+        cache.populate("acq1")
@@ -0,0 +1,164 @@
+""" Test the basic git commands """
+
+# pylint: disable=missing-function-docstring
+
+from unittest import mock
+
+import pytest
+
+import data_pipeline.utils
+from data_pipeline.bids_conversion.source_configuration import (
+    BidsGitHandling
+)
+from data_pipeline.git_handler import GitBase
+
+
+@pytest.fixture(name="repo")
+def repo_fixture(repo, monkeypatch):
+    # GitBase works on the current working directory
+    monkeypatch.chdir(repo)
+    return repo
+
+
+class TestWorktree:
+    """ Collection of tests concerning working tree handling """
+
+    def test_add_and_remove(self, repo, git):
+        git_base = GitBase()
+        worktree = repo.parent / "worktree"
+
+        git_base.create_branch("config", "main")
+        git_base.add_worktree(worktree, "config")
+
+        assert (worktree / "file.txt").exists()
+        assert git(worktree, "branch", "--show-current") == "config"
+        # the main working tree is not touched
+        assert git(repo, "branch", "--show-current") == "main"
+
+        # write protected content like in the git-annex object store
+        protected = worktree / "protected"
+        protected.mkdir()
+        (protected / "file").write_text("content")
+        protected.chmod(0o500)
+
+        git_base.remove_worktree(worktree)
+        assert not worktree.exists()
+        assert str(worktree) not in git(repo, "worktree", "list")
+
+    def test_rebase(self, repo, git, monkeypatch):
+        git_base = GitBase()
+        worktree = repo.parent / "worktree"
+        git_base.create_branch("config", "main")
+        git_base.add_worktree(worktree, "config")
+
+        (repo / "new.txt").write_text("content")
+        git(repo, "add", "new.txt")
+        git(repo, "commit", "-q", "-m", "New commit")
+
+        monkeypatch.chdir(worktree)
+        assert git_base.rebase("main")
+        assert (worktree / "new.txt").exists()
+
+
+class TestBidsGitHandling:
+    """ Collection of tests concerning the config working tree """
+
+    def test_install_only_needed_subdatasets(self, repo):
+        git_repo = BidsGitHandling(repo, acqid="acq1")
+
+        with mock.patch("datalad.api.subdatasets", return_value=[
+                "code/hirni-toolbox", "acq1/dicoms", "acq2/dicoms"
+        ]), mock.patch("datalad.api.clone") as clone, \
+                mock.patch("datalad.api.get"):
+            git_repo.open_config_worktree()
+            # only done once
+            git_repo.open_config_worktree()
+
+        assert git_repo.worktree_path.exists()
+        assert [call.kwargs["path"] for call in clone.call_args_list] == [
+            str(git_repo.worktree_path / "code" / "hirni-toolbox"),
+            str(git_repo.worktree_path / "acq1" / "dicoms"),
+        ]
+        # not registered again, which would commit on the config branch
+        assert not any("dataset" in call.kwargs
+                       for call in clone.call_args_list)
+
+    def test_rebase_conflict(self, repo, git):
+        git_repo = BidsGitHandling(repo, acqid="acq1")
+        git_repo.create_branch(git_repo.config_branch, "main")
+        git_repo.add_worktree(git_repo.worktree_path, git_repo.config_branch)
+
+        worktree = str(git_repo.worktree_path)
+        (git_repo.worktree_path / "file.txt").write_text("config")
+        git(worktree, "commit", "-q", "-am", "Config change")
+        (repo / "file.txt").write_text("main")
+        git(repo, "commit", "-q", "-am", "Main change")
+
+        with pytest.raises(data_pipeline.utils.UsageError):
+            git_repo.open_config_worktree()
+        assert not git_repo.is_rebased
+
+
+class TestStatusSnapshot:
+    """ The snapshot has to give the same answers as the git commands """
+
+    @pytest.fixture(name="changed_repo")
+    def changed_repo_fixture(self, repo, git):
+        (repo / "dir").mkdir()
+        (repo / "dir" / "tracked.txt").write_text("content")
+        (repo / "dir" / "with space.txt").write_text("content")
+        git(repo, "add", "dir")
+        git(repo, "commit", "-q", "-m", "Add dir")
+
+        (repo / "dir" / "with space.txt").write_text("changed")
+        (repo / "untracked.txt").write_text("content")
+        git(repo, "branch", "other")
+
+        return repo
+
+    @pytest.mark.parametrize("path", [
+        "file.txt", "dir", "dir/tracked.txt", "dir/with space.txt",
+        "untracked.txt", "not_existing.txt", "."
+    ])
+    def test_same_answers(self, changed_repo, path):
+        git_base = GitBase()
+        expected = (git_base.is_tracked(path), git_base.was_changed(path))
+
+        with git_base.status_snapshot():
+            assert (git_base.is_tracked(path),
+                    git_base.was_changed(path)) == expected
+            # also absolute paths are supported
+            assert (git_base.is_tracked(changed_repo / path),
+                    git_base.was_changed(changed_repo / path)) == expected
+
+    def test_branches(self, changed_repo):
+        git_base = GitBase()
+
+        with git_base.status_snapshot():
+            # pylint: disable=protected-access
+            assert git_base._get_current_branch() == "main"
+            assert git_base.check_if_branch_exists("other")
+            assert not git_base.check_if_branch_exists("not_existing")
+
+            git_base.create_branch("new")
+            assert git_base.check_if_branch_exists("new")
+
+    def test_single_snapshot(self, changed_repo, monkeypatch):
+        git_base = GitBase()
+        calls = []
+        run_cmd = data_pipeline.utils.run_cmd
+
+        def _counting_run_cmd(cmd, *args, **kwargs):
+            calls.append(cmd)
+            return run_cmd(cmd, *args, **kwargs)
+
+        monkeypatch.setattr(data_pipeline.utils, "run_cmd", _counting_run_cmd)
+        monkeypatch.setattr(data_pipeline.utils, "check_cmd", None)
+
+        with git_base.status_snapshot():
+            for path in ["file.txt", "dir", "untracked.txt"]:
+                git_base.is_tracked(path)
+                git_base.was_changed(path)
+            git_base.check_if_branch_exists("other")
+
+        assert len(calls) == 4
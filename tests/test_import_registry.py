@@ -0,0 +1,135 @@
+""" Test the detection of already imported tarballs """
+
+# pylint: disable=missing-function-docstring
+
+import os
+import subprocess
+from unittest import mock
+
+import pytest
+
+from data_pipeline.bids_conversion import import_registry
+from data_pipeline.bids_conversion.import_registry import ImportRegistry
+
+
+@pytest.fixture(name="dataset")
+def dataset_fixture(tmp_path):
+    dataset = tmp_path / "source"
+    dataset.mkdir()
+    subprocess.run(["git", "init", "-q", str(dataset)], check=True)
+    return dataset
+
+
+@pytest.fixture(name="tarball")
+def tarball_fixture(tmp_path):
+    tarball = tmp_path / "acq1.tar.gz"
+    tarball.write_bytes(b"content")
+    return tarball
+
+
+def do_import(dataset, tarball, acqid="acq1"):
+    registry = ImportRegistry(dataset)
+    registry.start(acqid, tarball)
+    (dataset / acqid / "dicoms").mkdir(parents=True)
+    registry.complete(acqid)
+
+
+def test_new(dataset, tarball):
+    assert ImportRegistry(dataset).get_status("acq1", tarball) == \
+        ImportRegistry.NEW
+
+
+def test_imported_without_hashing(dataset, tarball):
+    do_import(dataset, tarball)
+
+    with mock.patch.object(import_registry, "get_file_hash") as get_hash:
+        assert ImportRegistry(dataset).get_status("acq1", tarball) == \
+            ImportRegistry.IMPORTED
+    assert not get_hash.called
+
+
+def test_touched_but_same_content(dataset, tarball):
+    do_import(dataset, tarball)
+    stat = tarball.stat()
+    os.utime(tarball, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert ImportRegistry(dataset).get_status("acq1", tarball) == \
+        ImportRegistry.IMPORTED
+    # the new modification time was recorded
+    with mock.patch.object(import_registry, "get_file_hash") as get_hash:
+        ImportRegistry(dataset).get_status("acq1", tarball)
+    assert not get_hash.called
+
+
+def test_changed(dataset, tarball):
+    do_import(dataset, tarball)
+    tarball.write_bytes(b"contenT")
+
+    assert ImportRegistry(dataset).get_status("acq1", tarball) == \
+        ImportRegistry.CHANGED
+
+
+def test_incomplete(dataset, tarball):
+    ImportRegistry(dataset).start("acq1", tarball)
+    (dataset / "acq1" / "dicoms").mkdir(parents=True)
+
+    assert ImportRegistry(dataset).get_status("acq1", tarball) == \
+        ImportRegistry.INCOMPLETE
+
+
+def test_register_existing(dataset, tarball):
+    (dataset / "acq1" / "dicoms").mkdir(parents=True)
+
+    assert ImportRegistry(dataset).get_status("acq1", tarball) == \
+        ImportRegistry.IMPORTED
+    assert ImportRegistry(dataset).entries["acq1"]["complete"]
+
+
+def test_forget(dataset, tarball):
+    do_import(dataset, tarball)
+    ImportRegistry(dataset).forget("acq1")
+
+    assert "acq1" not in ImportRegistry(dataset).entries
+
+
+def test_find_duplicate(dataset, tarball, tmp_path):
+    do_import(dataset, tarball)
+    registry = ImportRegistry(dataset)
+
+    copy = tmp_path / "copy.tar.gz"
+    copy.write_bytes(tarball.read_bytes())
+    assert registry.find_duplicate("acq2", copy) == "acq1"
+    # not a duplicate of itself
+    assert registry.find_duplicate("acq1", copy) is None
+
+    other = tmp_path / "other.tar.gz"
+    other.write_bytes(b"other")
+    with mock.patch.object(import_registry, "get_file_hash") as get_hash:
+        assert registry.find_duplicate("acq2", other) is None
+    # different size, no need to compare checksums
+    assert not get_hash.called
+
+
+def test_concurrent_instances(dataset, tarball):
+    first = ImportRegistry(dataset)
+    second = ImportRegistry(dataset)
+    first.start("acq1", tarball)
+    second.start("acq2", tarball)
+    first.complete("acq1")
+
+    assert sorted(ImportRegistry(dataset).entries) == ["acq1", "acq2"]
+
+
+def test_reconversion(dataset, tarball):
+    do_import(dataset, tarball)
+    registry = ImportRegistry(dataset)
+    assert not registry.needs_reconversion("acq1")
+
+    registry.request_reconversion("acq1")
+    # the reimport does not reset the request
+    registry.start("acq1", tarball)
+    registry.complete("acq1")
+    assert ImportRegistry(dataset).needs_reconversion("acq1")
+
+    registry.clear_reconversion("acq1")
+    assert not ImportRegistry(dataset).needs_reconversion("acq1")
@@ -0,0 +1,73 @@
+""" Test the repository maintenance """
+
+# pylint: disable=missing-function-docstring
+
+from unittest import mock
+
+import pytest
+
+from data_pipeline.maintenance import DatasetMaintenance
+
+
+@pytest.fixture(name="repo")
+def repo_fixture(repo, git):
+    for i in range(3):
+        (repo / "file{}.txt".format(i)).write_text(str(i))
+        git(repo, "add", "-A")
+        git(repo, "commit", "-q", "-m", "Commit {}".format(i))
+
+    return repo
+
+
+def count_loose_objects(git, repo):
+    output = git(repo, "count-objects", "-v")
+    return int(output.split("\n")[0].split(": ")[1])
+
+
+@pytest.mark.parametrize("full", [False, True])
+def test_maintenance(repo, git, full):
+    assert count_loose_objects(git, repo) > 0
+
+    DatasetMaintenance(repo).run(full=full)
+
+    assert (repo / ".git" / "objects" / "info" / "commit-graph").exists() or \
+        (repo / ".git" / "objects" / "info" / "commit-graphs").exists()
+    if full:
+        assert count_loose_objects(git, repo) == 0
+
+
+def add_annex_object(repo, key, content):
+    object_dir = repo / ".git" / "annex" / "objects" / "aa" / "bb" / key
+    object_dir.mkdir(parents=True)
+    (object_dir / key).write_bytes(content)
+    object_dir.chmod(0o555)
+    return object_dir / key
+
+
+def test_dedupe_annex_objects(tmp_path, git):
+    repos = []
+    for name in ["acq1", "acq2"]:
+        repo = tmp_path / name
+        repo.mkdir()
+        git(repo, "init", "-q")
+        git(repo, "config", "annex.uuid", name)
+        repos.append(repo)
+
+    key = "SHA256E-s5--1234.dcm"
+    first = add_annex_object(repos[0], key, b"dicom")
+    second = add_annex_object(repos[1], key, b"dicom")
+    # the key does not identify the content
+    worm = [add_annex_object(repo, "WORM-s5--1.dcm", b"dicom")
+            for repo in repos]
+
+    maintenance = DatasetMaintenance(tmp_path)
+    with mock.patch.object(maintenance, "_get_repositories",
+                           return_value=repos):
+        assert maintenance.dedupe_annex_objects() == 5
+        # nothing left to do
+        assert maintenance.dedupe_annex_objects() == 0
+
+    assert first.stat().st_ino == second.stat().st_ino
+    assert second.read_bytes() == b"dicom"
+    assert second.parent.stat().st_mode & 0o777 == 0o555
+    assert worm[0].stat().st_ino != worm[1].stat().st_ino
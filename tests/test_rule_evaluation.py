@@ -0,0 +1,64 @@
+""" Test the in-process rule evaluation """
+
+# pylint: disable=missing-function-docstring
+
+from pathlib import Path
+import shutil
+
+import pytest
+
+import data_pipeline
+from data_pipeline.bids_conversion import rule_evaluation
+
+TEMPLATE_DIR = Path(Path(data_pipeline.__file__).parent, "bids_conversion",
+                    "templates")
+
+
+@pytest.fixture(name="rule_file")
+def rule_file_fixture(tmp_path):
+    shutil.copy(TEMPLATE_DIR / "rules_base.py", tmp_path / "rules_base.py")
+    rule_file = tmp_path / "custom_rules.py"
+    shutil.copy(TEMPLATE_DIR / "custom_rules_template.py", rule_file)
+
+    return rule_file
+
+
+@pytest.fixture(name="series")
+def series_fixture():
+    return [
+        {"SeriesDescription": "t1", "PatientID": "p1",
+         "ProtocolName": "t1_mprage", "ImageType": ["M"]},
+        {"SeriesDescription": "survey", "PatientID": "p1",
+         "ProtocolName": "ExamCard", "ImageType": ["M"]},
+    ]
+
+
+def test_evaluate_template(rule_file, series):
+    rules = rule_evaluation.load_rules(rule_file)
+    entries = rule_evaluation.evaluate_rules(rules, series,
+                                             anon_subject="001")
+
+    assert entries[0]["description"] == {"value": "t1", "approved": False}
+    assert entries[0]["subject"]["value"] == "p1"
+    assert entries[0]["anon-subject"]["value"] == "001"
+    assert "tags" not in entries[0]
+    assert entries[1]["tags"] == [rule_evaluation.IGNORE_TAG]
+
+
+def test_reload_changed_rule(rule_file, series):
+    rule_evaluation.load_rules(rule_file)
+    rule_file.write_text(rule_file.read_text().replace(
+        "'I actually have no clue'", "'changed'"
+    ))
+
+    rules = rule_evaluation.load_rules(rule_file)
+    entries = rule_evaluation.evaluate_rules(rules, series)
+    assert entries[0]["comment"]["value"] == "changed"
+
+
+def test_missing_rule_class(tmp_path):
+    rule_file = tmp_path / "custom_rules.py"
+    rule_file.write_text("RULES = None\n")
+
+    with pytest.raises(ValueError):
+        rule_evaluation.load_rules(rule_file)
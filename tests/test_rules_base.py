@@ -0,0 +1,100 @@
+""" Test the base class of the custom rules """
+
+# pylint: disable=missing-function-docstring, missing-class-docstring
+# pylint: disable=too-few-public-methods
+
+import re
+
+import pytest
+
+from data_pipeline.bids_conversion.templates.rules_base import (
+    RulesBase, SeriesTable
+)
+
+
+@pytest.fixture(name="series")
+def series_fixture():
+    return [
+        {"SeriesDescription": "t1_mprage", "ProtocolName": "t1",
+         "ImageType": ["ORIGINAL", "M"]},
+        {"SeriesDescription": "fmri_bold", "ProtocolName": "bold"},
+        {"ProtocolName": "ExamCard", "ImageType": ["P"]},
+    ]
+
+
+class TestSeriesTable:
+    """ Collection of tests concerning the columnar representation """
+
+    def test_columns(self, series):
+        table = SeriesTable(series)
+
+        assert table.n_series == 3
+        assert set(table) == {"SeriesDescription", "ProtocolName",
+                              "ImageType"}
+        assert table["SeriesDescription"] == ["t1_mprage", "fmri_bold", None]
+        assert table.column("SeriesDescription", "") == ["t1_mprage",
+                                                         "fmri_bold", ""]
+        assert table.column("Missing") == [None, None, None]
+
+    def test_predicates(self, series):
+        table = SeriesTable(series)
+
+        assert table.equals("ProtocolName", "bold") == [False, True, False]
+        assert table.contains("ImageType", "M") == [True, False, False]
+        assert table.matches("SeriesDescription", "BOLD|mprage",
+                             flags=re.IGNORECASE) == [True, True, False]
+
+
+class PerSeriesRules(RulesBase):
+    def _rules(self, series_dict, subject=None, anon_subject=None,
+               session=None):
+        return {"description": series_dict.get("SeriesDescription"),
+                "anon-subject": anon_subject}
+
+
+class BatchRules(PerSeriesRules):
+    def _batch_rules(self, table, subject=None, anon_subject=None,
+                     session=None):
+        return [{"description": description, "anon-subject": anon_subject}
+                for description in table.column("SeriesDescription")]
+
+
+@pytest.mark.parametrize("rules", [PerSeriesRules, BatchRules])
+def test_rules(rules, series):
+    result = rules(series)(anon_subject="001")
+
+    assert result == [
+        ({"description": "t1_mprage", "anon-subject": "001"}, True),
+        ({"description": "fmri_bold", "anon-subject": "001"}, True),
+        ({"description": None, "anon-subject": "001"}, False),
+    ]
+
+
+def test_custom_series_is_valid(series):
+    class Rules(BatchRules):
+        def series_is_valid(self, series_dict):
+            return "ImageType" in series_dict
+
+    result = Rules(series)()
+    assert [is_valid for _, is_valid in result] == [True, False, True]
+
+
+def test_wrong_number_of_results(series):
+    class Rules(PerSeriesRules):
+        def _batch_rules(self, table, subject=None, anon_subject=None,
+                         session=None):
+            return []
+
+    with pytest.raises(ValueError):
+        Rules(series)()
+
+
+def test_no_rules(series):
+    class Rules(RulesBase):
+        def _batch_rules(self, table, subject=None, anon_subject=None,
+                         session=None):
+            return [{} for _ in range(table.n_series)]
+
+    # _rules is required even if _batch_rules is overridden
+    with pytest.raises(TypeError):
+        Rules(series)
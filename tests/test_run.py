@@ -0,0 +1,124 @@
+""" Test the scheduling of the conversion run """
+
+# pylint: disable=missing-function-docstring, protected-access
+
+from unittest import mock
+
+import pytest
+
+from data_pipeline.bids_conversion.run_m import Conversion
+from data_pipeline import utils
+
+
+def test_pause_above_high_water_mark(tmp_path):
+    conv = Conversion(tmp_path, tmp_path, "",
+                      config={"disk_high_water_mark": 90,
+                              "disk_poll_interval": 5,
+                              "import_staging_dir": str(tmp_path / "new")})
+    conv.cleanup_pending = {"001": "acq1"}
+
+    with mock.patch.object(Conversion, "_get_disk_usage",
+                           side_effect=[95, 10, 95, 10, 50, 10]), \
+            mock.patch.object(Conversion, "_cleanup",
+                              return_value=True) as cleanup, \
+            mock.patch("time.sleep") as sleep:
+        conv._wait_for_disk_space()
+
+    # converted subjects are cleaned up before waiting
+    cleanup.assert_called_once_with("001", "acq1")
+    assert not conv.cleanup_pending
+    sleep.assert_called_once_with(5)
+
+
+def test_cleanup_frees_enough(tmp_path):
+    conv = Conversion(tmp_path, tmp_path, "",
+                      config={"disk_high_water_mark": 90})
+    conv.cleanup_pending = {"001": "acq1"}
+
+    with mock.patch.object(Conversion, "_get_disk_usage",
+                           side_effect=[95, 50]), \
+            mock.patch.object(Conversion, "_cleanup",
+                              return_value=False), \
+            mock.patch("time.sleep") as sleep:
+        conv._wait_for_disk_space()
+
+    assert not sleep.called
+    # not everything was dropped
+    assert conv.cleanup_pending == {"001": "acq1"}
+
+
+def test_disk_wait_timeout(tmp_path):
+    conv = Conversion(tmp_path, tmp_path, "",
+                      config={"disk_high_water_mark": 90,
+                              "disk_poll_interval": 5,
+                              "disk_wait_timeout": 12})
+
+    with mock.patch.object(Conversion, "_get_disk_usage", return_value=95), \
+            mock.patch("time.monotonic", side_effect=[0, 0, 5, 10, 15]), \
+            mock.patch("time.sleep") as sleep:
+        with pytest.raises(utils.NotPossible):
+            conv._wait_for_disk_space()
+
+    assert sleep.call_count == 3
+
+
+@pytest.mark.parametrize("needs_import", [False, True])
+def test_wait_only_before_import(tmp_path, needs_import):
+    conv = Conversion(tmp_path, tmp_path, "{acqid}.tar")
+
+    with mock.patch("data_pipeline.bids_conversion.run_m"
+                    ".SourceHandler") as source_handler, \
+            mock.patch.object(Conversion, "_wait_for_disk_space") as wait:
+        source_handler.return_value.needs_import.return_value = needs_import
+        conv._import_data("001", "acq1")
+
+    source_handler.return_value.needs_import.assert_called_once_with(
+        "acq1", "acq1.tar"
+    )
+    assert wait.called == needs_import
+
+
+def test_without_high_water_mark(tmp_path):
+    conv = Conversion(tmp_path, tmp_path, "")
+
+    with mock.patch.object(Conversion, "_get_disk_usage") as get_usage:
+        conv._wait_for_disk_space()
+
+    assert not get_usage.called
+
+
+def test_get_disk_usage_of_missing_dir(tmp_path):
+    assert 0 <= Conversion._get_disk_usage(tmp_path / "a" / "b") <= 100
+
+
+def test_remove_outdated_conversions(tmp_path):
+    conv = Conversion(tmp_path, tmp_path, "")
+    subjects = [dict(anon_subject="001", acqid="acq1"),
+                dict(anon_subject="002", acqid="acq2")]
+
+    with mock.patch("data_pipeline.bids_conversion.run_m"
+                    ".ImportRegistry") as registry, \
+            mock.patch("data_pipeline.bids_conversion.run_m"
+                       ".BidsConversion") as conversion:
+        registry.return_value.needs_reconversion.side_effect = (
+            lambda acqid: acqid == "acq2"
+        )
+        conv._remove_outdated_conversions(subjects)
+
+    conversion.assert_called_once_with(tmp_path, "002")
+    conversion.return_value.remove_conversion.assert_called_once_with()
+    registry.return_value.clear_reconversion.assert_called_once_with("acq2")
+
+
+def test_run_batch_records_failures(tmp_path):
+    conv = Conversion(tmp_path, tmp_path, "")
+    subjects = [dict(anon_subject="001", acqid="acq1"),
+                dict(anon_subject="002", acqid="acq2")]
+
+    with mock.patch.object(conv, "_import_data"), \
+            mock.patch.object(conv, "_remove_outdated_conversions"), \
+            mock.patch.object(conv, "_convert_batch", return_value=["001"]), \
+            mock.patch.object(conv, "_cleanup", return_value=True):
+        conv.run_batch(subjects)
+
+    assert conv.failed == ["002"]
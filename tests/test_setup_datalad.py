@@ -0,0 +1,196 @@
+""" Test the SetupDatalad class """
+
+# pylint: disable=missing-function-docstring
+
+from pathlib import Path
+import subprocess
+from unittest import mock
+
+from datalad.api import Dataset
+import pytest
+
+from data_pipeline.setup_datalad import (
+    PERFORMANCE_CONFIG,
+    SetupDatalad,
+    setup_datasets
+)
+
+
+@pytest.fixture(name="make_setup")
+def make_setup_fixture(tmp_path):
+    def _make_setup(**config):
+        config.setdefault("dataset_name", "dataset")
+        config.setdefault("setup_procedures", [])
+        # only the validation is done via the ConfigHandler
+        with mock.patch("data_pipeline.setup_datalad.ConfigHandler"):
+            return SetupDatalad(tmp_path, config)
+
+    return _make_setup
+
+
+@pytest.mark.parametrize("procedures, expected", [
+    ([], ([], [])),
+    (["cfg_hirni", "cfg_bids"], (["cfg_hirni", "cfg_bids"], [])),
+    (["cfg_hirni", "my_proc", "cfg_bids"], (["cfg_hirni"],
+                                            ["my_proc", "cfg_bids"])),
+    (["my_proc", "cfg_bids"], ([], ["my_proc", "cfg_bids"])),
+])
+def test_split_setup_procedures(make_setup, procedures, expected):
+    setup = make_setup(setup_procedures=procedures)
+    # pylint: disable=protected-access
+    assert setup._split_setup_procedures() == expected
+
+
+def test_setup_datasets_updates_existing(make_setup):
+    existing = make_setup(dataset_name="existing")
+    existing.dataset_path.mkdir()
+    new = make_setup(dataset_name="new")
+
+    with mock.patch.object(SetupDatalad, "run", autospec=True) as run, \
+            mock.patch.object(SetupDatalad, "update", autospec=True) as update:
+        setup_datasets([existing, new])
+
+    run.assert_called_once_with(new)
+    update.assert_called_once_with(existing)
+
+
+def test_template_key(make_setup, tmp_path):
+    patch = tmp_path / "my.patch"
+    patch.write_text("patch content")
+
+    # pylint: disable=protected-access
+    key = make_setup(setup_procedures=["cfg_hirni"],
+                     patches=[str(patch)])._get_template_key()
+
+    # independent of the dataset itself
+    assert key == make_setup(dataset_name="other",
+                             setup_procedures=["cfg_hirni"],
+                             patches=[str(patch)])._get_template_key()
+
+    assert key != make_setup(setup_procedures=["cfg_hirni"],
+                             patches=[str(patch)],
+                             add_gitignore=True)._get_template_key()
+
+    patch.write_text("changed patch content")
+    assert key != make_setup(setup_procedures=["cfg_hirni"],
+                             patches=[str(patch)])._get_template_key()
+
+
+class FakeConfig:
+    """ Minimal stand-in for the datalad ConfigManager """
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, option, default=None, get_all=False):
+        values = self.values.get(option)
+        if not values:
+            return default
+        if len(values) == 1 or not get_all:
+            return values[-1]
+        return tuple(values)
+
+    def add(self, option, value, **_):
+        self.values.setdefault(option, []).append(value)
+
+    def reload(self):
+        pass
+
+
+class TestApplyPatches:
+    """ Collection of tests concerning the patch application """
+
+    @pytest.fixture(name="setup")
+    def setup_fixture(self, make_setup, tmp_path):
+        patches = []
+        for name in ["first", "second"]:
+            patch = tmp_path / "{}.patch".format(name)
+            patch.write_text(
+                "--- {name}.txt\n"
+                "+++ {name}.txt\n"
+                "@@ -1 +1 @@\n"
+                "-original\n"
+                "+patched\n".format(name=name)
+            )
+            patches.append(str(patch))
+
+        setup = make_setup(patches=patches)
+        setup.dataset_path.mkdir()
+        for name in ["first", "second"]:
+            (setup.dataset_path / "{}.txt".format(name)).write_text(
+                "original\n"
+            )
+
+        setup.dataset = mock.Mock()
+        setup.dataset.config = FakeConfig()
+
+        return setup
+
+    # pylint: disable=protected-access
+
+    @mock.patch("datalad.api.save")
+    def test_apply_once(self, save, setup):
+        assert setup._apply_patches()
+        assert (setup.dataset_path / "first.txt").read_text() == "patched\n"
+        assert len(setup._get_applied_patches()) == 2
+        save.assert_called_once()
+
+        save.reset_mock()
+        assert not setup._apply_patches()
+        assert (setup.dataset_path / "first.txt").read_text() == "patched\n"
+        assert not save.called
+
+    @mock.patch("datalad.api.save")
+    def test_already_applied(self, _, setup):
+        (setup.dataset_path / "first.txt").write_text("patched\n")
+
+        assert setup._apply_patches()
+        assert (setup.dataset_path / "first.txt").read_text() == "patched\n"
+        assert (setup.dataset_path / "second.txt").read_text() == "patched\n"
+        assert len(setup._get_applied_patches()) == 2
+
+
+def _git_config(repo, option):
+    return subprocess.run(
+        ["git", "-C", str(repo), "config", "--local", "--get", option],
+        stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout.strip()
+
+
+# newer datalad versions deprecate the "where" argument of config.set
+@pytest.mark.filterwarnings("ignore:'where' is deprecated")
+@pytest.mark.parametrize("performance_tuning", [False, True])
+def test_tune_repository(make_setup, performance_tuning):
+    setup = make_setup(performance_tuning=performance_tuning,
+                       git_config={"core.splitIndex": False,
+                                   "annex.jobs": 2})
+    subprocess.run(["git", "init", "-q", str(setup.dataset_path)],
+                   check=True)
+    setup.dataset = Dataset(str(setup.dataset_path))
+
+    # pylint: disable=protected-access
+    setup._tune_repository()
+
+    for option, value in PERFORMANCE_CONFIG.items():
+        if option in setup.config["git_config"]:
+            continue
+        assert _git_config(setup.dataset_path, option) == (
+            value if performance_tuning else ""
+        )
+    # explicitly configured options take precedence
+    assert _git_config(setup.dataset_path, "core.splitIndex") == "false"
+    assert _git_config(setup.dataset_path, "annex.jobs") == "2"
+
+
+def test_write_commit_graph(make_setup):
+    setup = make_setup(performance_tuning=True)
+    repo = setup.dataset_path
+    subprocess.run(["git", "init", "-q", str(repo)], check=True)
+    subprocess.run(["git", "-C", str(repo), "-c", "user.name=test",
+                    "-c", "user.email=test@example.com", "commit", "-q",
+                    "--allow-empty", "-m", "Initial commit"], check=True)
+
+    # pylint: disable=protected-access
+    setup._write_commit_graph()
+
+    assert Path(repo, ".git", "objects", "info", "commit-graph").exists()
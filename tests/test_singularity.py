@@ -0,0 +1,33 @@
+""" Test the SingularityInstance class """
+
+# pylint: disable=missing-function-docstring
+
+from unittest import mock
+
+from data_pipeline.singularity import SingularityInstance
+
+
+@mock.patch("data_pipeline.utils.check_cmd")
+@mock.patch("data_pipeline.utils.run_cmd")
+def test_instance_started_once(run_cmd, check_cmd):
+    with SingularityInstance("image.simg", "test",
+                             options=["--bind", "a:/data"]) as instance:
+        instance.run(["/data"])
+        instance.run(["/data"])
+
+    commands = [call.args[0] for call in run_cmd.call_args_list]
+    assert commands == [
+        ["singularity", "instance", "start", "--bind", "a:/data",
+         "image.simg", instance.name],
+        ["singularity", "run", "instance://" + instance.name, "/data"],
+        ["singularity", "run", "instance://" + instance.name, "/data"],
+    ]
+    check_cmd.assert_called_once_with(
+        ["singularity", "instance", "stop", instance.name]
+    )
+
+
+@mock.patch("data_pipeline.utils.check_cmd")
+def test_stop_without_start(check_cmd):
+    SingularityInstance("image.simg", "test").stop()
+    assert not check_cmd.called
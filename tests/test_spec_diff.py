@@ -0,0 +1,87 @@
+""" Test the studyspec comparison for the incremental preview """
+
+# pylint: disable=missing-function-docstring
+
+import copy
+
+import pytest
+
+from data_pipeline.bids_conversion import spec_diff
+
+
+def series(uid, modality, **values):
+    entry = {
+        "type": "dicomseries",
+        "location": "dicoms",
+        "uid": uid,
+        "tags": [],
+        "bids-modality": {"approved": False, "value": modality},
+    }
+    for key, value in values.items():
+        entry["bids-" + key] = {"approved": False, "value": value}
+    return entry
+
+
+@pytest.fixture(name="spec")
+def spec_fixture():
+    return [
+        {"type": "dicomseries:all", "location": "dicoms"},
+        series("1.1", "T1w"),
+        series("1.2", "bold", task="rest", run="1"),
+        series("1.3", "bold", task="rest", run="2"),
+    ]
+
+
+def test_unchanged(spec):
+    assert spec_diff.diff_studyspec(spec, copy.deepcopy(spec)) == set()
+
+
+def test_changed_series(spec):
+    new_spec = copy.deepcopy(spec)
+    new_spec[2]["bids-task"]["value"] = "nback"
+    new_spec.append(series("1.4", "dwi"))
+    del new_spec[1]
+
+    assert spec_diff.diff_studyspec(spec, new_spec) == {"1.1", "1.2", "1.4"}
+
+
+def test_other_entry_changed(spec):
+    new_spec = copy.deepcopy(spec)
+    new_spec[0]["location"] = "other"
+
+    assert spec_diff.diff_studyspec(spec, new_spec) is None
+
+
+@pytest.mark.parametrize("entry, expected", [
+    (series("1", "T1w"), "sub-01/anat/sub-01_T1w"),
+    (series("1", "t1", session="a", run="2"),
+     "sub-01/ses-a/anat/sub-01_ses-a_run-2_T1w"),
+    (series("1", "bold", run="1", task="rest"),
+     "sub-01/func/sub-01_task-rest_run-1_bold"),
+    (series("1", "bold", task="rest", run="1", reconstruction_algorithm="moco",
+            acquisition="mb"),
+     "sub-01/func/sub-01_task-rest_acq-mb_rec-moco_run-1_bold"),
+    (series("1", "T1w", run="1", reconstruction_algorithm="norm",
+            contrast_enhancement="gad", acquisition="mp"),
+     "sub-01/anat/sub-01_acq-mp_ce-gad_rec-norm_run-1_T1w"),
+    (series("1", "swi", reconstruction_algorithm="mip", part="mag"),
+     "sub-01/swi/sub-01_rec-mip_part-mag_GRE"),
+    (series("1", "dwi", acquisition="hi"), "sub-01/dwi/sub-01_acq-hi_dwi"),
+    (series("1", "phasediff", direction="AP"),
+     "sub-01/fmap/sub-01_dir-AP_phasediff"),
+    (series("1", "unknown"), None),
+    (series("1", ""), None),
+    (dict(series("1", "T1w"), tags=[spec_diff.IGNORE_TAG]), None),
+])
+def test_get_bids_stem(entry, expected):
+    assert spec_diff.get_bids_stem(entry, "01") == expected
+
+
+def test_mark_unchanged(spec):
+    marked = spec_diff.mark_unchanged(spec, {"1.2"})
+
+    tags = [entry.get("tags") for entry in marked]
+    assert tags == [None, [spec_diff.IGNORE_TAG], [],
+                    [spec_diff.IGNORE_TAG]]
+    # the original is not modified
+    assert spec[1]["tags"] == []
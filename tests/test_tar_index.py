@@ -0,0 +1,150 @@
+""" Test the selective import of DICOM series """
+
+# pylint: disable=missing-function-docstring
+
+import io
+import logging
+from pathlib import Path
+import shutil
+import subprocess
+import tarfile
+from unittest import mock
+
+import pytest
+
+import data_pipeline
+from data_pipeline.bids_conversion import tar_index
+
+pydicom = pytest.importorskip("pydicom")
+
+TEMPLATE_DIR = Path(Path(data_pipeline.__file__).parent, "bids_conversion",
+                    "templates")
+
+
+def create_dicom(series_uid, protocol):
+    meta = pydicom.dataset.FileMetaDataset()
+    meta.MediaStorageSOPClassUID = pydicom.uid.MRImageStorage
+    meta.MediaStorageSOPInstanceUID = pydicom.uid.generate_uid()
+    meta.TransferSyntaxUID = pydicom.uid.ExplicitVRLittleEndian
+
+    dataset = pydicom.dataset.FileDataset(None, {}, file_meta=meta,
+                                          preamble=b"\0" * 128)
+    dataset.SeriesInstanceUID = series_uid
+    dataset.ProtocolName = protocol
+    dataset.SeriesDescription = protocol
+    dataset.PatientID = "p1"
+    dataset.ImageType = ["ORIGINAL", "PRIMARY"]
+
+    buffer = io.BytesIO()
+    dataset.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+def add_member(tar, name, content):
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    tar.addfile(info, io.BytesIO(content))
+
+
+@pytest.fixture(name="tarball")
+def tarball_fixture(tmp_path):
+    tarball = tmp_path / "sourcedata.tar.gz"
+    with tarfile.open(tarball, "w:gz") as tar:
+        add_member(tar, "study/t1/1.dcm", create_dicom("1.1", "t1_mprage"))
+        add_member(tar, "study/t1/2.dcm", create_dicom("1.1", "t1_mprage"))
+        add_member(tar, "study/exam/1.dcm", create_dicom("1.2", "ExamCard"))
+        add_member(tar, "study/README", b"not a dicom")
+    return tarball
+
+
+@pytest.fixture(name="dataset")
+def dataset_fixture(tmp_path):
+    dataset = tmp_path / "source"
+    dataset.mkdir()
+    subprocess.run(["git", "init", "-q", str(dataset)], check=True)
+    return dataset
+
+
+@pytest.fixture(name="rule_file")
+def rule_file_fixture(tmp_path):
+    shutil.copy(TEMPLATE_DIR / "rules_base.py", tmp_path / "rules_base.py")
+    rule_file = tmp_path / "custom_rules.py"
+    shutil.copy(TEMPLATE_DIR / "custom_rules_template.py", rule_file)
+
+    return rule_file
+
+
+def get_names(tarball):
+    with tarfile.open(tarball) as tar:
+        return sorted(tar.getnames())
+
+
+def test_build_index(tarball):
+    index = tar_index.build_index(tarball)
+
+    assert index["other"] == ["study/README"]
+    assert index["series"]["1.1"]["members"] == ["study/t1/1.dcm",
+                                                 "study/t1/2.dcm"]
+    assert index["series"]["1.2"]["metadata"]["ProtocolName"] == "ExamCard"
+    assert index["series"]["1.2"]["metadata"]["ImageType"] == \
+        ["ORIGINAL", "PRIMARY"]
+
+
+def test_select_series(tarball, dataset, rule_file):
+    log = logging.getLogger(__name__)
+    with tar_index.select_series(tarball, "checksum", rule_file, dataset,
+                                 log) as selected:
+        assert get_names(selected) == ["study/README", "study/t1/1.dcm",
+                                       "study/t1/2.dcm"]
+        assert selected.name == "sourcedata.tar.gz"
+    assert not selected.exists()
+
+    # the index is only built once
+    tarball.unlink()
+    assert "1.1" in tar_index.get_index(tarball, "checksum", dataset,
+                                        log)["series"]
+
+
+def test_select_all_series(tarball, dataset, rule_file):
+    rule_file.write_text(rule_file.read_text().replace(
+        "class MyDICOM2SpecRules(RulesBase):",
+        "class MyDICOM2SpecRules(RulesBase):\n\n"
+        "    def series_is_valid(self, series_dict):\n"
+        "        return True\n"
+    ))
+
+    with tar_index.select_series(tarball, "checksum", rule_file, dataset,
+                                 logging.getLogger(__name__)) as selected:
+        assert selected == tarball
+
+
+def test_select_with_broken_rule(tarball, dataset, tmp_path):
+    rule_file = tmp_path / "broken.py"
+    rule_file.write_text("raise Exception()")
+
+    with tar_index.select_series(tarball, "checksum", rule_file, dataset,
+                                 logging.getLogger(__name__)) as selected:
+        assert selected == tarball
+
+
+@pytest.mark.parametrize("compressor", ["installed", None])
+def test_write_filtered_tar_compressed(tmp_path, compressor):
+    tarball = tmp_path / "sourcedata.tar"
+    names = ["study/{}.dcm".format(i) for i in range(10)]
+    with tarfile.open(tarball, "w") as tar:
+        for name in names:
+            add_member(tar, name, create_dicom("1.1", "t1_mprage"))
+    target = tmp_path / "filtered.tar.gz"
+
+    if compressor is None:
+        with mock.patch.object(tar_index, "get_compressor",
+                               return_value=None):
+            tar_index.write_filtered_tar(tarball, set(names), target)
+    else:
+        if tar_index.get_compressor() is None:
+            pytest.skip("Neither pigz nor gzip is installed")
+        tar_index.write_filtered_tar(tarball, set(names), target)
+
+    assert get_names(target) == names
+    # hirni stores the filtered tarball in the annex
+    assert target.stat().st_size < tarball.stat().st_size / 2
@@ -0,0 +1,89 @@
+""" Test the preparation of incoming tarballs """
+
+# pylint: disable=missing-function-docstring
+
+import gzip
+import io
+import logging
+import shutil
+import subprocess
+import tarfile
+from unittest import mock
+
+import pytest
+
+from data_pipeline.bids_conversion import tarball as tarball_m
+import data_pipeline.utils as utils
+
+
+def create_tar(path):
+    content = b"dicom"
+    with tarfile.open(path, "w") as tar:
+        info = tarfile.TarInfo("1.dcm")
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+    return path
+
+
+@pytest.fixture(name="tar")
+def tar_fixture(tmp_path):
+    return create_tar(tmp_path / "sourcedata.tar")
+
+
+def compress(tar, compression):
+    if compression is None:
+        return tar
+    if compression == "gzip":
+        path = tar.with_name(tar.name + ".gz")
+        path.write_bytes(gzip.compress(tar.read_bytes()))
+        return path
+
+    cmd, suffix = {"bzip2": ("bzip2", ".bz2"), "xz": ("xz", ".xz"),
+                   "zstd": ("zstd", ".zst")}[compression]
+    if not shutil.which(cmd):
+        pytest.skip("{} is not installed".format(cmd))
+    subprocess.run([cmd, "-q", "-k", str(tar)], check=True)
+    return tar.with_name(tar.name + suffix)
+
+
+@pytest.mark.parametrize("compression",
+                         [None, "gzip", "bzip2", "xz", "zstd"])
+def test_detect_compression(tar, compression):
+    assert tarball_m.detect_compression(compress(tar, compression)) == \
+        compression
+
+
+def test_stage_zstd(tmp_path, tar):
+    path = compress(tar, "zstd")
+    staging_dir = tmp_path / "staging"
+
+    log = logging.getLogger(__name__)
+    with tarball_m.stage_tarball(path, log, staging_dir) as staged:
+        assert staged.parent.parent == staging_dir
+        assert staged.name == "sourcedata.tar.gz"
+        # hirni stores it, thus it is compressed again
+        assert gzip.decompress(staged.read_bytes()) == tar.read_bytes()
+
+    assert not any(staging_dir.iterdir())
+
+
+@pytest.mark.parametrize("compression", [None, "gzip", "bzip2", "xz"])
+def test_stage_readable_by_hirni(tmp_path, tar, compression):
+    path = compress(tar, compression)
+    staging_dir = tmp_path / "staging"
+
+    log = logging.getLogger(__name__)
+    with tarball_m.stage_tarball(path, log, staging_dir) as staged:
+        # not stored decompressed in the annex
+        assert staged == path
+    assert not staging_dir.exists()
+
+
+def test_stage_without_decoder(tar):
+    path = compress(tar, "zstd")
+
+    log = logging.getLogger(__name__)
+    with mock.patch("shutil.which", return_value=None):
+        with pytest.raises(utils.NotPossible):
+            with tarball_m.stage_tarball(path, log):
+                pass
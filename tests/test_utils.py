@@ -0,0 +1,91 @@
+""" Test the general utilities """
+
+# pylint: disable=missing-function-docstring
+
+import logging
+import os
+
+import pytest
+
+import data_pipeline.utils as utils
+
+
+def test_run_cmd_piped():
+    output = utils.run_cmd_piped(
+        [["printf", "a\\nb\\nc\\n"], ["grep", "-v", "b"], ["wc", "-l"]],
+        logging.getLogger()
+    )
+    assert output.strip() == "2"
+
+
+def test_run_cmd_piped_runs_commands_once(tmp_path):
+    counter = tmp_path / "counter"
+    utils.run_cmd_piped(
+        [["sh", "-c", "echo run >> {}".format(counter)], ["cat"]],
+        logging.getLogger()
+    )
+    assert counter.read_text() == "run\n"
+
+
+def test_show_side_by_side():
+    left = ["left", "l"]
+    right = ["right"]
+
+    assert utils.show_side_by_side(left, right) == (
+        "left  right \n"
+        "l           \n"
+    )
+    # the arguments are not modified
+    assert right == ["right"]
+
+
+@pytest.mark.parametrize("size, expected", [
+    (0, "0 B"),
+    (1023, "1023 B"),
+    (1536, "1.5 KiB"),
+    (5 * 1024 ** 3, "5.0 GiB"),
+    (2 * 1024 ** 4, "2.0 TiB"),
+])
+def test_format_size(size, expected):
+    assert utils.format_size(size) == expected
+
+
+@pytest.fixture(name="tree")
+def tree_fixture(tmp_path):
+    root = tmp_path / "sub-01"
+    (root / "anat").mkdir(parents=True)
+    (root / "func").mkdir()
+    (root / ".hidden").mkdir()
+    (root / "anat" / "sub-01_T1w.json").write_text("x" * 10)
+    (root / "sub-01_scans.tsv").write_text("x" * 5)
+    # annexed file without content
+    os.symlink(
+        "../.git/annex/objects/MD5E-s2048--0123456789abcdef.nii.gz",
+        root / "anat" / "sub-01_T1w.nii.gz"
+    )
+    return root
+
+
+def test_render_tree(tree):
+    assert utils.render_tree(tree) == [
+        "{} (3 files, 2.0 KiB)".format(tree),
+        "├── anat/ (2 files, 2.0 KiB)",
+        "│   ├── sub-01_T1w.json (10 B)",
+        "│   └── sub-01_T1w.nii.gz (2.0 KiB)",
+        "├── func/ (0 files, 0 B)",
+        "└── sub-01_scans.tsv (5 B)",
+    ]
+
+
+def test_render_tree_dirs_only(tree):
+    assert utils.render_tree(tree, dirs_only=True) == [
+        "{} (3 files, 2.0 KiB)".format(tree),
+        "├── anat/ (2 files, 2.0 KiB)",
+        "└── func/ (0 files, 0 B)",
+    ]
+
+
+def test_render_missing_tree(tmp_path):
+    assert utils.render_tree(tmp_path / "missing") == [
+        "{} (0 files, 0 B)".format(tmp_path / "missing")
+    ]